@@ -17,12 +17,22 @@ from twisted.python.util import sibpath
 sys.path.insert(0, dirname(__file__))
 del sys, dirname
 from flocker_bb import privateData
+from flocker_bb.autoscale import Autoscaler
 from flocker_bb.boxes import FlockerWebStatus as WebStatus
 from flocker_bb.builders import flocker, maint, flocker_acceptance
+from flocker_bb.coalesce import SupersededRequests
 from flocker_bb.ec2 import rackspace_slave, ec2_slave
 from flocker_bb.github import createGithubStatus
+from flocker_bb.idle_timeout import (
+    AdaptiveIdleTimeout, IdleTimeoutConfiguration)
+from flocker_bb.locks import LockFeedback
 from flocker_bb.monitoring import Monitor
-from flocker_bb.password import generate_password
+from flocker_bb.password import derive_password, load_secret
+from flocker_bb.pending import PendingRequestPoller
+from flocker_bb.priority import request_priority
+from flocker_bb.reaper import OrphanReaper
+from flocker_bb.steps import WorkspaceLocalityRecorder
+from flocker_bb.warm_pool import WarmPool, WarmPoolConfiguration
 from flocker_bb.zulip import createZulip
 from flocker_bb.zulip_status import createZulipStatus
 
@@ -66,14 +76,18 @@ cloudInit = FilePath(__file__).sibling("slave").child(
 
 c['slaves'] = []
 SLAVENAMES = {}
+# On-demand slave passwords are derived from a secret kept in the buildmaster
+# directory, so that nodes left running across a restart can reconnect.
+# ``basedir`` is supplied by buildbot when it loads this file.
+PASSWORD_SECRET = load_secret(
+    FilePath(basedir).child('slave-password-secret'))  # noqa
+WARM_POOLS = {}
+IDLE_TIMEOUTS = {}
 
 
-def get_cloud_init(name, base, password, provider, privateData, slavePortnum):
+def get_cloud_init(base, provider, privateData, slavePortnum):
     """
-    :param bytes name: The name of the buildslave.
     :param bytes base: The name of image used for the buildslave.
-    :param bytes password: The password that the buildslave will use to
-       authenticate with the buildmaster.
     :param bytes provider: The cloud ``provider`` hosting the buildslave. This
         is added to an environment variable, so that cloud ``provider``
         specific tests know which cloud authentication plugin to load and which
@@ -83,13 +97,12 @@ def get_cloud_init(name, base, password, provider, privateData, slavePortnum):
     :parma int slavePortnum: The TCP port number on the buildmaster to which
         the buildslave will connect.
     :returns: The ``bytes`` of a ``cloud-init.sh`` script which can be supplied
-       as ``userdata`` when creating an on-demand buildslave.
+       as ``userdata`` when creating the on-demand buildslaves of a slave
+       class, once their names and passwords are added.
     """
     return cloudInit % {
         "github_token": privateData['github']['token'],
-        "name": name,
         "base": base,
-        "password": password,
         "FLOCKER_FUNCTIONAL_TEST_CLOUD_PROVIDER": provider,
         'buildmaster_host': privateData['buildmaster']['host'],
         'buildmaster_port': slavePortnum,
@@ -99,10 +112,16 @@ def get_cloud_init(name, base, password, provider, privateData, slavePortnum):
 
 
 for base, slaveConfig in privateData['slaves'].items():
+    if 'warm_pool' in slaveConfig:
+        WARM_POOLS[base] = WarmPoolConfiguration.from_config(
+            slaveConfig['warm_pool'])
+    if 'idle_timeout' in slaveConfig:
+        IDLE_TIMEOUTS[base] = IdleTimeoutConfiguration.from_config(
+            slaveConfig['idle_timeout'])
     if "openstack-image" in slaveConfig:
         # Give this multi-slave support like the EC2 implementation below.
         # FLOC-1907
-        password = generate_password(32)
+        password = derive_password(PASSWORD_SECRET, base)
 
         SLAVENAMES[base] = []
         SLAVENAMES[base].append(base)
@@ -115,7 +134,7 @@ for base, slaveConfig in privateData['slaves'].items():
             config=slaveConfig,
             credentials=privateData['rackspace'],
             user_data=get_cloud_init(
-                base, base, password,
+                base,
                 provider="openstack",
                 privateData=privateData,
                 slavePortnum=c['slavePortnum'],
@@ -129,9 +148,16 @@ for base, slaveConfig in privateData['slaves'].items():
     elif 'ami' in slaveConfig:
         if base not in SLAVENAMES:
             SLAVENAMES[base] = []
+        # Shared by the slaves, so their nodes can be launched together.
+        user_data = get_cloud_init(
+            base,
+            provider="aws",
+            privateData=privateData,
+            slavePortnum=c['slavePortnum'],
+        )
         for index in range(slaveConfig['slaves']):
             name = '%s/%d' % (base, index)
-            password = generate_password(32)
+            password = derive_password(PASSWORD_SECRET, name)
 
             SLAVENAMES[base].append(name)
             slave = ec2_slave(
@@ -139,12 +165,7 @@ for base, slaveConfig in privateData['slaves'].items():
                 password=password,
                 config=slaveConfig,
                 credentials=privateData['aws'],
-                user_data=get_cloud_init(
-                    name, base, password,
-                    provider="aws",
-                    privateData=privateData,
-                    slavePortnum=c['slavePortnum'],
-                ),
+                user_data=user_data,
                 region='us-west-2',
                 keypair_name='hybrid-master',
                 security_name='ssh',
@@ -200,6 +221,10 @@ addBuilderModule(flocker)
 addBuilderModule(flocker_acceptance)
 addBuilderModule(maint)
 
+# Start builds on the builder with the most important pending request first,
+# so it gets shared locks (such as ``aws_lock``) before less important ones.
+c['prioritizeBuilders'] = request_priority.prioritizeBuilders
+
 
 # 'status' is a list of Status Targets. The results of each build will be
 # pushed to these targets. buildbot/status/*.py has a variety to choose from,
@@ -209,14 +234,32 @@ failing_builders = frozenset(privateData.get('failing_builders', ()))
 
 c['status'] = []
 
+superseded = SupersededRequests(
+    cancel_running=privateData.get('cancel_superseded_builds', False))
+c['status'].append(superseded)
+
 if privateData['github']['report_status']:
-    c['status'].append(createGithubStatus(
+    github_status = createGithubStatus(
         'flocker', token=privateData['github']['token'],
         failing_builders=failing_builders,
-        ))
+        )
+    superseded.subscribe(github_status.requestSuperseded)
+    c['status'].append(github_status)
+
+
+poller = PendingRequestPoller()
+c['status'].append(poller)
+c['status'].append(Monitor(poller))
+c['status'].append(Autoscaler(poller))
+c['status'].append(OrphanReaper())
+c['status'].append(LockFeedback())
+c['status'].append(WorkspaceLocalityRecorder())
 
+if WARM_POOLS:
+    c['status'].append(WarmPool(WARM_POOLS))
 
-c['status'].append(Monitor())
+if IDLE_TIMEOUTS:
+    c['status'].append(AdaptiveIdleTimeout(poller, IDLE_TIMEOUTS))
 
 
 authz_cfg = authz.Authz(
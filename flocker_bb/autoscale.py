@@ -0,0 +1,177 @@
+"""
+Start just enough on-demand buildslaves for the pending build requests.
+"""
+
+from __future__ import absolute_import
+
+from collections import Counter as counter
+
+from twisted.python import log
+
+from buildbot.status.base import StatusReceiverMultiService
+
+from prometheus_client import Counter, Gauge
+
+from flocker_bb.ec2 import State
+
+# The states in which an instance is running, or will be without being asked
+# to start.
+_RUNNING_STATES = frozenset([
+    State.STARTING, State.ACTIVE, State.STOP_CANCELLED])
+
+
+class _Slots(object):
+    """
+    The builds a buildslave could take on.
+
+    :ivar slave: The ``OnDemandBuildSlave``.
+    :ivar builders: The names of the builders the slave is allocated to.
+    :ivar busy: The names of the builders the slave is, or will be, running a
+        build for.  A slave only runs one build per builder at a time.
+    :ivar free: The number of further builds the slave can run at once.
+    """
+    def __init__(self, slave, builders):
+        self.slave = slave
+        self.builders = frozenset(builders)
+        self.busy = set(slave.building)
+        if slave.max_builds:
+            self.free = slave.max_builds - len(self.busy)
+        else:
+            self.free = len(self.builders)
+
+    def can_take(self, builder):
+        return (self.free > 0 and builder in self.builders
+                and builder not in self.busy)
+
+    def take(self, builder):
+        self.free -= 1
+        self.busy.add(builder)
+
+
+def plan(pending, running, stopped):
+    """
+    Decide which stopped buildslaves to start.
+
+    Pending requests are first assigned to running slaves with spare capacity.
+    Then, while requests remain, the stopped slave which can take the most of
+    them is started.
+
+    :param dict pending: Map builder names to the number of pending requests.
+    :param list running: ``_Slots`` for slaves whose instances are running.
+    :param list stopped: ``_Slots`` for slaves whose instances are stopped.
+    :return: A ``tuple`` of the ``list`` of slaves to start, and a ``dict``
+        mapping builder names to the number of requests that no slave can take.
+    """
+    remaining = counter(pending)
+
+    def assign(slots):
+        taken = 0
+        for builder in sorted(remaining, key=lambda b: -remaining[b]):
+            if remaining[builder] > 0 and slots.can_take(builder):
+                slots.take(builder)
+                remaining[builder] -= 1
+                taken += 1
+        return taken
+
+    for slots in running:
+        while assign(slots):
+            pass
+
+    to_start = []
+    stopped = list(stopped)
+    while stopped and any(count > 0 for count in remaining.values()):
+        def coverage(slots):
+            return min(slots.free, sum(
+                1 for builder, count in remaining.items()
+                if count > 0 and slots.can_take(builder)))
+        best = max(stopped, key=coverage)
+        if coverage(best) == 0:
+            break
+        stopped.remove(best)
+        while assign(best):
+            pass
+        to_start.append(best.slave)
+
+    return to_start, {
+        builder: count for builder, count in remaining.items() if count > 0}
+
+
+class Autoscaler(StatusReceiverMultiService):
+    """
+    Start the on-demand buildslaves needed for the pending build requests.
+
+    Rather than every slave allocated to a builder with a pending request
+    starting, the requests are shared out between the slaves already running,
+    and only as many further slaves as are needed to take the rest are
+    started.  Slaves are stopped by their own build wait timeout once idle.
+    """
+
+    starts = Counter(
+        'autoscaler_starts_total',
+        'Number of on-demand slaves started by the autoscaler.',
+        labelnames=['slave_class'],
+        namespace='buildbot',
+    )
+
+    unserved_gauge = Gauge(
+        'autoscaler_unserved_requests',
+        'Number of pending requests no on-demand slave can take.',
+        labelnames=['builder'],
+        namespace='buildbot',
+    )
+
+    def __init__(self, poller):
+        """
+        :param PendingRequestPoller poller: The poller for the pending build
+            requests.
+        """
+        StatusReceiverMultiService.__init__(self)
+        self.poller = poller
+        self._unserved = set()
+
+    def startService(self):
+        StatusReceiverMultiService.startService(self)
+        self.poller.subscribe(self.check)
+
+    def stopService(self):
+        self.poller.unsubscribe(self.check)
+        return StatusReceiverMultiService.stopService(self)
+
+    @staticmethod
+    def _slots(pending):
+        """
+        :param PendingRequests pending: The pending build requests.
+        :return: ``_Slots`` for the running and for the stopped on-demand
+            slaves allocated to builders with pending requests.
+        """
+        running, stopped = [], []
+        slaves = {}
+        for builder in pending.counts:
+            for slave in pending.slaves.get(builder, []):
+                slaves[slave.slavename] = slave
+        for slavename, slave in sorted(slaves.items()):
+            slots = _Slots(slave, pending.builders[slavename])
+            if slave.instance_booter.state in _RUNNING_STATES:
+                running.append(slots)
+            else:
+                stopped.append(slots)
+        return running, stopped
+
+    def check(self, pending):
+        """
+        Start the slaves needed for the pending build requests.
+
+        :param PendingRequests pending: The pending build requests.
+        """
+        running, stopped = self._slots(pending)
+        to_start, unserved = plan(pending.counts, running, stopped)
+        for slave in to_start:
+            log.msg(
+                format="Starting %(slave)s for pending requests",
+                slave=slave.slavename,
+            )
+            slave.startInstance()
+            self.starts.labels(slave.slave_class).inc()
+        for builder in self._unserved | set(unserved):
+            self.unserved_gauge.labels(builder).set(unserved.get(builder, 0))
+        self._unserved = set(unserved)
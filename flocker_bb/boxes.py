@@ -16,6 +16,7 @@ from twisted.web.static import File
 
 from characteristic import attributes, Attribute
 
+from flocker_bb.locks import LocksResource
 from flocker_bb.prometheus import PrometheusMetrics
 
 
@@ -197,6 +198,7 @@ class FlockerWebStatus(html.WebStatus):
         resource.putChild(b'results', results)
 
         resource.putChild(b'metrics', PrometheusMetrics())
+        resource.putChild(b'locks', LocksResource(self.master))
 
         vhost = NameVirtualHost()
         vhost.default = resource
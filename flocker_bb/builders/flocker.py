@@ -11,7 +11,7 @@ from buildbot.steps.source.git import Git
 from buildbot.process.properties import Interpolate, Property
 from buildbot.steps.trigger import Trigger
 from buildbot.config import error
-from buildbot.locks import MasterLock, SlaveLock
+from buildbot.locks import SlaveLock
 from buildbot.changes.filter import ChangeFilter
 from buildbot.config import BuilderConfig
 from buildbot.schedulers.basic import AnyBranchScheduler
@@ -22,6 +22,7 @@ from buildbot.schedulers.forcesched import (
     StringParameter,
 )
 
+from ..locks import AdaptiveMasterLock
 from ..steps import (
     BranchType,
     GITHUB,
@@ -31,13 +32,16 @@ from ..steps import (
     flockerRevision,
     getBranchType,
     getFactory,
-    idleSlave,
     isMasterBranch,
     isReleaseBranch,
+    localSlave,
     pip,
+    recordVirtualEnv,
     report_expected_failures_parameter,
     resultPath, resultURL,
     virtualenvBinary,
+    virtualenvCached,
+    virtualenvMissed,
 )
 
 # This is where temporary files associated with a build will be dumped.
@@ -89,34 +93,36 @@ class StorageConfiguration(object):
         # identity, not by name.
         lock_name = '/'.join(['functional', 'api', self.provider])
 
-        # This should be in the config file (FLOC-2025)
-        # Allow up to 2 AWS functional storage driver tests to run in parallel.
-        # This is a temporary fix to get around test wait time being
-        # queued up to run.
-        # OpenStack tests have not experienced long queued wait times.
-        # So, leave the max count at 1.
+        # Start with up to 2 AWS functional storage driver tests in
+        # parallel, and 1 OpenStack one, since OpenStack tests have not
+        # experienced long queued wait times.  The number allowed adapts to
+        # the provider throttling our builds (FLOC-2025).
         if self.provider == 'aws':
-            maxCount = 2
+            bounds = dict(minimum=1, maximum=4, initial=2)
         elif self.provider in ('rackspace', 'redhat-openstack'):
-            maxCount = 1
+            bounds = dict(minimum=1, maximum=2, initial=1)
         else:
             raise NotImplementedError("Unsupported provider %s" %
                                       (self.provider,))
         lock = self._locks.setdefault(
-            self.provider, MasterLock(lock_name, maxCount=maxCount))
+            self.provider, AdaptiveMasterLock(lock_name, **bounds))
         return [lock.access("counting")]
 
 
 def getFlockerFactory(python):
     factory = getFactory("flocker", useSubmodules=False, mergeForward=True)
-    factory.addSteps(buildVirtualEnv(python, useSystem=True))
+    factory.addSteps(buildVirtualEnv(python, useSystem=True, cached=True))
     return factory
 
 
 def installDependencies():
     return [
-        pip("dependencies", ["."]),
-        pip("extras", ["-e", ".[dev]"]),
+        pip("dependencies", ["."], doStepIf=virtualenvMissed),
+        pip("extras", ["-e", ".[dev]"], doStepIf=virtualenvMissed),
+        # A reused virtualenv has everything but the metadata of the
+        # editable install, which the checkout removed.
+        pip("flocker", ["--no-deps", "-e", "."], doStepIf=virtualenvCached),
+        recordVirtualEnv(),
         ]
 
 
@@ -535,7 +541,7 @@ def getBuilders(slavenames):
                 factory=makeOmnibusFactory(
                     distribution=distribution,
                 ),
-                nextSlave=idleSlave,
+                nextSlave=localSlave,
                 ))
 
     return builders
@@ -10,7 +10,6 @@ from buildbot.schedulers.forcesched import (
 )
 from buildbot.schedulers.triggerable import Triggerable
 from buildbot.process.properties import Interpolate, renderer
-from buildbot.locks import MasterLock
 from characteristic import attributes, Attribute
 
 from flocker_bb.builders.flocker import (
@@ -19,11 +18,12 @@ from flocker_bb.builders.flocker import (
     installDependencies,
 )
 from .flocker import OMNIBUS_DISTRIBUTIONS
+from ..locks import AdaptiveMasterLock
 from ..steps import (
     GITHUB,
     buildbotURL,
     flockerBranch,
-    idleSlave,
+    localSlave,
     report_expected_failures_parameter,
     slave_environ,
     virtualenvBinary,
@@ -136,9 +136,9 @@ ACCEPTANCE_CONFIGURATIONS = [
 
 
 # Too many simultaneous builds will hit AWS limits, but
-# too few will make tests painfully slow. We need to find
-# a compromise between these two variables. See FLOC-3263.
-aws_lock = MasterLock('aws-lock', maxCount=3)
+# too few will make tests painfully slow. See FLOC-3263.
+# The number allowed adapts to AWS throttling our builds.
+aws_lock = AdaptiveMasterLock('aws-lock', minimum=1, maximum=6, initial=3)
 ACCEPTANCE_LOCKS = {
     'aws': [aws_lock.access("counting")],
 }
@@ -154,7 +154,7 @@ def getBuilders(slavenames):
             category='flocker',
             factory=run_acceptance_tests(configuration),
             locks=ACCEPTANCE_LOCKS.get(configuration.provider, []),
-            nextSlave=idleSlave))
+            nextSlave=localSlave))
     return builders
 
 BUILDERS = [
@@ -0,0 +1,191 @@
+"""
+Drop unclaimed build requests which have been superseded by a newer request
+for the same builder and branches.
+"""
+
+from __future__ import absolute_import
+
+from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.python import log
+
+from buildbot.db.buildrequests import AlreadyClaimedError
+from buildbot.status.base import StatusReceiverMultiService
+from buildbot.status.results import SKIPPED
+
+from prometheus_client import Counter
+
+# Buildset properties which don't change what is built.
+IGNORED_PROPERTIES = frozenset(['owner', 'reason'])
+
+
+def sourceStampRevisions(sourceStamps):
+    """
+    :param list sourceStamps: Source stamp dictionaries.
+    :return: A sorted ``list`` of ``[codebase, revision]`` pairs, which can be
+        stored as a build property.
+    """
+    return sorted(
+        [ss['codebase'], ss['revision']] for ss in sourceStamps)
+
+
+def supersededDescription(revisions, codebase):
+    """
+    :param list revisions: The ``[codebase, revision]`` pairs of the request
+        which superseded another.
+    :param codebase: The codebase to describe the revision of.
+    :return: A description of why a request was dropped.
+    """
+    for other, revision in revisions:
+        if other == codebase and revision:
+            return 'Superseded by %s.' % (revision[:7],)
+    return 'Superseded by a newer build.'
+
+
+class SupersededRequests(StatusReceiverMultiService):
+    """
+    When a build request is submitted, complete any older unclaimed requests
+    for the same builder, branches and properties, but different revisions,
+    without running them.  Only the newest revision of a branch is
+    interesting, so there is no point in building every push.  A request for
+    the same revision, such as a forced rebuild, was asked for deliberately,
+    so it is left alone.
+
+    Dropped requests are completed as ``SKIPPED``.  Subscribers are called
+    with the builder name, and the source stamp dictionaries of the dropped
+    request and the request which superseded it.
+
+    :ivar cancel_running: Whether to also stop running builds of superseded
+        requests.  Stopped builds have the ``superseded-by`` property set to
+        the ``sourceStampRevisions`` of the newer request.
+    """
+
+    superseded = Counter(
+        'superseded_build_requests_total',
+        'Number of build requests dropped because a newer request for the '
+        'same branch was submitted.',
+        labelnames=['builder', 'state'],
+        namespace='buildbot',
+    )
+
+    def __init__(self, cancel_running=False):
+        StatusReceiverMultiService.__init__(self)
+        self.cancel_running = cancel_running
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    def startService(self):
+        self.status = self.parent
+        self.master = self.status.master
+        StatusReceiverMultiService.startService(self)
+        self._subscription = self.master.subscribeToBuildRequests(
+            self.requestSubmitted)
+
+    def stopService(self):
+        self._subscription.unsubscribe()
+        return StatusReceiverMultiService.stopService(self)
+
+    def requestSubmitted(self, request):
+        d = self.supersede(
+            request['buildername'], request['brid'], request['bsid'])
+        d.addErrback(log.err, "while dropping superseded build requests")
+
+    def _supersedes(self, newer, key, sourceStamps, other_key):
+        """
+        :return: Whether a buildset with the source stamp dictionaries
+            ``newer`` and key ``key`` supersedes one with ``sourceStamps`` and
+            ``other_key``.
+        """
+        return (other_key == key
+                and sourceStampRevisions(sourceStamps)
+                != sourceStampRevisions(newer))
+
+    @inlineCallbacks
+    def _buildsetKey(self, bsid):
+        """
+        :return: A ``Deferred`` firing with a ``tuple`` of the source stamp
+            dictionaries of the buildset, and a key which is equal for
+            buildsets of the same branches and properties.
+        """
+        db = self.master.db
+        buildset = yield db.buildsets.getBuildset(bsid)
+        sourceStamps = yield db.sourcestamps.getSourceStamps(
+            buildset['sourcestampsetid'])
+        properties = yield db.buildsets.getBuildsetProperties(bsid)
+        key = (
+            sorted(
+                (ss['codebase'], ss['repository'], ss['branch'],
+                 ss['patch_body'])
+                for ss in sourceStamps
+            ),
+            {name: value for name, (value, source) in properties.items()
+             if name not in IGNORED_PROPERTIES},
+        )
+        returnValue((sourceStamps, key))
+
+    def _notify(self, builderName, sourceStamps, newer):
+        for callback in list(self._subscribers):
+            try:
+                callback(builderName, sourceStamps, newer)
+            except Exception:
+                log.err(None, "while handling superseded build request")
+
+    @inlineCallbacks
+    def supersede(self, builderName, brid, bsid):
+        """
+        Drop the requests for ``builderName`` which the request ``brid`` of
+        the buildset ``bsid`` supersedes.
+        """
+        db = self.master.db
+        newer, key = yield self._buildsetKey(bsid)
+        if any(ss['patch_body'] for ss in newer):
+            # Patches (try builds) don't supersede anything.
+            return
+        keys = {bsid: (newer, key)}
+
+        requests = yield db.buildrequests.getBuildRequests(
+            buildername=builderName, claimed=False)
+        for brdict in requests:
+            if brdict['brid'] >= brid:
+                continue
+            other = brdict['buildsetid']
+            if other not in keys:
+                keys[other] = yield self._buildsetKey(other)
+            sourceStamps, other_key = keys[other]
+            if not self._supersedes(newer, key, sourceStamps, other_key):
+                continue
+            try:
+                yield db.buildrequests.claimBuildRequests([brdict['brid']])
+            except AlreadyClaimedError:
+                # A slave took it in the meantime.
+                continue
+            yield db.buildrequests.completeBuildRequests(
+                [brdict['brid']], SKIPPED)
+            yield self.master.maybeBuildsetComplete(other)
+            self.superseded.labels(builderName, 'pending').inc()
+            self._notify(builderName, sourceStamps, newer)
+
+        if not self.cancel_running:
+            return
+        builder = self.master.botmaster.builders.get(builderName)
+        if builder is None:
+            return
+        for build in list(builder.building):
+            if build.finished:
+                continue
+            if any(request.id >= brid for request in build.requests):
+                continue
+            other = build.requests[0].bsid
+            if other not in keys:
+                keys[other] = yield self._buildsetKey(other)
+            sourceStamps, other_key = keys[other]
+            if not self._supersedes(newer, key, sourceStamps, other_key):
+                continue
+            build.setProperty(
+                'superseded-by', sourceStampRevisions(newer), 'Superseded')
+            build.stopBuild('Superseded by a newer build request.')
+            self.superseded.labels(builderName, 'running').inc()
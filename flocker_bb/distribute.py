@@ -0,0 +1,116 @@
+"""
+Decide how long to wait before starting builds on a newly attached
+buildslave.
+
+Buildbot doesn't know that on-demand slaves are latent, so it starts every
+pending build it can on the first slave to attach.  Waiting lets slaves which
+are still booting take a share of the builds, but only helps if they are
+about to attach.
+"""
+
+from __future__ import absolute_import
+
+from twisted.internet import reactor
+
+from prometheus_client import Histogram
+
+
+class AttachTimes(object):
+    """
+    Predict how long an on-demand buildslave takes from being started until
+    it attaches, from a moving average of the times observed for its slave
+    class.
+
+    :ivar default: The time (in seconds) predicted for a slave class with no
+        observations.
+    :ivar weight: The weight of each new observation in the average.
+    """
+    def __init__(self, default=5 * 60, weight=0.25):
+        self.default = default
+        self.weight = weight
+        self._expected = {}
+
+    def observe(self, slave_class, seconds):
+        """
+        Record that a slave of ``slave_class`` attached ``seconds`` after it
+        was started.
+        """
+        previous = self._expected.get(slave_class)
+        if previous is None:
+            self._expected[slave_class] = seconds
+        else:
+            self._expected[slave_class] = (
+                previous + self.weight * (seconds - previous))
+
+    def expected(self, slave_class):
+        """
+        :return: How long (in seconds) a slave of ``slave_class`` is expected
+            to take to attach once started.
+        """
+        return self._expected.get(slave_class, self.default)
+
+
+attach_times = AttachTimes()
+
+
+class BuildDistributor(object):
+    """
+    Wait before starting builds on an attached slave only while other slaves
+    allocated to the same builders are about to attach.
+
+    :ivar attach_times: The ``AttachTimes`` used to predict when booting
+        slaves will attach.
+    :ivar max_wait: Slaves predicted to attach further than this (in
+        seconds) in the future aren't waited for.
+    """
+
+    delays = Histogram(
+        'build_start_delay_seconds',
+        'Time waited before starting builds on a newly attached slave.',
+        namespace='buildbot',
+        buckets=(0, 1, 5, 10, 20, 30, 45, 60),
+    )
+
+    def __init__(self, attach_times=attach_times, max_wait=60,
+                 _reactor=reactor):
+        self.attach_times = attach_times
+        self.max_wait = max_wait
+        self._reactor = _reactor
+
+    @staticmethod
+    def _peers(botmaster, slave_name):
+        """
+        :return: The other slaves allocated to the builders of ``slave_name``.
+        """
+        names = set()
+        for builder in botmaster.getBuildersForSlave(slave_name):
+            names.update(builder.config.slavenames)
+        names.discard(slave_name)
+        return [
+            botmaster.slaves[name] for name in sorted(names)
+            if name in botmaster.slaves
+        ]
+
+    def delay(self, botmaster, slave_name):
+        """
+        :return: How long (in seconds) to wait before starting builds on
+            ``slave_name``: until the last of the booting slaves allocated to
+            the same builders which are predicted to attach within
+            ``max_wait`` does so, or ``0`` if there are none.
+        """
+        now = self._reactor.seconds()
+        waits = [0]
+        for peer in self._peers(botmaster, slave_name):
+            boot_started = getattr(peer, 'boot_started', None)
+            if boot_started is None:
+                continue
+            remaining = (self.attach_times.expected(peer.slave_class)
+                         - (now - boot_started))
+            if remaining <= self.max_wait:
+                waits.append(max(0, remaining))
+        delay = max(waits)
+        self.delays.observe(delay)
+        return delay
+
+
+distributor = BuildDistributor()
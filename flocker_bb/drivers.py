@@ -0,0 +1,156 @@
+"""
+Shared, pooled libcloud drivers.
+
+Each libcloud ``NodeDriver`` owns an HTTP connection, and creating one for
+every buildslave means a separate TLS handshake and signing setup per slave.
+Instead, all the buildslaves using the same provider, region and credentials
+share a ``PooledDriver``, which lends a small number of real drivers (and so
+connections) out to the threads making calls, and spaces those calls out with
+a ``flocker_bb.ratelimit.RateLimiter``.
+"""
+
+from __future__ import absolute_import
+
+from contextlib import contextmanager
+from threading import Condition, Lock
+
+from prometheus_client import Counter
+
+from flocker_bb.ratelimit import RateLimiter, call_type
+
+
+class PooledDriver(object):
+    """
+    A thread-safe stand-in for a libcloud ``NodeDriver``.
+
+    Each method call is made on a real driver checked out of the pool for the
+    duration of the call.  libcloud drivers aren't thread-safe, so a real
+    driver is never used by two threads at once.  At most ``size`` real
+    drivers are created; further concurrent calls wait for one to be returned.
+
+    Objects returned by calls which refer back to the real driver (such as
+    ``Node``) are changed to refer to this ``PooledDriver`` instead, so that
+    ``node.destroy()`` and friends also go through the pool.
+
+    Before each call, a token for it is taken from ``limiter``.  This happens
+    before a real driver is checked out, so calls waiting for the rate limiter
+    don't hold on to a connection.
+
+    :ivar provider: The libcloud provider name, used to label metrics.
+    :ivar size: The maximum number of real drivers to create.
+    :ivar RateLimiter limiter: The rate limiter the calls go through.
+    """
+
+    connections_created = Counter(
+        'cloud_driver_connections_created_total',
+        'Number of libcloud drivers (and so connections) created.',
+        labelnames=['provider'],
+        namespace='buildbot',
+    )
+
+    calls = Counter(
+        'cloud_driver_calls_total',
+        'Number of calls made through pooled libcloud drivers.',
+        labelnames=['provider'],
+        namespace='buildbot',
+    )
+
+    def __init__(self, provider, factory, size=4, limiter=None):
+        """
+        :param factory: A no-argument callable which creates a new libcloud
+            driver.
+        :param limiter: A ``RateLimiter``, or ``None`` to use one with the
+            default budgets.
+        """
+        if limiter is None:
+            limiter = RateLimiter(provider)
+        self.provider = provider
+        self.size = size
+        self.limiter = limiter
+        self._factory = factory
+        self._idle = []
+        self._created = 0
+        self._condition = Condition()
+
+    @contextmanager
+    def _checkout(self):
+        with self._condition:
+            while not self._idle and self._created >= self.size:
+                self._condition.wait()
+            if self._idle:
+                driver = self._idle.pop()
+            else:
+                driver = None
+                self._created += 1
+        if driver is None:
+            try:
+                driver = self._factory()
+            except Exception:
+                with self._condition:
+                    self._created -= 1
+                    self._condition.notify()
+                raise
+            self.connections_created.labels(self.provider).inc()
+        try:
+            yield driver
+        finally:
+            with self._condition:
+                self._idle.append(driver)
+                self._condition.notify()
+
+    def _rebind(self, driver, result):
+        if isinstance(result, list):
+            for item in result:
+                self._rebind(driver, item)
+        elif getattr(result, 'driver', None) is driver:
+            result.driver = self
+        return result
+
+    def with_driver(self, method_name, f, *args, **kwargs):
+        """
+        Call ``f`` with a real driver checked out of the pool, for calls which
+        aren't simple driver methods.
+
+        :param bytes method_name: The libcloud method the call is counted as,
+            for rate limiting.
+        :return: The result of ``f``.
+        """
+        self.calls.labels(self.provider).inc()
+        self.limiter.acquire(call_type(method_name))
+        with self._checkout() as driver:
+            return self._rebind(driver, f(driver, *args, **kwargs))
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            return self.with_driver(
+                name, lambda driver: getattr(driver, name)(*args, **kwargs))
+        call.__name__ = name
+        return call
+
+
+_drivers = {}
+_drivers_lock = Lock()
+
+
+def get_shared_driver(provider, region, credentials, factory):
+    """
+    Return the ``PooledDriver`` shared by everything using the given provider,
+    region and credentials.
+
+    :param bytes provider: A libcloud provider name.
+    :param bytes region: The region the driver is for.
+    :param tuple credentials: The credentials the driver uses.
+    :param factory: See ``PooledDriver``; only used if there is not already a
+        driver for this provider, region and credentials.
+    :return: A ``PooledDriver``.
+    """
+    key = (provider, region, credentials)
+    with _drivers_lock:
+        driver = _drivers.get(key)
+        if driver is None:
+            driver = _drivers[key] = PooledDriver(
+                provider=provider, factory=factory)
+        return driver
@@ -1,46 +1,56 @@
 from __future__ import absolute_import
 
+import time
+from collections import OrderedDict
+from pipes import quote
+from threading import Lock
+from weakref import WeakKeyDictionary
+
 from eliot import Message, start_action, Action
 from eliot.twisted import DeferredContext
 from zope.interface import implementer, Interface
 from twisted.python.constants import Names, NamedConstant
-from twisted.internet.threads import deferToThread
-from characteristic import attributes
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, succeed
+from characteristic import attributes, Attribute
+from buildbot.config import error as config_error
 from twisted.python import log
 from machinist import (
     TransitionTable, MethodSuffixOutputer,
     trivialInput, constructFiniteStateMachine, Transition,
     IRichInput, stateful)
+from flocker_bb.drivers import get_shared_driver
 from flocker_bb.ec2_buildslave import OnDemandBuildSlave
-from retry import retry
+from flocker_bb.images import ImageIndex, get_image_catalog
+from flocker_bb.threadpool import deferToCloudThread
+from flocker_bb.util import retryDeferred
+from prometheus_client import Counter, Histogram
 
 
-class RetryLogger(object):
-    """
-    A stdlib-like logger that implements the method used by :module:`retry`.
-    """
-    @staticmethod
-    def warning(fmt, error, delay):
-        Message.new(
-            message_type="flocker_bb:ec2:retry",
-            error=str(error), delay=delay,
-        ).write()
+def log_retry(failure, delay):
+    Message.new(
+        message_type="flocker_bb:ec2:retry",
+        error=str(failure.value), delay=delay,
+    ).write()
 
 
 class RequestLimitExceeded(Exception):
     pass
 
-retry_on_request_limit = retry(
-    RequestLimitExceeded, delay=10, backoff=2, max_delay=240, jitter=(0, 10),
-    logger=RetryLogger(),
-)
 
+def retry_on_request_limit(reactor, call):
+    """
+    Call ``call`` until it doesn't fail with ``RequestLimitExceeded``, backing
+    off on the reactor between attempts, so that no thread is held while
+    waiting.
 
-# A metadata key name which can be found in image metadata.  This metadata
-# items identifies the general purpose of the image.  It may not be unique if
-# multiple versions of the image have been created.  It corresponds to the
-# names used in the manifest.yml file used to build the images.
-BASE_NAME_TAG = "base_name"
+    :param call: A no-argument callable returning a ``Deferred``.
+    :return: A ``Deferred`` that fires with the result of ``call``.
+    """
+    return retryDeferred(
+        reactor, call, RequestLimitExceeded,
+        delay=10, backoff=2, maxDelay=240, jitter=(0, 10), log=log_retry,
+    )
 
 
 class Input(Names):
@@ -50,11 +60,16 @@ class Input(Names):
     REQUEST_STOP = NamedConstant()
     INSTANCE_STOPPED = NamedConstant()
     STOP_FAILED = NamedConstant()
+    INSTANCE_ADOPTED = NamedConstant()
+    REQUEST_RETAIN = NamedConstant()
+    INSTANCE_RETAINED = NamedConstant()
 
 
 class Output(Names):
     START = NamedConstant()
     STOP = NamedConstant()
+    RETAIN = NamedConstant()
+    RESUME = NamedConstant()
 
 
 class State(Names):
@@ -64,40 +79,62 @@ class State(Names):
     ACTIVE = NamedConstant()
     STOPPING = NamedConstant()
     STOP_CANCELLED = NamedConstant()
+    STOPPED_RETAINED = NamedConstant()
 
+# REQUEST_RETAIN is sent instead of REQUEST_STOP by booters which retain
+# idle nodes: the node is stopped, keeping its disk, rather than destroyed, and
+# started again when needed.  If resuming a node fails, a new one is created
+# instead.  If stopping a node fails, it is destroyed instead.
 table = TransitionTable({
     State.IDLE: {
         Input.REQUEST_START: Transition([Output.START], State.STARTING),
         Input.REQUEST_STOP: Transition([], State.IDLE),
+        Input.REQUEST_RETAIN: Transition([], State.IDLE),
+        # A node left running by a previous buildmaster process was found.
+        Input.INSTANCE_ADOPTED: Transition([], State.ACTIVE),
+        # A node retained by a previous buildmaster process was found.
+        Input.INSTANCE_RETAINED: Transition([], State.STOPPED_RETAINED),
     },
     State.STARTING: {
         Input.REQUEST_START: Transition([], State.STARTING),
         Input.REQUEST_STOP: Transition([], State.START_CANCELLED),
+        Input.REQUEST_RETAIN: Transition([], State.START_CANCELLED),
         Input.INSTANCE_STARTED: Transition([], State.ACTIVE),
         Input.START_FAILED: Transition([Output.START], State.STARTING),
     },
     State.START_CANCELLED: {
         Input.REQUEST_START: Transition([], State.STARTING),
         Input.REQUEST_STOP: Transition([], State.START_CANCELLED),
+        Input.REQUEST_RETAIN: Transition([], State.START_CANCELLED),
         Input.INSTANCE_STARTED: Transition([Output.STOP], State.STOPPING),
         Input.START_FAILED: Transition([], State.IDLE),
     },
     State.ACTIVE: {
         Input.REQUEST_START: Transition([], State.ACTIVE),
         Input.REQUEST_STOP: Transition([Output.STOP], State.STOPPING),
+        Input.REQUEST_RETAIN: Transition([Output.RETAIN], State.STOPPING),
     },
     State.STOPPING: {
         Input.REQUEST_START: Transition([], State.STOP_CANCELLED),
         Input.REQUEST_STOP: Transition([], State.STOPPING),
+        Input.REQUEST_RETAIN: Transition([], State.STOPPING),
         Input.INSTANCE_STOPPED: Transition([], State.IDLE),
+        Input.INSTANCE_RETAINED: Transition([], State.STOPPED_RETAINED),
         Input.STOP_FAILED: Transition([Output.STOP], State.STOPPING),
     },
     State.STOP_CANCELLED: {
         Input.REQUEST_START: Transition([], State.STOP_CANCELLED),
         Input.REQUEST_STOP: Transition([], State.STOPPING),
+        Input.REQUEST_RETAIN: Transition([], State.STOPPING),
         Input.INSTANCE_STOPPED: Transition([Output.START], State.STARTING),
+        Input.INSTANCE_RETAINED: Transition([Output.RESUME], State.STARTING),
         Input.STOP_FAILED: Transition([], State.ACTIVE),
     },
+    State.STOPPED_RETAINED: {
+        Input.REQUEST_START: Transition([Output.RESUME], State.STARTING),
+        Input.REQUEST_STOP: Transition([Output.STOP], State.STOPPING),
+        Input.REQUEST_RETAIN: Transition([], State.STOPPED_RETAINED),
+    },
 })
 
 RequestStart = trivialInput(Input.REQUEST_START)
@@ -114,9 +151,175 @@ StartFailed = trivialInput(Input.START_FAILED)
 RequestStop = trivialInput(Input.REQUEST_STOP)
 InstanceStopped = trivialInput(Input.INSTANCE_STOPPED)
 StopFailed = trivialInput(Input.STOP_FAILED)
+InstanceAdopted = trivialInput(Input.INSTANCE_ADOPTED)
+RequestRetain = trivialInput(Input.REQUEST_RETAIN)
+InstanceRetained = trivialInput(Input.INSTANCE_RETAINED)
+
+
+class NotYetStopped(Exception):
+    """
+    A node being retained hasn't finished stopping.
+    """
+
+
+def create_node(driver, task_id):
+    """
+    Create a node.
+
+    The image is looked up once, and used both to create the node and for
+    the image metadata, so the metadata reported is that of the image the
+    node is running.
+
+    This blocks, so should be called in a thread.
+
+    :param ICloudDriver driver: The driver to create the node with.
+    :param task_id: The serialized eliot task id of the action starting the
+        node.
+    :return: An ``(image_metadata, node)`` tuple.
+    """
+    with Action.continue_task(task_id=task_id):
+        image = driver.get_image()
+        return (driver.get_image_metadata(image), driver.create(image))
+
+
+def create_nodes(drivers, task_ids):
+    """
+    Create a node for each of a group of drivers with the same
+    ``IBatchingCloudDriver.launch_group``, together.
+
+    This blocks, so should be called in a thread.
+
+    :param list drivers: ``IBatchingCloudDriver`` providers.
+    :param list task_ids: The serialized eliot task id of the action starting
+        each node.
+    :return: A ``list`` with an ``(image_metadata, node)`` tuple for each
+        driver.
+    """
+    if len(drivers) == 1:
+        return [create_node(drivers[0], task_ids[0])]
+    with Action.continue_task(task_id=task_ids[0]):
+        image = drivers[0].get_image()
+        image_metadata = drivers[0].get_image_metadata(image)
+        nodes = drivers[0].create_group(drivers, image)
+    return [(image_metadata, node) for node in nodes]
+
+
+class BootScheduler(object):
+    """
+    Launch the nodes requested within a short window together.
 
+    When a buildset is submitted, many on-demand slaves start at once.  The
+    creations requested within ``window`` seconds of each other are grouped by
+    ``IBatchingCloudDriver.launch_group``, and each group is launched with one
+    ``IBatchingCloudDriver.create_group`` call (a single ``RunInstances`` call
+    for EC2) from one thread.
 
-@attributes(['driver'], apply_immutable=True)
+    :ivar window: How long to collect creations for, in seconds.
+    """
+
+    def __init__(self, window=1, _reactor=reactor,
+                 _deferToThread=deferToCloudThread):
+        self.window = window
+        self._reactor = _reactor
+        self._deferToThread = _deferToThread
+        self._pending = []
+        self._flush_call = None
+
+    def create(self, driver, task_id):
+        """
+        Create a node.
+
+        :param IBatchingCloudDriver driver: The driver to create the node
+            with.
+        :param task_id: The serialized eliot task id of the action starting
+            the node.
+        :return: A ``Deferred`` that fires with an ``(image_metadata, node)``
+            tuple.
+        """
+        d = Deferred()
+        self._pending.append((driver, task_id, d))
+        if self._flush_call is None:
+            self._flush_call = self._reactor.callLater(
+                self.window, self._flush)
+        return d
+
+    def _flush(self):
+        self._flush_call = None
+        pending, self._pending = self._pending, []
+        groups = OrderedDict()
+        for driver, task_id, d in pending:
+            groups.setdefault(driver.launch_group(), []).append(
+                (driver, task_id, d))
+        for group in groups.values():
+            self._launch(group)
+
+    def _launch(self, group):
+        drivers = [driver for (driver, _, _) in group]
+        log.msg(
+            format="Creating %(count)d nodes for %(names)s",
+            count=len(drivers),
+            names=[driver.name for driver in drivers],
+        )
+        d = self._deferToThread(
+            create_nodes, drivers, [task_id for (_, task_id, _) in group])
+
+        def launched(results):
+            for (_, _, waiting), result in zip(group, results):
+                waiting.callback(result)
+
+        def failed(f):
+            # Every node is launched by the same call, so they all fail.
+            for (_, _, waiting) in group:
+                waiting.errback(f)
+
+        d.addCallbacks(launched, failed)
+
+
+default_boot_scheduler = BootScheduler()
+
+
+# Where an EC2 node finds its position in the ``RunInstances`` call which
+# launched it.
+LAUNCH_INDEX_URL = "http://169.254.169.254/latest/meta-data/ami-launch-index"
+
+
+def buildslave_user_data(user_data, identities):
+    """
+    Give nodes the names and passwords of their buildslaves.
+
+    :param bytes user_data: A script (see ``slave/cloud-init.sh``) which
+        starts a buildslave named ``$BUILDSLAVE_NAME`` with the password
+        ``$BUILDSLAVE_PASSWORD``.
+    :param list identities: The ``(name, password)`` of the buildslave of
+        each node launched together, in launch order.
+    :return: The user data for the nodes.  If several nodes are launched
+        together, they share it, and each chooses its buildslave by its EC2
+        launch index.
+    """
+    interpreter, _, script = user_data.partition('\n')
+    if len(identities) == 1:
+        [(name, password)] = identities
+        identity = 'BUILDSLAVE_NAME=%s\nBUILDSLAVE_PASSWORD=%s\n' % (
+            quote(name), quote(password))
+    else:
+        identity = 'case "$(curl -s %s)" in\n' % (LAUNCH_INDEX_URL,)
+        for index, (name, password) in enumerate(identities):
+            identity += (
+                '    %d) BUILDSLAVE_NAME=%s BUILDSLAVE_PASSWORD=%s ;;\n'
+                % (index, quote(name), quote(password)))
+        identity += 'esac\n'
+    return '\n'.join([interpreter, identity + script])
+
+
+@attributes([
+    'driver',
+    Attribute('boot_scheduler', default_value=default_boot_scheduler),
+    Attribute('slave_class', default_value=None),
+    Attribute('_clock', default_value=time.time),
+    Attribute('_deferToThread', default_value=deferToCloudThread),
+    Attribute('retain', default_value=False),
+    Attribute('_reactor', default_value=reactor),
+], apply_immutable=True)
 class InstanceBooter(object):
     """
     Creates and destroys virtual machines associated with an
@@ -125,8 +328,23 @@ class InstanceBooter(object):
 
     :ivar ICloudDriver driver: A driver instance which is capable of creating
        and destroying virtual machines for a particular cloud provider.
+    :ivar BootScheduler boot_scheduler: The scheduler through which nodes are
+       created, if ``driver`` provides ``IBatchingCloudDriver``.
+    :ivar slave_class: The slave class of the buildslave, used to label
+       metrics.
+    :ivar bool retain: Whether to stop idle nodes, keeping their disks,
+       rather than destroying them.
     """
 
+    state_durations = Histogram(
+        'instance_booter_state_seconds',
+        'Time spent in each state before each state change of an '
+        'InstanceBooter.',
+        labelnames=['slave_class', 'from_state', 'to_state'],
+        namespace='buildbot',
+        buckets=(1, 5, 10, 30, 60, 120, 180, 300, 600, 1200, 3600),
+    )
+
     def _fsmState(self):
         """
         Return the current state of the finite-state machine driving this
@@ -142,12 +360,36 @@ class InstanceBooter(object):
             inputs=Input, outputs=Output, states=State, table=table,
             initial=State.IDLE,
             richInputs=[RequestStart, InstanceStarted, StartFailed,
-                        RequestStop, InstanceStopped, StopFailed],
+                        RequestStop, InstanceStopped, StopFailed,
+                        InstanceAdopted, RequestRetain, InstanceRetained],
             inputContext={}, world=MethodSuffixOutputer(self))
+        self._entered = self._clock()
 
     def identifier(self):
         return self.driver.name
 
+    def time_in_state(self):
+        """
+        :return: How long (in seconds) the state machine has been in its
+            current state.
+        """
+        return self._clock() - self._entered
+
+    def _receive(self, input):
+        """
+        Deliver an input to the state machine, recording how long it was in
+        its previous state if the state changes.
+        """
+        before = self._fsm.state
+        after = table.table[before][input.symbol()].nextState
+        if after is not before:
+            now = self._clock()
+            self.state_durations.labels(
+                self.slave_class or self.driver.name, before.name, after.name,
+            ).observe(now - self._entered)
+            self._entered = now
+        return self._fsm.receive(input)
+
     def output_START(self, context):
         """
         Create a node.
@@ -156,66 +398,106 @@ class InstanceBooter(object):
             action_type="flocker_bb:ec2:start",
             name=self.identifier())
         with action.context():
-
-            def thread_start(task_id):
-                # Since loading the image metadata is done separately from
-                # booting the node, it's possible the metadata here won't
-                # actually match the metadata of the image the node ends up
-                # running (someone could replace the image with a different one
-                # between this call and the node being started).  Since
-                # generating images is currently a manual step, this probably
-                # won't happen very often and if it does there's a person there
-                # who can deal with it.  Also it will be resolved after the
-                # next node restart.  It would be better to extract the image
-                # metadata from the booted node, though.
-                # FLOC-1905
-                with Action.continue_task(task_id=task_id):
-                    self.image_metadata = self.driver.get_image_metadata()
-                    return self.driver.create()
-
+            task_id = action.serialize_task_id()
+            if IBatchingCloudDriver.providedBy(self.driver):
+                def create():
+                    return self.boot_scheduler.create(self.driver, task_id)
+            else:
+                def create():
+                    return self._deferToThread(
+                        create_node, self.driver, task_id)
+            # Back off from throttled creations on the reactor, rather than
+            # holding a thread while waiting.
             d = DeferredContext(
-                deferToThread(thread_start, action.serialize_task_id())
-            )
-
-            def started(node):
-                self.node = node
-                instance_metadata = {
-                    'instance_id': node.id,
-                    'instance_name': node.name,
-                }
-                self._fsm.receive(InstanceStarted(
-                    instance_id=node.id,
-                    image_metadata=self.image_metadata,
-                    instance_metadata=instance_metadata,
-                ))
-                self.instance_metadata = instance_metadata
+                retry_on_request_limit(self._reactor, create))
 
             def failed(f):
                 # We log the exception twice.
                 # For Zulip
                 log.err(f, "while starting %s" % (self.identifier(),))
-                self._fsm.receive(StartFailed())
+                self._receive(StartFailed())
                 # For eliot
                 return f
 
-            d.addCallbacks(started, failed)
+            d.addCallbacks(self._started, failed)
             d.addActionFinish()
 
+    def _started(self, (image_metadata, node)):
+        """
+        Record that a node has been started.
+        """
+        self.node = node
+        instance_metadata = {
+            'instance_id': node.id,
+            'instance_name': node.name,
+        }
+        self._receive(InstanceStarted(
+            instance_id=node.id,
+            image_metadata=image_metadata,
+            instance_metadata=instance_metadata,
+        ))
+        self.image_metadata = image_metadata
+        self.instance_metadata = instance_metadata
+
+    def output_RETAIN(self, context):
+        """
+        Stop a node, keeping its disk, and wait for it to finish stopping.
+        """
+        node = self.node
+
+        def check():
+            d = self._deferToThread(self.driver.is_stopped, node)
+
+            def checked(stopped):
+                if not stopped:
+                    raise NotYetStopped()
+            return d.addCallback(checked)
+
+        d = self._deferToThread(self.driver.stop_retained, node)
+        d.addCallback(lambda _: retryDeferred(
+            self._reactor, check, NotYetStopped, delay=5))
+
+        def retained(_):
+            self._receive(InstanceRetained())
+
+        def failed(f):
+            log.err(f, "while retaining %s" % (self.identifier(),))
+            self._receive(StopFailed())
+
+        d.addCallbacks(retained, failed)
+
+    def output_RESUME(self, context):
+        """
+        Start a retained node again.
+        """
+        d = self._deferToThread(self.driver.resume, self.node)
+
+        def failed(f):
+            log.err(f, "while resuming %s; creating a new node" % (
+                self.identifier(),))
+            stale = self.node
+            del self.node
+            d = self._deferToThread(stale.destroy)
+            d.addErrback(log.err, "while destroying %s" % (stale.id,))
+            self._receive(StartFailed())
+
+        d.addCallbacks(self._started, failed)
+
     def output_STOP(self, context):
         """
         Destroy a node.
         """
-        d = deferToThread(self.node.destroy)
+        d = self._deferToThread(self.node.destroy)
 
         def stopped(node):
             del self.node
-            self._fsm.receive(InstanceStopped())
+            self._receive(InstanceStopped())
 
         def failed(f):
             instance_id = self.node.id
             # Assume the instance is already gone.
             del self.node
-            self._fsm.receive(InstanceStopped())
+            self._receive(InstanceStopped())
             log.err(f, "while stopping %s" % (self.identifier(),))
             log.msg(
                 instance_id=instance_id, **self.driver.log_failure_arguments()
@@ -223,11 +505,185 @@ class InstanceBooter(object):
 
         d.addCallbacks(stopped, failed)
 
+    @property
+    def state(self):
+        """
+        The ``State`` of the finite-state machine driving this
+        ``InstanceBooter``.
+        """
+        return self._fsmState()
+
+    def reconcile(self):
+        """
+        Adopt a node left running for this buildslave by a previous
+        buildmaster process, if there is one and no node has been started
+        since.
+
+        :return: A ``Deferred`` that fires with ``True`` if a node was
+            adopted.
+        """
+        if self.state is not State.IDLE:
+            return succeed(False)
+        d = self._deferToThread(self.driver.find_instances)
+
+        def found(instances):
+            from libcloud.compute.types import NodeState
+            if self.state is not State.IDLE:
+                return False
+            running = [
+                (image_metadata, node) for (image_metadata, node) in instances
+                if node.state != NodeState.STOPPED
+            ]
+            if not running:
+                return self._adopt_retained([
+                    node for (_, node) in instances
+                    if node.state == NodeState.STOPPED
+                ])
+            (image_metadata, node) = running[0]
+            for _, extra in running[1:]:
+                log.msg(
+                    format="Not adopting extra node %(instance_id)s for "
+                           "%(name)s",
+                    instance_id=extra.id, name=self.identifier(),
+                )
+            log.msg(
+                format="Adopting node %(instance_id)s for %(name)s",
+                instance_id=node.id, name=self.identifier(),
+            )
+            self.node = node
+            self._receive(InstanceAdopted())
+            self.image_metadata = image_metadata
+            self.instance_metadata = {
+                'instance_id': node.id,
+                'instance_name': node.name,
+            }
+            return True
+        return d.addCallback(found)
+
+    def _adopt_retained(self, nodes):
+        """
+        Adopt a stopped node, retained by a previous buildmaster process, if
+        this booter retains nodes.
+
+        :return: ``False``, since no running node was adopted.
+        """
+        if self.retain and nodes:
+            log.msg(
+                format="Adopting retained node %(instance_id)s for %(name)s",
+                instance_id=nodes[0].id, name=self.identifier(),
+            )
+            self.node = nodes[0]
+            self._receive(InstanceRetained())
+        return False
+
     def start(self):
-        self._fsm.receive(RequestStart())
+        """
+        Request that the node is started.
+
+        :return: ``True`` if this request caused a node to be created or a
+            retained node to be resumed, ``False`` if one was already running
+            or being started.
+        """
+        outputs = self._receive(RequestStart())
+        return Output.START in outputs or Output.RESUME in outputs
+
+    def stop(self, retain=True):
+        """
+        Request that the node is stopped; it is retained if this booter
+        retains nodes and ``retain`` is true, and destroyed otherwise.
+
+        :param bool retain: Whether the node may be retained.  Nodes which
+            may be broken shouldn't be.
+        """
+        if self.retain and retain:
+            self._receive(RequestRetain())
+        else:
+            self._receive(RequestStop())
+
+
+class SizeCache(object):
+    """
+    The ``NodeSize`` objects offered by a libcloud driver.
+
+    Sizes practically never change, so they are only listed the first time
+    they are needed, or after the cache has been invalidated.  Looking up a
+    size which wasn't listed lists them again, but at most once every
+    ``relist_interval`` seconds; in between, the size is known to be unknown.
+
+    The caches of the shared drivers are invalidated on reconfig, and when a
+    node can't be created because the provider doesn't know its size.
+
+    :ivar driver: The libcloud driver to query for sizes.
+    :ivar relist_interval: The fewest seconds between listings caused by
+        looking up unknown sizes.
+    """
+
+    lookups = Counter(
+        'size_cache_lookups_total',
+        'Number of NodeSize lookups, by whether they were cached.',
+        labelnames=['result'],
+        namespace='buildbot',
+    )
 
-    def stop(self):
-        self._fsm.receive(RequestStop())
+    def __init__(self, driver, relist_interval=300, _time=time.time):
+        self.driver = driver
+        self.relist_interval = relist_interval
+        self._time = _time
+        self._sizes = None
+        self._listed_at = None
+        self._lock = Lock()
+
+    def invalidate(self):
+        """
+        Forget the cached sizes, so they are listed again on the next lookup.
+        """
+        with self._lock:
+            self._sizes = None
+            self._listed_at = None
+
+    def get(self, size_id):
+        """
+        Return the ``NodeSize`` with the given id.
+
+        This may block, so should be called in a thread.
+
+        :raises ValueError: If there is no such size.
+        """
+        with self._lock:
+            sizes, listed_at = self._sizes, self._listed_at
+        if sizes is not None:
+            if size_id in sizes:
+                self.lookups.labels('hit').inc()
+                return sizes[size_id]
+            if self._time() - listed_at < self.relist_interval:
+                self.lookups.labels('unknown').inc()
+                raise ValueError("Unknown size.", size_id)
+        # Either we haven't listed the sizes yet, or a new size may have been
+        # added since we did.
+        self.lookups.labels('miss').inc()
+        listed_at = self._time()
+        sizes = {size.id: size for size in self.driver.list_sizes()}
+        with self._lock:
+            self._sizes, self._listed_at = sizes, listed_at
+        try:
+            return sizes[size_id]
+        except KeyError:
+            raise ValueError("Unknown size.", size_id)
+
+
+_size_caches = WeakKeyDictionary()
+_size_caches_lock = Lock()
+
+
+def get_size_cache(driver):
+    """
+    Return the ``SizeCache`` for a libcloud driver.
+    """
+    with _size_caches_lock:
+        cache = _size_caches.get(driver)
+        if cache is None:
+            cache = _size_caches[driver] = SizeCache(driver)
+        return cache
 
 
 def get_size(driver, size_id):
@@ -236,10 +692,20 @@ def get_size(driver, size_id):
 
     :param driver: The libcloud driver to query for sizes.
     """
-    try:
-        return [s for s in driver.list_sizes() if s.id == size_id][0]
-    except IndexError:
-        raise ValueError("Unknown size.", size_id)
+    return get_size_cache(driver).get(size_id)
+
+
+def size_rejected(driver, size_id, error):
+    """
+    Invalidate the sizes of a libcloud driver if creating a node failed
+    because the provider doesn't know the size any more.
+
+    :param driver: The libcloud driver which failed to create a node.
+    :param size_id: The id of the size of the node.
+    :param Exception error: Why creating the node failed.
+    """
+    if size_id in error.message:
+        get_size_cache(driver).invalidate()
 
 
 def get_newest_tagged_image(images, name, tags, get_tags):
@@ -254,37 +720,22 @@ def get_newest_tagged_image(images, name, tags, get_tags):
 
     :return: The new image from ``images`` which matches the given criteria.
     """
-    required_tags = tags.copy()
-    required_tags[BASE_NAME_TAG] = name
-
-    log.msg(
-        format="Checking %(count)d images for tags %(required)s",
-        count=len(images),
-        required=required_tags,
-    )
-
-    def dict_contains(expected, actual):
-        return set(expected.items()).issubset(set(actual.items()))
+    return ImageIndex(images, get_tags).newest(name, tags)
 
-    def timestamp(image):
-        return get_tags(image).get('timestamp')
 
-    matching_images = []
-    for image in images:
-        image_tags = get_tags(image)
-        log.msg(
-            format="Checking %(image_id)s with %(tags)s",
-            image_id=image.id, tags=image_tags,
-        )
-        if dict_contains(required_tags, image_tags):
-            log.msg(
-                format="%(image_id)s matched required tags", image_id=image.id,
-            )
-            matching_images.append(image)
+def get_node_image_metadata(driver, image_id):
+    """
+    Return the metadata for the image an existing node was created from.
 
-    if matching_images:
-        return max(matching_images, key=timestamp)
-    raise ValueError("Unknown image.", name)
+    :param driver: An ``ICloudDriver`` with an ``image_catalog``.
+    :param bytes image_id: The id of the image.
+    :return: The ``dict`` of image metadata, or just the image id if the image
+        no longer exists.
+    """
+    image = driver.image_catalog.index().get(image_id)
+    if image is None:
+        return {'image_id': image_id}
+    return driver.get_image_metadata(image)
 
 
 class ICloudDriver(Interface):
@@ -293,13 +744,49 @@ class ICloudDriver(Interface):
     the differences between cloud provider specific subclasses of
     ``NodeDriver``.
     """
-    def create():
+    def get_image():
+        """
+        :return: The libcloud image used to create nodes.
+        """
+
+    def create(image=None):
         """
         Create a new node
 
+        :param image: The libcloud image to use, or ``None`` to look it up.
         :return: A libcloud ``Node``.
         """
 
+    def find_instances():
+        """
+        Find the running (or stopped) nodes created for this buildslave by
+        this (or a previous) buildmaster process.
+
+        This blocks, so should be called in a thread.
+
+        :return: A ``list`` of ``(image_metadata, node)`` tuples.
+        """
+
+    def list_buildmaster_instances():
+        """
+        Find the nodes created for any buildslave by this buildmaster, using
+        this driver's account and region.  This includes nodes stopped by
+        ``IRetainingCloudDriver.stop_retained``, which still hold disks.
+
+        This blocks, so should be called in a thread.
+
+        :return: A ``list`` of libcloud ``Node``s.
+        """
+
+    def destroy_instances(nodes):
+        """
+        Destroy several nodes, in as few API calls as possible.
+
+        This blocks, so should be called in a thread.
+
+        :param list nodes: libcloud ``Node``s.
+        """
+
     def log_failure_arguments():
         """
         :return: A ``dict`` of arguments which will be use to format the
@@ -307,22 +794,86 @@ class ICloudDriver(Interface):
             destroyed.
         """
 
-    def get_image_metadata():
+    def get_image_metadata(image=None):
         """
+        :param image: The libcloud image to describe, or ``None`` to look it
+            up.
         :return: A ``dict`` of metadata for the image used by this buildslave,
             which will be displayed in the build master web interface.
         """
 
 
+class IBatchingCloudDriver(ICloudDriver):
+    """
+    An ``ICloudDriver`` which can create nodes for several buildslaves with
+    one API call.
+    """
+    def launch_group():
+        """
+        :return: A hashable value, equal for drivers whose nodes can be
+            created together by ``create_group``.
+        """
+
+    def create_group(drivers, image=None):
+        """
+        Create a node for each of ``drivers``, which all have this driver's
+        ``launch_group``, together.
+
+        This blocks, so should be called in a thread.
+
+        :param list drivers: ``IBatchingCloudDriver`` providers.
+        :param image: The libcloud image to use, or ``None`` to look it up.
+        :return: A ``list`` of libcloud ``Node``s, one for each driver, in
+            the same order.
+        """
+
+
+class IRetainingCloudDriver(ICloudDriver):
+    """
+    An ``ICloudDriver`` which can stop nodes, keeping their disks, and start
+    them again later.
+    """
+    def stop_retained(node):
+        """
+        Stop a node, keeping its disk, so that it can be resumed later.
+
+        This blocks, so should be called in a thread.
+
+        :param node: The libcloud ``Node`` to stop.
+        """
+
+    def is_stopped(node):
+        """
+        This blocks, so should be called in a thread.
+
+        :param node: A libcloud ``Node`` being stopped by ``stop_retained``.
+        :return: Whether the node has finished stopping.
+        :raises ValueError: If the node no longer exists.
+        """
+
+    def resume(node):
+        """
+        Start a node stopped by ``stop_retained``.
+
+        This blocks, so should be called in a thread.
+
+        :param node: The libcloud ``Node`` to start.
+        :return: An ``(image_metadata, node)`` tuple.
+        """
+
+
 @attributes([
-    'driver', 'name', 'region', 'instance_type', 'keypair_name',
+    'driver', 'name', 'password', 'region', 'instance_type', 'keypair_name',
     'security_name', 'image_id', 'image_tags', 'user_data',
-    'instance_tags'
+    'instance_tags', 'image_catalog',
 ])
-@implementer(ICloudDriver)
+@implementer(IBatchingCloudDriver, IRetainingCloudDriver)
 class EC2CloudDriver(object):
     """
     A driver for creating ``EC2`` nodes on ``AWS``.
+
+    ``user_data`` is shared by every buildslave of a slave class, so that
+    their nodes can be launched together (see ``buildslave_user_data``).
     """
     _INSTANCE_URL = (
         "https://%(region)s.console.aws.amazon.com/ec2/v2/home?"
@@ -336,9 +887,10 @@ class EC2CloudDriver(object):
     def from_driver_parameters(
             cls, region, identifier, secret_identifier, **kwargs):
         """
-        Create an ``EC2`` libcloud ``NodeDriver`` using the supplied region and
-        credentials and supply that as the ``driver`` for ``EC2CloudDriver``
-        along with all the other keyword arguments it requires.
+        Get the shared ``EC2`` libcloud ``NodeDriver`` for the supplied region
+        and credentials and supply that as the ``driver`` for
+        ``EC2CloudDriver`` along with all the other keyword arguments it
+        requires.
 
         :param bytes region: An EC2 region slug.
         :param bytes identifier: An EC2 API identifier.
@@ -348,13 +900,33 @@ class EC2CloudDriver(object):
         """
         from libcloud.compute.providers import get_driver, Provider
         ec2_driver_factory = get_driver(Provider.EC2)
-        driver = ec2_driver_factory(
-            key=identifier,
-            secret=secret_identifier,
-            region=region
+        driver = get_shared_driver(
+            provider=Provider.EC2,
+            region=region,
+            credentials=(identifier, secret_identifier),
+            factory=lambda: ec2_driver_factory(
+                key=identifier,
+                secret=secret_identifier,
+                region=region
+            ),
+        )
+        image_catalog = get_image_catalog(
+            key=(Provider.EC2, region, identifier),
+            # Only get images belonging to us.  There's a ton of public AMIs
+            # that are definitely irrelevant.
+            list_images=lambda: driver.list_images(ex_owner="self"),
+            get_tags=cls._get_tags,
         )
+        # The sizes offered may have changed since the last reconfig.
+        get_size_cache(driver).invalidate()
 
-        return cls(driver=driver, region=region, **kwargs)
+        return cls(
+            driver=driver, region=region, image_catalog=image_catalog,
+            **kwargs)
+
+    @staticmethod
+    def _get_tags(image):
+        return image.extra['tags']
 
     def log_failure_arguments(self):
         return dict(
@@ -363,22 +935,66 @@ class EC2CloudDriver(object):
             zulip_subject="EC2 Instances"
         )
 
+    def _list_instances(self, states, **tags):
+        nodes = self.driver.list_nodes(ex_filters={
+            'tag:' + key: value for (key, value) in tags.items()})
+        return [node for node in nodes if node.state in states]
+
+    def find_instances(self):
+        from libcloud.compute.types import NodeState
+        return [
+            (get_node_image_metadata(self, node.extra['image_id']), node)
+            for node in self._list_instances(
+                (NodeState.RUNNING, NodeState.PENDING, NodeState.STOPPED),
+                Class=self.instance_tags['Class'],
+                Buildmaster=self.instance_tags['Buildmaster'],
+            )
+        ]
+
+    def list_buildmaster_instances(self):
+        from libcloud.compute.types import NodeState
+        return self._list_instances(
+            (NodeState.RUNNING, NodeState.PENDING, NodeState.STOPPING,
+             NodeState.STOPPED),
+            Buildmaster=self.instance_tags['Buildmaster'])
+
+    def stop_retained(self, node):
+        self.driver.ex_stop_node(node)
+
+    def is_stopped(self, node):
+        from libcloud.compute.types import NodeState
+        nodes = self.driver.list_nodes(ex_node_ids=[node.id])
+        if not nodes or nodes[0].state == NodeState.TERMINATED:
+            raise ValueError("Unknown node.", node.id)
+        return nodes[0].state == NodeState.STOPPED
+
+    def resume(self, node):
+        self.driver.ex_start_node(node)
+        return (get_node_image_metadata(self, node.extra['image_id']), node)
+
+    def destroy_instances(self, nodes):
+        """
+        Terminate all the nodes with a single ``TerminateInstances`` call.
+        """
+        def terminate(driver):
+            params = {'Action': 'TerminateInstances'}
+            for i, node in enumerate(nodes, 1):
+                params['InstanceId.%d' % (i,)] = node.id
+            driver.connection.request(driver.path, params=params)
+        if nodes:
+            self.driver.with_driver('destroy_node', terminate)
+
     def get_image(self):
         log.msg(
             format="Getting image for %(image_id)s; required tags %(tags)s",
             image_id=self.image_id, tags=self.image_tags,
         )
-        return get_newest_tagged_image(
-            # Only get images belonging to us.  There's a ton of public AMIs
-            # that are definitely irrelevant.
-            images=self.driver.list_images(ex_owner="self"),
-            name=self.image_id,
-            tags=self.image_tags,
-            get_tags=lambda image: image.extra['tags'],
-        )
+        return self.image_catalog.index().newest(
+            self.image_id, self.image_tags)
 
-    def get_image_metadata(self):
-        image = self.get_image()
+    def get_image_metadata(self, image=None):
+        if image is None:
+            image = self.get_image()
 
         image_metadata = {
             'image_id': image.id,
@@ -387,33 +1003,73 @@ class EC2CloudDriver(object):
         image_metadata.update(image.extra['tags'])
         return image_metadata
 
-    @retry_on_request_limit
-    def create(self):
+    def create(self, image=None):
         """
         Create and start a new EC2 instance.
 
-        All parameters are fixed to the values used to initialize this driver.
+        All other parameters are fixed to the values used to initialize this
+        driver.
+
+        :param image: The libcloud image to use, or ``None`` to look it up.
+        """
+        return self.create_group([self], image)[0]
+
+    def launch_group(self):
+        return (
+            self.driver, self.image_id, frozenset(self.image_tags.items()),
+            self.instance_type, self.keypair_name, self.security_name,
+            self.user_data, self.instance_tags['Buildmaster'],
+        )
+
+    def create_group(self, drivers, image=None):
         """
+        Launch the instances for several buildslaves with one
+        ``RunInstances`` call.
+
+        Every instance is launched with the tags of this driver's buildslave,
+        and the others are tagged with their own buildslave's after launch.
+        If that fails, the instances can't be adopted, and the reaper
+        destroys them.
+        """
+        size = None
         try:
-            image = self.get_image()
-            return self.driver.create_node(
+            size = get_size(self.driver, self.instance_type)
+            if image is None:
+                image = self.get_image()
+            nodes = self.driver.create_node(
                 name=self.name,
-                size=get_size(self.driver, self.instance_type),
+                size=size,
                 image=image,
                 ex_keyname=self.keypair_name,
-                ex_userdata=self.user_data,
+                ex_userdata=buildslave_user_data(
+                    self.user_data,
+                    [(driver.name, driver.password) for driver in drivers]),
                 ex_metadata=self.instance_tags,
                 ex_securitygroup=[self.security_name],
+                ex_mincount=len(drivers),
+                ex_maxcount=len(drivers),
             )
         except Exception as e:
             if "RequestLimitExceeded" in e.message:
                 raise RequestLimitExceeded()
+            if size is not None:
+                size_rejected(self.driver, self.instance_type, e)
             raise
+        if not isinstance(nodes, list):
+            nodes = [nodes]
+        nodes.sort(key=lambda node: node.extra['launch_index'])
+        for driver, node in zip(drivers, nodes)[1:]:
+            self.driver.ex_create_tags(node, {
+                'Name': driver.name,
+                'Class': driver.instance_tags['Class'],
+            })
+            node.name = driver.name
+        return nodes
 
 
 @attributes(
-    ['driver', 'name', 'flavor', 'keypair_name', 'image_id', 'image_tags',
-     'instance_tags', 'user_data', 'region']
+    ['driver', 'name', 'password', 'flavor', 'keypair_name', 'image_id',
+     'image_tags', 'instance_tags', 'user_data', 'region', 'image_catalog']
 )
 @implementer(ICloudDriver)
 class RackspaceCloudDriver(object):
@@ -433,7 +1089,7 @@ class RackspaceCloudDriver(object):
     def from_driver_parameters(
             cls, region, username, api_key, **kwargs):
         """
-        Create an ``Rackspace`` libcloud ``NodeDriver`` using the supplied
+        Get the shared ``Rackspace`` libcloud ``NodeDriver`` for the supplied
         region and credentials and supply that as the ``driver`` for
         ``RackspaceCloudDriver`` along with all the other keyword arguments it
         requires.
@@ -446,29 +1102,48 @@ class RackspaceCloudDriver(object):
         """
         from libcloud.compute.providers import get_driver, Provider
         rackspace = get_driver(Provider.RACKSPACE)
-        driver = rackspace(username, api_key, region)
-        return cls(driver=driver, region=region, **kwargs)
+        driver = get_shared_driver(
+            provider=Provider.RACKSPACE,
+            region=region,
+            credentials=(username, api_key),
+            factory=lambda: rackspace(username, api_key, region),
+        )
+        image_catalog = get_image_catalog(
+            key=(Provider.RACKSPACE, region, username),
+            list_images=driver.list_images,
+            get_tags=cls._get_tags,
+        )
+        # The sizes offered may have changed since the last reconfig.
+        get_size_cache(driver).invalidate()
+        return cls(
+            driver=driver, region=region, image_catalog=image_catalog,
+            **kwargs)
+
+    @staticmethod
+    def _get_tags(image):
+        return image.extra['metadata']
 
     def get_image(self):
-        return get_newest_tagged_image(
-            images=self.driver.list_images(),
-            name=self.image_id,
-            tags=self.image_tags,
-            get_tags=lambda image: image.extra['metadata'],
-        )
+        return self.image_catalog.index().newest(
+            self.image_id, self.image_tags)
 
-    @retry_on_request_limit
-    def create(self):
+    def create(self, image=None):
         """
         Create and start a new Rackspace Cloud Server.
 
-        All parameters are fixed to the values used to initialize this driver.
+        All other parameters are fixed to the values used to initialize this
+        driver.
+
+        :param image: The libcloud image to use, or ``None`` to look it up.
         """
+        size = None
         try:
-            image = self.get_image()
+            size = get_size(self.driver, self.flavor)
+            if image is None:
+                image = self.get_image()
             return self.driver.create_node(
                 name=self.name,
-                size=get_size(self.driver, self.flavor),
+                size=size,
                 image=image,
 
                 ex_keyname=self.keypair_name,
@@ -477,15 +1152,19 @@ class RackspaceCloudDriver(object):
                 # If you don't turn on the config drive then your user data
                 # gets tossed in a black hole.
                 ex_config_drive=True,
-                ex_userdata=self.user_data,
+                ex_userdata=buildslave_user_data(
+                    self.user_data, [(self.name, self.password)]),
             )
         except Exception as e:
             if "Request Entity Too Large OverLimit Retry" in e.message:
                 raise RequestLimitExceeded()
+            if size is not None:
+                size_rejected(self.driver, self.flavor, e)
             raise
 
-    def get_image_metadata(self):
-        image = self.get_image()
+    def get_image_metadata(self, image=None):
+        if image is None:
+            image = self.get_image()
         image_metadata = {
             'image_id': image.id,
             'image_name': image.name,
@@ -500,6 +1179,39 @@ class RackspaceCloudDriver(object):
             zulip_subject="Rackspace Instances"
         )
 
+    def _list_instances(self, **tags):
+        from libcloud.compute.types import NodeState
+        return [
+            node for node in self.driver.list_nodes()
+            if node.state in (NodeState.RUNNING, NodeState.PENDING)
+            and all(node.extra['metadata'].get(key) == value
+                    for key, value in tags.items())
+        ]
+
+    def find_instances(self):
+        return [
+            (get_node_image_metadata(self, node.extra['imageId']), node)
+            for node in self._list_instances(
+                Class=self.instance_tags['Class'],
+                Buildmaster=self.instance_tags['Buildmaster'],
+            )
+        ]
+
+    def list_buildmaster_instances(self):
+        return self._list_instances(
+            Buildmaster=self.instance_tags['Buildmaster'])
+
+    def destroy_instances(self, nodes):
+        """
+        Destroy the nodes one at a time; Rackspace has no call to destroy
+        several servers at once.
+        """
+        for node in nodes:
+            try:
+                node.destroy()
+            except Exception:
+                log.err(None, "while destroying %s" % (node.id,))
+
 
 def get_image_tags(credentials):
     """
@@ -527,8 +1239,11 @@ def rackspace_slave(
     :return: An ``OnDemandBuildSlave`` that uses a ``RackspaceCloudDriver`` for
         creating and destroying new buildslave nodes.
     """
+    if config.get('retain', False):
+        config_error("%s: Rackspace nodes can't be retained." % (name,))
     driver = RackspaceCloudDriver.from_driver_parameters(
         name=name,
+        password=password,
         flavor='general1-8',
         region=credentials["region"],
         keypair_name=credentials["keyname"],
@@ -546,10 +1261,12 @@ def rackspace_slave(
     )
     instance_booter = InstanceBooter(
         driver=driver,
+        slave_class=name,
     )
     return OnDemandBuildSlave(
         password=password,
         instance_booter=instance_booter,
+        slave_class=name,
         build_wait_timeout=build_wait_timeout,
         keepalive_interval=keepalive_interval,
         max_builds=max_builds,
@@ -573,6 +1290,7 @@ def ec2_slave(
 
         # Other
         name=name,
+        password=password,
         instance_type=config['instance_type'],
         keypair_name=keypair_name,
         security_name=security_name,
@@ -586,12 +1304,16 @@ def ec2_slave(
             'Buildmaster': buildmaster
         }
     )
+    slave_class = name.rsplit('/', 1)[0]
     instance_booter = InstanceBooter(
-        driver=driver
+        driver=driver,
+        slave_class=slave_class,
+        retain=config.get('retain', False),
     )
     return OnDemandBuildSlave(
         password=password,
         instance_booter=instance_booter,
+        slave_class=slave_class,
         build_wait_timeout=build_wait_timeout,
         keepalive_interval=keepalive_interval,
         max_builds=max_builds,
@@ -32,13 +32,14 @@ objects and 6 classes
 
 This implements a simpler scheme, which acts like a regular slave, but watches
 buildbot's state to start and stop the slave.
-- When a build request comes in for a builder the slave is allocated to,
-  start this slave.
-- Poll for existing requests for builders the slave is allocated to.
-  (This catches the case where there are existing requests, and probably
-  also the case where a build failed).
+- When there are build requests that the running slaves can't take, a
+  ``flocker_bb.autoscale.Autoscaler`` starts just enough slaves to take them.
+- When the buildmaster starts, adopt any node left running for this slave
+  by the previous buildmaster process, rather than booting a new one.
 - Keep track of the builders using this slave, and stop the slave
-  after it has been idle for a specified amount of time.
+  after it has been idle for a specified amount of time (or one chosen by a
+  ``flocker_bb.idle_timeout.AdaptiveIdleTimeout``), unless a
+  ``flocker_bb.warm_pool.WarmPool`` wants it kept running.
 
 The starting and stopping of the node is handled in flocker_bb.ec2,
 using an explicit state machine.
@@ -48,8 +49,9 @@ A few other changes are required to make this work well.
 
 - Since buildbot doesn't know these slaves are latent, it will schedule all
   builds on the first slave to connect. To handle this, we monkeypatch
-  ``BotMaster.maybeStartBuildsForSlave`` to wait 10s before starting builds on
-  a newly connected slave.
+  ``BotMaster.maybeStartBuildsForSlave`` to wait, before starting builds on a
+  newly connected slave, for other slaves for the same builders which are
+  predicted to connect soon (see ``flocker_bb.distribute``).
 - Only latent slaves receive a ``buildStarted`` call. We monkeypatch
   ``SlaveBuilder.buildStarted`` to call ``buildStarted`` if it exists.
 - Since buildbot doesn't know these slaves are latent, the builders page
@@ -58,9 +60,8 @@ A few other changes are required to make this work well.
 
 """
 
-from twisted.application.internet import TimerService
-from twisted.internet import defer
 from twisted.internet import reactor
+from twisted.python import log
 
 from buildbot.buildslave.base import BuildSlave
 from buildbot import config
@@ -68,7 +69,9 @@ from buildbot import config
 from machinist import WrongState
 from eliot import start_action
 from eliot.twisted import DeferredContext
+from prometheus_client import Counter, Histogram
 
+from .distribute import attach_times
 from .util import timeoutDeferred
 
 
@@ -82,6 +85,54 @@ class OnDemandBuildSlave(BuildSlave):
 
     build_wait_timer = None
 
+    # A one-argument callable, asked whether this slave should be kept running
+    # once it has been idle for ``build_wait_timeout``.  This is set by
+    # ``flocker_bb.warm_pool.WarmPool``.
+    keep_warm = None
+
+    # Chooses how long this slave is kept running once idle, instead of
+    # ``build_wait_timeout``.  This is set by
+    # ``flocker_bb.idle_timeout.AdaptiveIdleTimeout``.
+    idle_timeout = None
+
+    # When this slave last became idle, if it is idle.
+    idle_since = None
+
+    # Why the running instance was started ("demand" or "warm"), until the
+    # first build on it starts.
+    boot_reason = None
+
+    # A ``Deferred`` which fires once any node left running by a previous
+    # buildmaster process has been adopted.
+    reconciling = None
+
+    # Whether the running instance was started by this slave, and the slave
+    # hasn't attached since.
+    awaiting_attach = False
+
+    # When the running instance was started, while ``awaiting_attach``.
+    boot_started = None
+
+    # Whether the slave is being shut down because it is idle, so that its
+    # node can be retained when it detaches.
+    stopping_idle = False
+
+    attach_durations = Histogram(
+        'ondemand_attach_seconds',
+        'Time from an on-demand instance becoming active until its slave '
+        'attached.',
+        labelnames=['slave_class'],
+        namespace='buildbot',
+        buckets=(5, 10, 20, 30, 60, 90, 120, 180, 300, 600, 1200),
+    )
+
+    first_builds = Counter(
+        'ondemand_first_builds_total',
+        'Number of first builds on newly started on-demand slaves.',
+        labelnames=['slave_class', 'boot_reason'],
+        namespace='buildbot',
+    )
+
     def __init__(self,
                  password,
 
@@ -89,6 +140,7 @@ class OnDemandBuildSlave(BuildSlave):
                  instance_booter,
                  build_wait_timeout=60 * 10,
                  keepalive_interval=None,
+                 slave_class=None,
 
                  # Generic stuff for the base class
                  max_builds=None, notify_on_missing=[],
@@ -106,6 +158,9 @@ class OnDemandBuildSlave(BuildSlave):
             config.error("%s: %s: Can't wait for negative time."
                          % (self.__class__, name))
         self.build_wait_timeout = build_wait_timeout
+        if slave_class is None:
+            slave_class = name
+        self.slave_class = slave_class
         # Uggh
         if keepalive_interval is not None:
             self.keepalive_interval = keepalive_interval
@@ -114,11 +169,18 @@ class OnDemandBuildSlave(BuildSlave):
 
         self.instance_booter = instance_booter
 
-        self.addService(TimerService(60, self.periodic))
-
     def buildStarted(self, sb):
         self._clearBuildWaitTimer()
+        if self.idle_since is not None:
+            if self.idle_timeout is not None:
+                self.idle_timeout.reused(
+                    self, reactor.seconds() - self.idle_since)
+            self.idle_since = None
         self.building.add(sb.builder_name)
+        if self.boot_reason is not None:
+            self.first_builds.labels(
+                self.slave_class, self.boot_reason).inc()
+            self.boot_reason = None
 
     def buildFinished(self, sb):
         BuildSlave.buildFinished(self, sb)
@@ -137,6 +199,14 @@ class OnDemandBuildSlave(BuildSlave):
             self.build_wait_timer = None
 
     def attached(self, bot):
+        self.stopping_idle = False
+        if self.awaiting_attach:
+            self.awaiting_attach = False
+            self.attach_durations.labels(self.slave_class).observe(
+                self.instance_booter.time_in_state())
+            attach_times.observe(
+                self.slave_class, reactor.seconds() - self.boot_started)
+            self.boot_started = None
         d = BuildSlave.attached(self, bot)
 
         def set_metadata_and_timer(result):
@@ -176,6 +246,10 @@ class OnDemandBuildSlave(BuildSlave):
 
         https://clusterhq.atlassian.net/browse/FLOC-1938
         """
+        # A slave which is stopping isn't about to attach.
+        self.awaiting_attach = False
+        self.stopping_idle = True
+        self.boot_started = None
         with start_action(
                 action_type="ondemand_slave:stop_instance",
                 slave=self.slavename,
@@ -190,39 +264,69 @@ class OnDemandBuildSlave(BuildSlave):
             d.addBoth(lambda _: self.instance_booter.stop())
             d.addActionFinish()
 
+    def startInstance(self, reason="demand"):
+        """
+        Start the instance for this slave, if it isn't already running.
+
+        :param reason: Why the instance is being started; either "demand" or
+            "warm".
+        """
+        if self.reconciling is not None:
+            # Don't start a new node if there is one to adopt.
+            self.reconciling.addCallback(
+                lambda _: self.startInstance(reason))
+            return
+        if self.instance_booter.start():
+            self.boot_reason = reason
+            self.awaiting_attach = True
+            self.boot_started = reactor.seconds()
+
     def detached(self, mind):
         BuildSlave.detached(self, mind)
+        self.idle_since = None
         # If the slave disconnects, assuming it is a problem with the instance,
-        # and stop it.
-        self.instance_booter.stop()
+        # and stop it.  Only a node shut down because it was idle is known to
+        # be healthy enough to be retained.
+        self.instance_booter.stop(retain=self.stopping_idle)
 
     def _setBuildWaitTimer(self):
         self._clearBuildWaitTimer()
+        if self.idle_since is None:
+            self.idle_since = reactor.seconds()
+        if self.idle_timeout is not None:
+            timeout = self.idle_timeout.timeout(self)
+        else:
+            timeout = self.build_wait_timeout
         self.build_wait_timer = reactor.callLater(
-            self.build_wait_timeout, self._stopInstance)
+            timeout, self._buildWaitTimedOut)
+
+    def _buildWaitTimedOut(self):
+        self.build_wait_timer = None
+        if self.keep_warm is not None and self.keep_warm(self):
+            self._setBuildWaitTimer()
+        else:
+            self._stopInstance()
 
-    def requestSubmitted(self, request):
-        builder_names = [b.name for b in
-                         self.botmaster.getBuildersForSlave(self.slavename)]
-        if request['buildername'] in builder_names:
-            self.instance_booter.start()
+    def _reconcile(self):
+        """
+        Adopt any node left running by a previous buildmaster process, so
+        that it doesn't have to be booted again.
+        """
+        def adopted(result):
+            self.reconciling = None
+            if result:
+                self._setBuildWaitTimer()
+
+        def failed(f):
+            self.reconciling = None
+            log.err(f, "while looking for a node to adopt for %s"
+                    % (self.slavename,))
+
+        d = self.reconciling = self.instance_booter.reconcile()
+        d.addCallbacks(adopted, failed)
 
     def startService(self):
+        # Nodes are deliberately left running when the buildmaster shuts
+        # down, so that the next buildmaster process can adopt them.
+        self._reconcile()
         BuildSlave.startService(self)
-
-        self._shutdown_callback_handle = reactor.addSystemEventTrigger(
-            'before', 'shutdown', self._stopInstance)
-
-        self.master.subscribeToBuildRequests(self.requestSubmitted)
-
-    @defer.inlineCallbacks
-    def periodic(self):
-        build_reqs = yield self.master.db.buildrequests.getBuildRequests(
-            claimed=False)
-        pending_builders = set([
-            br['buildername'] for br in build_reqs])
-        our_builders = set([
-            b.name for b in
-            self.botmaster.getBuildersForSlave(self.slavename)])
-        if pending_builders & our_builders:
-            self.instance_booter.start()
@@ -22,6 +22,7 @@ from buildbot.status.results import (
     SUCCESS, EXCEPTION, FAILURE, WARNINGS, RETRY)
 
 from flocker_bb.buildset_status import BuildsetStatusReceiver
+from flocker_bb.coalesce import sourceStampRevisions, supersededDescription
 from characteristic import attributes, Attribute
 
 
@@ -41,6 +42,9 @@ class GitHubStatus(BuildsetStatusReceiver):
       the buildset.
     - When a build start, report status building.
     - When a build stops, report status finished.
+    - When a build request is superseded by a newer one, report status
+      error, naming the newer revision.  The superseded revision wasn't
+      built, so it mustn't be reported as passing.
 
     :ivar codebase: Codebase to report status for.
     :ivar failing_builders: List of builders for which results shouldn't
@@ -142,6 +146,19 @@ class GitHubStatus(BuildsetStatusReceiver):
             return
         request['sha'] = sha
 
+        superseded_by = build.getProperty('superseded-by')
+        if superseded_by:
+            # The revision wasn't built, so it can't be reported as passing.
+            request.update({
+                'state': 'error',
+                'target_url': self.parent.getURLForThing(build),
+                'description': supersededDescription(
+                    superseded_by, self.codebase),
+                'context': self._simplifyBuilderName(builderName)
+                })
+            self._sendStatus(request)
+            return
+
         STATE = {
             SUCCESS: "success",
             WARNINGS: "success",
@@ -215,6 +232,36 @@ class GitHubStatus(BuildsetStatusReceiver):
             })
             self._sendStatus(r)
 
+    def requestSuperseded(self, builderName, sourceStamps, newer):
+        """
+        Notify this receiver that a build request was dropped, because a
+        newer one for the same branch was submitted.
+
+        Reports an error to github for the dropped revision, since it won't
+        be built, naming the revision which superseded it.
+
+        :param list sourceStamps: The source stamp dictionaries of the
+            dropped request.
+        :param list newer: The source stamp dictionaries of the request which
+            superseded it.
+        """
+        if (not builderName.startswith(self.codebase)
+                or builderName in self.failing_builders):
+            return
+
+        request = self._getSourceStampData(sourceStamps)
+        if 'sha' not in request:
+            return
+
+        request.update({
+            'state': 'error',
+            'description': supersededDescription(
+                sourceStampRevisions(newer), self.codebase),
+            'context': self._simplifyBuilderName(builderName)
+            })
+
+        self._sendStatus(request)
+
 
 def createGithubStatus(codebase, token, failing_builders):
     return GitHubStatus(codebase=codebase, token=token,
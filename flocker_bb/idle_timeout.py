@@ -0,0 +1,168 @@
+"""
+Choose how long idle on-demand buildslaves are kept running from how often
+build requests arrive for them.
+"""
+
+from __future__ import absolute_import
+
+from collections import deque
+
+from characteristic import attributes, Attribute
+from twisted.internet import reactor
+
+from buildbot.status.base import StatusReceiverMultiService
+
+from prometheus_client import Counter, Gauge
+
+
+@attributes([
+    Attribute('minimum', default_value=5 * 60),
+    Attribute('maximum', default_value=50 * 60),
+    Attribute('window', default_value=60 * 60),
+    Attribute('multiplier', default_value=3),
+])
+class IdleTimeoutConfiguration(object):
+    """
+    How long to keep idle slaves of a slave class running.
+
+    :ivar minimum: The shortest time (in seconds) to keep an idle slave.
+    :ivar maximum: The longest time (in seconds) to keep an idle slave.
+    :ivar window: How far back (in seconds) to look at request arrivals.
+    :ivar multiplier: How many mean request inter-arrival times a slave
+        should be able to wait for another request.
+    """
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Create an ``IdleTimeoutConfiguration`` from the ``idle_timeout``
+        section of a slave in ``config.yml``.
+        """
+        return cls(**{
+            key: config[key]
+            for key in ('minimum', 'maximum', 'window', 'multiplier')
+            if key in config
+        })
+
+    def timeout(self, arrivals):
+        """
+        Choose how long to keep an idle slave running.
+
+        Slaves are kept running longer the busier their slave class is.  The
+        slave is expected to wait ``multiplier`` mean inter-arrival times for
+        another request.  If that is longer than ``maximum``, it isn't worth
+        keeping the slave running and it waits ``minimum``; if it is shorter
+        than ``minimum``, the slave waits ``maximum``.  In between, the
+        timeout rises smoothly from ``minimum`` to ``maximum``, so more
+        arrivals never give a shorter timeout.
+
+        :param int arrivals: The number of requests which arrived within the
+            last ``window`` seconds.
+        :return: The idle timeout, in seconds.
+        """
+        if not arrivals:
+            return self.minimum
+        wait = self.multiplier * float(self.window) / arrivals
+        timeout = self.minimum * float(self.maximum) / wait
+        return min(self.maximum, max(self.minimum, timeout))
+
+
+class AdaptiveIdleTimeout(StatusReceiverMultiService):
+    """
+    Set the build wait timeout of on-demand buildslaves from the recent rate
+    of build requests for their slave class.
+
+    When requests arrive often, idle slaves are kept running long enough to
+    take the next one, rather than being stopped and booted again.  When they
+    are rare, idle slaves are stopped quickly.
+    """
+
+    timeout_gauge = Gauge(
+        'idle_timeout_seconds',
+        'The most recently chosen idle timeout.',
+        labelnames=['slave_class'],
+        namespace='buildbot',
+    )
+
+    boots_avoided = Counter(
+        'idle_timeout_boots_avoided_total',
+        'Number of builds started on slaves idle for longer than the minimum '
+        'idle timeout, which would otherwise have needed a slave booted.',
+        labelnames=['slave_class'],
+        namespace='buildbot',
+    )
+
+    def __init__(self, poller, timeouts, _reactor=reactor):
+        """
+        :param PendingRequestPoller poller: The poller for the pending build
+            requests, used to find the slaves allocated to a builder.
+        :param dict timeouts: Map slave class names to
+            ``IdleTimeoutConfiguration``s.
+        """
+        StatusReceiverMultiService.__init__(self)
+        self.poller = poller
+        self.timeouts = timeouts
+        self._reactor = _reactor
+        self._arrivals = {
+            slave_class: deque() for slave_class in timeouts}
+
+    def startService(self):
+        self.status = self.parent
+        self.master = self.status.master
+        StatusReceiverMultiService.startService(self)
+        for slave in self._slaves():
+            slave.idle_timeout = self
+        self._subscription = self.master.subscribeToBuildRequests(
+            self.requestSubmitted)
+
+    def stopService(self):
+        self._subscription.unsubscribe()
+        for slave in self._slaves():
+            if slave.idle_timeout is self:
+                slave.idle_timeout = None
+        return StatusReceiverMultiService.stopService(self)
+
+    def _slaves(self):
+        return [
+            slave for slave in self.master.botmaster.slaves.values()
+            if getattr(slave, 'slave_class', None) in self.timeouts
+        ]
+
+    def _recent(self, slave_class):
+        """
+        :return: The arrival times of requests for ``slave_class`` within its
+            window.
+        """
+        arrivals = self._arrivals[slave_class]
+        horizon = self._reactor.seconds() - self.timeouts[slave_class].window
+        while arrivals and arrivals[0] < horizon:
+            arrivals.popleft()
+        return arrivals
+
+    def requestSubmitted(self, request):
+        now = self._reactor.seconds()
+        slave_classes = set(
+            slave.slave_class
+            for slave in self.poller.slaves.get(request['buildername'], [])
+        )
+        for slave_class in slave_classes & set(self.timeouts):
+            self._arrivals[slave_class].append(now)
+
+    def timeout(self, slave):
+        """
+        :return: How long (in seconds) ``slave`` should be kept running once
+            idle.
+        """
+        slave_class = slave.slave_class
+        timeout = self.timeouts[slave_class].timeout(
+            len(self._recent(slave_class)))
+        self.timeout_gauge.labels(slave_class).set(timeout)
+        return timeout
+
+    def reused(self, slave, idle):
+        """
+        Note that a build started on ``slave`` after it was idle for ``idle``
+        seconds.
+        """
+        if idle > self.timeouts[slave.slave_class].minimum:
+            self.boots_avoided.labels(slave.slave_class).inc()
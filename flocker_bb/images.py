@@ -0,0 +1,225 @@
+"""
+Shared caches of the images available to on-demand buildslaves.
+
+Every ``ICloudDriver`` needs to find the newest image for its buildslave
+whenever a node is booted.  Listing the images of an account is expensive and
+rate limited, so the listing is shared between all the drivers using the same
+account and region, and only refreshed periodically.
+"""
+
+from __future__ import absolute_import
+
+import time
+from collections import defaultdict
+from threading import Condition, Lock
+
+from twisted.internet import reactor
+from twisted.python import log
+
+from flocker_bb.threadpool import deferToCloudThread
+
+# A metadata key name which can be found in image metadata.  This metadata
+# items identifies the general purpose of the image.  It may not be unique if
+# multiple versions of the image have been created.  It corresponds to the
+# names used in the manifest.yml file used to build the images.
+BASE_NAME_TAG = "base_name"
+
+
+class ImageIndex(object):
+    """
+    An index of images by ``base_name`` tag, which answers "what is the newest
+    image with this name and these tags" without scanning every image.
+
+    The answer for each (name, required tags) pair is computed once, from only
+    the images with that name, and remembered.
+
+    :ivar get_tags: A one-argument callable which returns the tags on an image.
+    """
+
+    def __init__(self, images, get_tags):
+        self.get_tags = get_tags
+        self._by_name = defaultdict(list)
+        self._by_id = {}
+        for image in images:
+            tags = get_tags(image)
+            self._by_name[tags.get(BASE_NAME_TAG)].append((tags, image))
+            self._by_id[image.id] = image
+        self._count = len(images)
+        self._newest = {}
+        self._lock = Lock()
+
+    def __len__(self):
+        return self._count
+
+    def names(self):
+        """
+        :return: The ``base_name`` tags of the indexed images.
+        """
+        return self._by_name.keys()
+
+    def images(self, base_name):
+        """
+        :param bytes base_name: The ``base_name`` tag to look for.
+        :return: A ``list`` of the images with the given ``base_name`` tag.
+        """
+        return [image for (tags, image) in self._by_name.get(base_name, [])]
+
+    def get(self, image_id):
+        """
+        :param bytes image_id: The id of an image.
+        :return: The image with the given id, or ``None``.
+        """
+        return self._by_id.get(image_id)
+
+    def _find_newest(self, name, required):
+        newest = None
+        newest_timestamp = None
+        for tags, image in self._by_name.get(name, []):
+            if all(tags.get(key) == value for key, value in required):
+                timestamp = tags.get('timestamp')
+                if newest is None or timestamp > newest_timestamp:
+                    newest, newest_timestamp = image, timestamp
+        return newest
+
+    def newest(self, name, tags):
+        """
+        Return the newest image with a matching name and tags.
+
+        :param bytes name: An image name to match.
+        :param dict tags: Extra tags which should be present on the image.
+        :return: The newest matching image.
+        :raises ValueError: If no image matches.
+        """
+        required = frozenset(tags.items())
+        key = (name, required)
+        with self._lock:
+            if key not in self._newest:
+                self._newest[key] = self._find_newest(name, required)
+            image = self._newest[key]
+        log.msg(
+            format="Newest of %(candidates)d/%(count)d images named "
+                   "%(name)s with tags %(required)s is %(image_id)s",
+            candidates=len(self._by_name.get(name, [])), count=self._count,
+            name=name, required=tags,
+            image_id=image.id if image is not None else None,
+        )
+        if image is None:
+            raise ValueError("Unknown image.", name)
+        return image
+
+
+class ImageCatalog(object):
+    """
+    An ``ImageIndex`` of the images belonging to a single cloud account and
+    region.
+
+    The listing is reloaded synchronously once it is older than ``ttl``.  Once
+    it is older than ``refresh_after`` (but still younger than ``ttl``), the
+    cached listing is returned and a reload is started in the background, so
+    that in the common case looking up an image doesn't list images at all.
+
+    This is used from threadpool threads, so all access to the cached
+    listing is serialized.  Only one thread lists the images at a time; any
+    others needing a fresh listing wait for it.
+
+    :ivar list_images: A no-argument callable returning libcloud images.
+    :ivar get_tags: A one-argument callable which returns the tags on an image.
+    """
+
+    def __init__(self, list_images, get_tags, ttl=15 * 60,
+                 refresh_after=5 * 60, clock=time.time, _reactor=reactor):
+        self.list_images = list_images
+        self.get_tags = get_tags
+        self.ttl = ttl
+        self.refresh_after = refresh_after
+        self._clock = clock
+        self._reactor = _reactor
+        self._lock = Lock()
+        self._refreshed = Condition(self._lock)
+        self._index = None
+        self._loaded_at = None
+        self._refreshing = False
+
+    def refresh(self):
+        """
+        Reload the images from the cloud provider.
+
+        This blocks, so should be called in a thread.
+        """
+        try:
+            index = ImageIndex(self.list_images(), self.get_tags)
+        except Exception:
+            with self._lock:
+                self._refreshing = False
+                self._refreshed.notify_all()
+            raise
+        log.msg(
+            format="Loaded %(count)d images (%(names)d base names)",
+            count=len(index), names=len(index.names()),
+        )
+        with self._lock:
+            self._index = index
+            self._loaded_at = self._clock()
+            self._refreshing = False
+            self._refreshed.notify_all()
+
+    def _refreshInBackground(self):
+        d = deferToCloudThread(self.refresh)
+        d.addErrback(log.err, "while refreshing image catalog")
+
+    def index(self):
+        """
+        Return the current index of images.
+
+        This may block (the first time, or if the cache has expired), so
+        should be called in a thread.
+
+        :return: An ``ImageIndex``.
+        """
+        start_background = refresh_now = False
+        with self._lock:
+            while True:
+                if self._loaded_at is not None:
+                    age = self._clock() - self._loaded_at
+                    if age < self.ttl:
+                        start_background = (
+                            age >= self.refresh_after
+                            and not self._refreshing)
+                        break
+                if not self._refreshing:
+                    refresh_now = True
+                    break
+                # Wait for the listing in progress, rather than starting
+                # another one.
+                self._refreshed.wait()
+            if start_background or refresh_now:
+                self._refreshing = True
+        if refresh_now:
+            self.refresh()
+        elif start_background:
+            self._reactor.callFromThread(self._refreshInBackground)
+        with self._lock:
+            return self._index
+
+
+_catalogs = {}
+_catalogs_lock = Lock()
+
+
+def get_image_catalog(key, list_images, get_tags):
+    """
+    Return the ``ImageCatalog`` shared by all drivers using the same account
+    and region.
+
+    :param tuple key: Identifies the provider, region and account.
+    :param list_images: See ``ImageCatalog.list_images``; only used if
+        there is not already a catalog for ``key``.
+    :param get_tags: See ``ImageCatalog.get_tags``.
+    :return: An ``ImageCatalog``.
+    """
+    with _catalogs_lock:
+        catalog = _catalogs.get(key)
+        if catalog is None:
+            catalog = _catalogs[key] = ImageCatalog(
+                list_images=list_images, get_tags=get_tags)
+        return catalog
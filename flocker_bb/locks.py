@@ -0,0 +1,417 @@
+"""
+Master locks whose capacity adapts to how the cloud they guard copes, and
+instrumentation of how long builds wait for locks.
+
+The acceptance and functional storage tests make cloud API calls, and too
+many runs at once hit the provider's limits, while too few leave builds
+queued.  Rather than guessing a fixed ``maxCount``, an ``AdaptiveMasterLock``
+adjusts it additive-increase/multiplicative-decrease style: every successful
+build holding the lock lets one more build run per ``capacity`` builds, and a
+failed build whose output shows the provider throttling it halves the
+capacity.  Other failures leave the capacity alone.
+"""
+
+from __future__ import absolute_import
+
+import json
+import re
+from weakref import WeakKeyDictionary
+
+from twisted.internet import reactor
+from twisted.internet.threads import deferToThread
+from twisted.python import log
+from twisted.web.resource import Resource
+
+from buildbot.locks import MasterLock, RealMasterLock, RealSlaveLock
+from buildbot.status.base import StatusReceiverMultiService
+from buildbot.status.results import EXCEPTION, FAILURE, SUCCESS, WARNINGS
+from buildbot.util.eventual import eventually
+
+from prometheus_client import Gauge, Histogram
+
+# Messages cloud APIs respond with when an account exceeds its limits.
+THROTTLE_PATTERN = re.compile(
+    r'RequestLimitExceeded|Throttling|Rate exceeded|OverLimit|'
+    r'TooManyRequests')
+
+
+# How much of the end of each log to search for throttling errors.  The error
+# which failed a step is near the end of its log, and the logs of test runs
+# can be large.  Compressed logs still have to be decompressed up to their
+# end, so they are searched in a thread (see ``LockFeedback``).
+THROTTLE_SCAN_BYTES = 64 * 1024
+
+
+def logTail(logfile, size=THROTTLE_SCAN_BYTES):
+    """
+    This blocks, so should be called in a thread.
+
+    :param logfile: A ``LogFile``.
+    :param size: The number of bytes to read.
+    :return: The end of the file ``logfile`` is stored in.  This includes the
+        framing of each chunk of the log, which doesn't matter when searching
+        for messages.
+    """
+    f = logfile.getFile()
+    try:
+        try:
+            f.seek(0, 2)
+            f.seek(max(0, f.tell() - size))
+            return f.read()
+        except ValueError:
+            # Gzipped logs can't seek from the end.
+            f.seek(0)
+            tail = b''
+            for block in iter(lambda: f.read(size), b''):
+                tail = (tail + block)[-size:]
+            return tail
+    finally:
+        # The log's own file is still being written to.
+        if f is not logfile.openfile:
+            f.close()
+
+
+def throttled(build):
+    """
+    This reads log files, so should be called in a thread.
+
+    :param build: A ``BuildStatus``.
+    :return: Whether the end of the logs of a failed step of ``build`` show
+        the cloud provider throttling it.
+    """
+    for step in build.getSteps():
+        if step.getResults()[0] not in (FAILURE, EXCEPTION):
+            continue
+        for logfile in step.getLogs():
+            if THROTTLE_PATTERN.search(logTail(logfile)):
+                return True
+    return False
+
+
+class RealAdaptiveMasterLock(RealMasterLock):
+    """
+    The lock used by builds for an ``AdaptiveMasterLock``.
+
+    ``maxCount`` can drop below the number of current owners.  They keep the
+    lock until they finish, and nobody else gets it until there are fewer
+    owners than ``maxCount``.
+
+    :ivar float capacity: The number of builds allowed to hold the lock,
+        before rounding down to ``maxCount``.
+    """
+
+    capacity_gauge = Gauge(
+        'lock_capacity',
+        'Number of builds allowed to hold an adaptive lock at once.',
+        labelnames=['lock'],
+        namespace='buildbot',
+    )
+
+    def __init__(self, lockid):
+        RealMasterLock.__init__(self, lockid)
+        self.minimum = lockid.minimum
+        self.maximum = lockid.maximum
+        self.decrease = lockid.decrease
+        self._setCapacity(lockid.initial)
+
+    def _setCapacity(self, capacity):
+        self.capacity = min(self.maximum, max(self.minimum, capacity))
+        self.maxCount = int(self.capacity)
+        self.description = "<AdaptiveMasterLock(%s, %s)>" % (
+            self.name, self.maxCount)
+        self.capacity_gauge.labels(self.name).set(self.maxCount)
+
+    def _getOwnersCount(self):
+        num_excl = len([
+            owner for owner in self.owners if owner[1].mode == 'exclusive'])
+        return num_excl, len(self.owners) - num_excl
+
+    def succeeded(self):
+        """
+        A build holding the lock succeeded; let one more build hold it for
+        every ``capacity`` successes.
+
+        :return: Whether more builds can hold the lock than before.
+        """
+        previous = self.maxCount
+        self._setCapacity(self.capacity + 1.0 / self.capacity)
+        if self.maxCount > previous:
+            self._wakeWaiters()
+            return True
+        return False
+
+    def throttled(self):
+        """
+        A build holding the lock was throttled by the cloud provider.
+        """
+        self._setCapacity(self.capacity * self.decrease)
+
+    def _wakeWaiters(self):
+        for i, (owner, access, d) in enumerate(self.waiting):
+            if not self.isAvailable(owner, access):
+                break
+            if d:
+                self.waiting[i] = (owner, access, None)
+                eventually(d.callback, self)
+
+
+class AdaptiveMasterLock(MasterLock):
+    """
+    A ``MasterLock`` whose ``maxCount`` is adjusted between ``minimum`` and
+    ``maximum`` by ``LockFeedback``.
+
+    Like ``MasterLock``, the builds share the lock of every equal
+    ``AdaptiveMasterLock``, so its capacity is kept across reconfigs.
+
+    :ivar minimum: The fewest builds allowed to hold the lock at once.
+    :ivar maximum: The most builds allowed to hold the lock at once.
+    :ivar initial: How many builds are allowed to hold the lock at once,
+        before any have finished.
+    :ivar decrease: How much the capacity is multiplied by when a build is
+        throttled.
+    """
+
+    compare_attrs = ['name', 'maxCount', 'minimum', 'initial', 'decrease']
+    lockClass = RealAdaptiveMasterLock
+
+    def __init__(self, name, minimum, maximum, initial=None, decrease=0.5):
+        MasterLock.__init__(self, name, maxCount=maximum)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.initial = minimum if initial is None else initial
+        self.decrease = decrease
+
+
+class LockFeedback(StatusReceiverMultiService):
+    """
+    Adjust the capacity of the ``AdaptiveMasterLock``s held by builds, when
+    they finish.
+
+    Builds don't wait for builder locks; their requests stay pending until
+    the locks are available.  So when a lock grows, the builders using it are
+    told to start builds.
+
+    The logs of failed builds are searched for throttling errors in a
+    thread, so large or compressed logs don't block the reactor.
+    """
+
+    def __init__(self, _deferToThread=deferToThread):
+        StatusReceiverMultiService.__init__(self)
+        self._deferToThread = _deferToThread
+
+    def startService(self):
+        self.status = self.parent
+        self.master = self.status.master
+        StatusReceiverMultiService.startService(self)
+        self.status.subscribe(self)
+
+    def stopService(self):
+        self.status.unsubscribe(self)
+        return StatusReceiverMultiService.stopService(self)
+
+    def builderAdded(self, builderName, builder):
+        return self
+
+    def _adaptiveLocks(self, builderName):
+        botmaster = self.master.botmaster
+        builder = botmaster.builders.get(builderName)
+        if builder is None:
+            return []
+        lockids = [
+            getattr(access, 'lockid', access)
+            for access in builder.config.locks
+        ]
+        return [
+            botmaster.getLockByID(lockid) for lockid in lockids
+            if isinstance(lockid, AdaptiveMasterLock)
+        ]
+
+    def _startBuilds(self, locks):
+        botmaster = self.master.botmaster
+        for builderName in list(botmaster.builders):
+            if locks.intersection(self._adaptiveLocks(builderName)):
+                botmaster.maybeStartBuildsForBuilder(builderName)
+
+    def buildFinished(self, builderName, build, results):
+        locks = self._adaptiveLocks(builderName)
+        if not locks:
+            return
+        if results in (SUCCESS, WARNINGS):
+            grown = set(lock for lock in locks if lock.succeeded())
+            if grown:
+                self._startBuilds(grown)
+        elif results == FAILURE:
+            d = self._deferToThread(throttled, build)
+
+            def checked(was_throttled):
+                if was_throttled:
+                    for lock in locks:
+                        lock.throttled()
+            d.addCallback(checked)
+            d.addErrback(
+                log.err, "while checking %s for throttling" % (builderName,))
+
+
+class LockMetrics(object):
+    """
+    Time how long builds wait for locks, and count their holders and
+    waiters, by lock name.
+
+    Builds wait for a lock in two ways.  Builds (and steps) which find a lock
+    unavailable queue on it.  But ``NoFallBackBuildChooser`` doesn't start
+    builds until their builder's locks are available, so their requests stay
+    pending instead; the builder counts as waiting for the lock from when the
+    chooser first finds it unavailable, until the chooser finds it available.
+    A build claiming a lock is timed from when it, or its builder, started
+    waiting.
+
+    The methods are called by the lock classes, as patched by
+    ``flocker_bb.monkeypatch``.
+    """
+
+    wait_time = Histogram(
+        'lock_wait_seconds',
+        'Time builds waited to claim a lock.',
+        labelnames=['lock'],
+        namespace='buildbot',
+        buckets=(0, 1, 10, 30, 60, 300, 600, 1200, 1800, 3600, 7200),
+    )
+    holders = Gauge(
+        'lock_holders',
+        'Number of builds holding a lock.',
+        labelnames=['lock'],
+        namespace='buildbot',
+    )
+    waiters = Gauge(
+        'lock_waiters',
+        'Number of builds, and builders with pending requests, waiting for '
+        'a lock.',
+        labelnames=['lock'],
+        namespace='buildbot',
+    )
+
+    def __init__(self, _reactor=reactor):
+        self._reactor = _reactor
+        # Map locks to a dict mapping their waiters to when they started
+        # waiting, and whether they still are.
+        self._waiting = WeakKeyDictionary()
+
+    def _waiters(self, lock):
+        return self._waiting.setdefault(lock, {})
+
+    def waiting(self, lock, owner):
+        """
+        ``owner`` found ``lock`` unavailable.
+        """
+        waiters = self._waiters(lock)
+        since, still_waiting = waiters.get(
+            owner, (self._reactor.seconds(), False))
+        if not still_waiting:
+            self.waiters.labels(lock.name).inc()
+        waiters[owner] = (since, True)
+
+    def available(self, lock, owner):
+        """
+        ``owner`` found ``lock`` available, but hasn't claimed it yet.
+        """
+        waiters = self._waiters(lock)
+        if owner in waiters:
+            since, still_waiting = waiters[owner]
+            if still_waiting:
+                self.waiters.labels(lock.name).dec()
+            waiters[owner] = (since, False)
+
+    def stoppedWaiting(self, lock, owner):
+        """
+        ``owner`` gave up waiting for ``lock``.
+        """
+        self.available(lock, owner)
+        self._waiters(lock).pop(owner, None)
+
+    def blocked(self, lock, builderName):
+        """
+        The builder ``builderName`` can't start a build until ``lock`` is
+        available.
+        """
+        self.waiting(lock, ('builder', builderName))
+
+    def unblocked(self, lock, builderName):
+        """
+        ``lock`` is available to builds of ``builderName``.
+        """
+        self.available(lock, ('builder', builderName))
+
+    def claimed(self, lock, owner):
+        """
+        ``owner`` claimed ``lock``.
+        """
+        now = self._reactor.seconds()
+        started = [now]
+        keys = [owner]
+        builder = getattr(owner, 'builder', None)
+        if builder is not None:
+            keys.append(('builder', builder.name))
+        for key in keys:
+            if key in self._waiters(lock):
+                self.available(lock, key)
+                started.append(self._waiters(lock).pop(key)[0])
+        self.wait_time.labels(lock.name).observe(now - min(started))
+        self.holders.labels(lock.name).inc()
+
+    def released(self, lock, owner):
+        """
+        ``owner`` released ``lock``.
+        """
+        self.holders.labels(lock.name).dec()
+
+    def describe(self, botmaster):
+        """
+        :return: A ``list`` of ``dict``s describing the state of each lock
+            of ``botmaster``, and each per-slave lock of its slave locks.
+        """
+        now = self._reactor.seconds()
+        instances = []
+        for real in botmaster.locks.values():
+            if isinstance(real, RealSlaveLock):
+                instances.extend(sorted(real.locks.items()))
+            else:
+                instances.append((None, real))
+        description = []
+        for slavename, lock in instances:
+            waiters = self._waiters(lock)
+            description.append({
+                'name': lock.name,
+                'slave': slavename,
+                'maxCount': lock.maxCount,
+                'holders': [repr(owner) for owner, access in lock.owners],
+                'waiters': [
+                    {'waiter': (owner[1] if isinstance(owner, tuple)
+                                else repr(owner)),
+                     'seconds': now - since}
+                    for owner, (since, still_waiting) in waiters.items()
+                    if still_waiting
+                ],
+            })
+        return sorted(description, key=lambda lock: (
+            lock['name'], lock['slave']))
+
+
+lock_metrics = LockMetrics()
+
+
+class LocksResource(Resource):
+    """
+    A JSON description of the locks of the buildmaster, their holders and
+    what is waiting for them.
+    """
+    isLeaf = True
+
+    def __init__(self, master, metrics=lock_metrics):
+        Resource.__init__(self)
+        self.master = master
+        self.metrics = metrics
+
+    def render_GET(self, request):
+        request.setHeader(b'Content-Type', b'application/json')
+        return json.dumps(
+            self.metrics.describe(self.master.botmaster), indent=2)
@@ -1,7 +1,4 @@
 
-from twisted.application.internet import TimerService
-from twisted.internet.defer import inlineCallbacks, returnValue
-
 from buildbot.status.base import StatusReceiverMultiService
 from buildbot.status.results import Results
 
@@ -43,31 +40,29 @@ class Monitor(StatusReceiverMultiService):
         namespace="buildbot",
         buckets=[1, 2, 3, 4, 5, 10, 15, 20, 25, 30, 35, 40, 45, 60])
 
-    def __init__(self):
+    def __init__(self, poller):
+        """
+        :param PendingRequestPoller poller: The poller for the pending build
+            requests.
+        """
         StatusReceiverMultiService.__init__(self)
-        timer = TimerService(30, self.metrics)
-        timer.setServiceParent(self)
+        self.poller = poller
 
     def startService(self):
         self.status = self.parent
         self.master = self.status.master
         StatusReceiverMultiService.startService(self)
         self.status.subscribe(self)
+        self.poller.subscribe(self.metrics)
+
+    def stopService(self):
+        self.poller.unsubscribe(self.metrics)
+        return StatusReceiverMultiService.stopService(self)
 
-    @inlineCallbacks
-    def count_pending_builds(self):
-        from collections import Counter
-        build_reqs = yield self.master.db.buildrequests.getBuildRequests(
-            claimed=False)
-        pending_counts = Counter([br['buildername'] for br in build_reqs])
-        returnValue(pending_counts)
-
-    @inlineCallbacks
-    def metrics(self):
-        pending_counts = yield self.count_pending_builds()
+    def metrics(self, pending):
         for builder in self.master.botmaster.builders.keys():
             self.pending_counts_gauge.labels(builder).set(
-                pending_counts[builder])
+                pending.counts[builder])
 
     def builderAdded(self, builderName, builder):
         """
@@ -1,41 +1,174 @@
 # Copyright ClusterHQ Inc.  See LICENSE file for details.
 from twisted.python import log
-from twisted.internet import reactor
+from twisted.internet import defer, reactor
 
+from buildbot.locks import BaseLock
 from buildbot.process.buildrequestdistributor import BasicBuildChooser
 from buildbot.process.slavebuilder import AbstractSlaveBuilder
 
+from flocker_bb.distribute import distributor
+from flocker_bb.locks import lock_metrics
+from flocker_bb.priority import request_priority
+from flocker_bb.steps import busy_counts
+
 
 def botmaster_maybeStartBuildsForSlave(self, slave_name):
     """
-    We delay this for 10 seconds, so that if multiple slaves start at the same
-    time, builds will be distributed between them.
+    If other slaves for the same builders are about to attach, we delay this
+    until they have, so that builds will be distributed between them.
     """
     def do_start():
         log.msg(format="Really starting builds on %(slave_name)s",
                 slave_name=slave_name)
         builders = self.getBuildersForSlave(slave_name)
         self.brd.maybeStartBuildsOn([b.name for b in builders])
-    log.msg(format="Waiting to start builds on %(slave_name)s",
-            slave_name=slave_name)
-    reactor.callLater(10, do_start)
+    delay = distributor.delay(self, slave_name)
+    if not delay:
+        do_start()
+        return
+    log.msg(format="Waiting %(delay)ds to start builds on %(slave_name)s",
+            delay=delay, slave_name=slave_name)
+    reactor.callLater(delay, do_start)
 
 
 def slavebuilder_buildStarted(self):
     AbstractSlaveBuilder.buildStarted(self)
+    if self.slave:
+        # The slave is forgotten if it detaches before the build finishes.
+        self.busy_slavename = self.slave.slavename
+        busy_counts.started(self.busy_slavename)
     if self.slave and hasattr(self.slave, 'buildStarted'):
         self.slave.buildStarted(self)
 
 
+def slavebuilder_buildFinished(self):
+    slavename = getattr(self, 'busy_slavename', None)
+    if slavename is not None:
+        self.busy_slavename = None
+        busy_counts.finished(slavename)
+    AbstractSlaveBuilder.buildFinished(self)
+
+
+# ``BaseLock`` has no base class to call, so keep the unpatched methods.
+_baselock_waitUntilMaybeAvailable = BaseLock.waitUntilMaybeAvailable
+_baselock_stopWaitingUntilAvailable = BaseLock.stopWaitingUntilAvailable
+_baselock_claim = BaseLock.claim
+_baselock_release = BaseLock.release
+
+
+def baselock_waitUntilMaybeAvailable(self, owner, access):
+    d = _baselock_waitUntilMaybeAvailable(self, owner, access)
+    if not d.called:
+        lock_metrics.waiting(self, owner)
+    return d
+
+
+def baselock_stopWaitingUntilAvailable(self, owner, access, d):
+    _baselock_stopWaitingUntilAvailable(self, owner, access, d)
+    lock_metrics.stoppedWaiting(self, owner)
+
+
+def baselock_claim(self, owner, access):
+    _baselock_claim(self, owner, access)
+    lock_metrics.claimed(self, owner)
+
+
+def baselock_release(self, owner, access):
+    held = (owner, access) in self.owners
+    _baselock_release(self, owner, access)
+    if held:
+        lock_metrics.released(self, owner)
+
+
+def builder_canStartWithSlavebuilder(self, slavebuilder):
+    """
+    Like ``Builder.canStartWithSlavebuilder``, but checks every lock, so
+    ``lock_metrics`` knows which locks the builder is waiting for.
+    """
+    available = True
+    for access in self.config.locks:
+        lock = self.botmaster.getLockFromLockAccess(access)
+        slave_lock = lock.getLock(slavebuilder.slave)
+        if slave_lock.isAvailable(None, access):
+            lock_metrics.unblocked(slave_lock, self.name)
+        else:
+            lock_metrics.blocked(slave_lock, self.name)
+            available = False
+    return available
+
+
 class NoFallBackBuildChooser(BasicBuildChooser):
     """
     BuildChooser that doesn't fall back to rejected slaves.
     In particular, builds with locks won't be assigned before a lock is ready.
+
+    ``nextSlave`` functions with a true ``takes_request`` attribute are also
+    passed the build request the slave is being chosen for, as ``request``.
+
+    Unless the builder has a ``nextBuild`` function, requests are chosen by
+    ``flocker_bb.priority.request_priority``.
     """
 
+    _next_request = None
+
     def __init__(self, bldr, master):
         BasicBuildChooser.__init__(self, bldr, master)
         self.rejectedSlaves = None
+        nextSlave = self.nextSlave
+        if getattr(nextSlave, 'takes_request', False):
+            self.nextSlave = lambda bldr, slaves: nextSlave(
+                bldr, slaves, request=self._next_request)
+
+    @defer.inlineCallbacks
+    def popNextBuild(self):
+        # Like ``BasicBuildChooser.popNextBuild``, but choose the request
+        # before the slave, so ``nextSlave`` can be told about it.  If no
+        # slave can start a request, the next request is chosen before
+        # ``nextSlave`` is asked for another slave, so it is never told about
+        # a stale request.
+        while True:
+            breq = self._next_request = yield self._chooseNextRequest()
+            if not breq:
+                break
+            slave = yield self._popNextSlave()
+            if not slave:
+                break
+            # Either satisfy this request or leave it for another day.
+            self._removeBuildRequest(breq)
+            recycledSlaves = []
+            while slave:
+                canStart = yield self.canStartBuild(slave, breq)
+                if canStart:
+                    break
+                recycledSlaves.append(slave)
+                slave = yield self._popNextSlave()
+            if recycledSlaves:
+                self._unpopSlaves(recycledSlaves)
+            if slave:
+                defer.returnValue((slave, breq))
+        defer.returnValue((None, None))
+
+    def _unpopSlaves(self, slaves):
+        # ``BasicBuildChooser`` hands recycled slaves out again without asking
+        # ``nextSlave``, which would ignore the request they are now being
+        # chosen for.  Return them to the pool instead.
+        self.slavepool[:0] = slaves
+
+    @defer.inlineCallbacks
+    def _chooseNextRequest(self):
+        if self.nextBuild:
+            breq = yield BasicBuildChooser._getNextUnclaimedBuildRequest(self)
+            defer.returnValue(breq)
+        yield self._fetchUnclaimedBrdicts()
+        breqs = yield self._getUnclaimedBuildRequests()
+        defer.returnValue(request_priority.choose(breqs))
+
+    @defer.inlineCallbacks
+    def chooseNextBuild(self):
+        slave, breqs = yield BasicBuildChooser.chooseNextBuild(self)
+        if breqs:
+            request_priority.chosen(breqs)
+        defer.returnValue((slave, breqs))
 
 
 def apply_patches():
@@ -44,8 +177,15 @@ def apply_patches():
     BotMaster.maybeStartBuildsForSlave = botmaster_maybeStartBuildsForSlave
     from buildbot.process.slavebuilder import SlaveBuilder
     SlaveBuilder.buildStarted = slavebuilder_buildStarted
+    SlaveBuilder.buildFinished = slavebuilder_buildFinished
     from buildbot.steps.master import MasterShellCommand
     MasterShellCommand.renderables += ['path']
     from buildbot.process.buildrequestdistributor import (
         BuildRequestDistributor)
     BuildRequestDistributor.BuildChooser = NoFallBackBuildChooser
+    BaseLock.waitUntilMaybeAvailable = baselock_waitUntilMaybeAvailable
+    BaseLock.stopWaitingUntilAvailable = baselock_stopWaitingUntilAvailable
+    BaseLock.claim = baselock_claim
+    BaseLock.release = baselock_release
+    from buildbot.process.builder import Builder
+    Builder.canStartWithSlavebuilder = builder_canStartWithSlavebuilder
@@ -1,6 +1,9 @@
+import hmac
 import os
 import random
 import string
+from hashlib import sha256
+from tempfile import mkstemp
 
 chars = string.ascii_letters + string.digits + '!@#%^&*()'
 random.seed = (os.urandom(1024))
@@ -8,3 +11,53 @@ random.seed = (os.urandom(1024))
 
 def generate_password(length):
     return ''.join(random.choice(chars) for i in range(length))
+
+
+def load_secret(path):
+    """
+    Load the secret used to derive buildslave passwords, creating it if it
+    doesn't exist.
+
+    A new secret is written to a temporary file which is then renamed into
+    place, so a crash while creating it can't leave an empty secret behind.
+
+    :param FilePath path: The file the secret is stored in.
+    :raises ValueError: If the stored secret is empty.
+    :return: The secret, as ``bytes``.
+    """
+    if not path.exists():
+        # mkstemp creates the file readable only by its owner.
+        fd, temp = mkstemp(dir=path.parent().path, prefix=path.basename())
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(os.urandom(32).encode('hex'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(temp, path.path)
+        except BaseException:
+            os.remove(temp)
+            raise
+    secret = path.getContent()
+    if not secret:
+        raise ValueError("Empty secret.", path.path)
+    return secret
+
+
+def derive_password(secret, name, length=32):
+    """
+    Derive a buildslave password from a secret and the buildslave name.
+
+    On-demand buildslave nodes are given their password when they are
+    created, so it must stay the same across buildmaster restarts for the
+    nodes to be able to reconnect.
+
+    :param bytes secret: See ``load_secret``.
+    :param bytes name: The name of the buildslave.
+    :return: A password made of characters from ``chars``.
+    """
+    if isinstance(name, unicode):
+        name = name.encode('utf-8')
+    digest = hmac.new(secret, name, sha256).digest()
+    while len(digest) < length:
+        digest += hmac.new(secret, digest, sha256).digest()
+    return ''.join(chars[ord(byte) % len(chars)] for byte in digest[:length])
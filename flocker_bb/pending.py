@@ -0,0 +1,166 @@
+"""
+Poll the unclaimed build requests once, for every status receiver that needs
+them.
+"""
+
+from __future__ import absolute_import
+
+from collections import Counter as counter
+
+from characteristic import attributes, Attribute
+from twisted.application.internet import TimerService
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks
+from twisted.python import log
+
+from buildbot.status.base import StatusReceiverMultiService
+
+from prometheus_client import Counter
+
+
+def index_slaves(botmaster):
+    """
+    Index the on-demand buildslaves by the builders they are allocated to.
+
+    :return: A ``tuple`` of a ``dict`` mapping builder names to the ``list``
+        of on-demand slaves allocated to them, and a ``dict`` mapping the
+        names of those slaves to the ``frozenset`` of their builder names.
+    """
+    slaves = {
+        slavename: slave for slavename, slave in botmaster.slaves.items()
+        if getattr(slave, 'instance_booter', None) is not None
+    }
+    by_builder = {}
+    builders = {slavename: set() for slavename in slaves}
+    for builder in botmaster.getBuilders():
+        for slavename in builder.config.slavenames:
+            if slavename in slaves:
+                by_builder.setdefault(builder.name, []).append(
+                    slaves[slavename])
+                builders[slavename].add(builder.name)
+    return by_builder, {
+        slavename: frozenset(names) for slavename, names in builders.items()}
+
+
+@attributes([
+    Attribute('counts'),
+    Attribute('slaves'),
+    Attribute('builders'),
+])
+class PendingRequests(object):
+    """
+    The unclaimed build requests, and the on-demand buildslaves which could
+    take them.
+
+    :ivar Counter counts: The number of unclaimed requests for each builder.
+    :ivar dict slaves: Map builder names to the ``list`` of on-demand slaves
+        allocated to them.
+    :ivar dict builders: Map on-demand slave names to the ``frozenset`` of
+        the names of the builders they are allocated to.
+    """
+
+
+class PendingRequestPoller(StatusReceiverMultiService):
+    """
+    Query the unclaimed build requests once per interval, and shortly after a
+    request is submitted, and pass them to every subscriber.
+
+    Subscribers are called with a ``PendingRequests``.
+
+    The on-demand slaves are indexed by builder when the poller starts.
+    Buildbot replaces its status receivers on every reconfig, after the
+    builders and slaves have been reconfigured, so the index is always that
+    of the current configuration.  Requests submitted for builders which no
+    on-demand slave is allocated to don't trigger a poll.
+    """
+
+    polls = Counter(
+        'pending_request_polls_total',
+        'Number of queries for unclaimed build requests.',
+        namespace='buildbot',
+    )
+
+    def __init__(self, interval=30, delay=1, _reactor=reactor):
+        """
+        :param interval: How often (in seconds) to query the requests.
+        :param delay: How long (in seconds) after a request is submitted to
+            query, so that requests submitted together are seen together.
+        """
+        StatusReceiverMultiService.__init__(self)
+        self.delay = delay
+        self._reactor = _reactor
+        self._delayed_poll = None
+        self._polling = False
+        self._poll_again = False
+        self._subscribers = []
+        self.slaves = {}
+        self.builders = {}
+        timer = TimerService(interval, self.poll)
+        timer.clock = _reactor
+        timer.setServiceParent(self)
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    def startService(self):
+        self.status = self.parent
+        self.master = self.status.master
+        self.slaves, self.builders = index_slaves(self.master.botmaster)
+        StatusReceiverMultiService.startService(self)
+        self._subscription = self.master.subscribeToBuildRequests(
+            self.requestSubmitted)
+
+    def stopService(self):
+        self._subscription.unsubscribe()
+        if self._delayed_poll is not None:
+            self._delayed_poll.cancel()
+            self._delayed_poll = None
+        return StatusReceiverMultiService.stopService(self)
+
+    def requestSubmitted(self, request):
+        if request['buildername'] not in self.slaves:
+            return
+        if self._delayed_poll is None:
+            self._delayed_poll = self._reactor.callLater(
+                self.delay, self._delayedPoll)
+
+    def _delayedPoll(self):
+        self._delayed_poll = None
+        self.poll()
+
+    @inlineCallbacks
+    def poll(self):
+        """
+        Query the unclaimed build requests, and pass them to the subscribers.
+        """
+        if self._polling:
+            # The query in progress may have missed new requests.
+            self._poll_again = True
+            return
+        self._polling = True
+        try:
+            build_reqs = yield self.master.db.buildrequests.getBuildRequests(
+                claimed=False)
+        except Exception:
+            # Don't let the failure stop the timer; the next poll may work.
+            log.err(None, "while querying pending build requests")
+            return
+        finally:
+            self._polling = False
+            if self._poll_again:
+                self._poll_again = False
+                self._reactor.callLater(0, self.poll)
+        self.polls.inc()
+        pending = PendingRequests(
+            counts=counter(br['buildername'] for br in build_reqs),
+            slaves=self.slaves,
+            builders=self.builders,
+        )
+        for callback in list(self._subscribers):
+            try:
+                callback(pending)
+            except Exception:
+                log.err(None, "while handling pending build requests")
@@ -0,0 +1,132 @@
+"""
+Choose which pending build request of a builder to run next, and which
+builder to start builds on first, by the kind of branch the requests are for.
+"""
+
+from __future__ import absolute_import
+
+from twisted.internet import reactor
+from twisted.internet.defer import gatherResults, inlineCallbacks, returnValue
+
+from buildbot.process.buildrequest import BuildRequest
+
+from prometheus_client import Histogram
+
+from flocker_bb.steps import BranchType, getBranchType
+
+# Lower numbers are run first.
+PRIORITIES = {
+    BranchType.master: 0,
+    BranchType.release: 1,
+    BranchType.maintenance: 2,
+    BranchType.development: 3,
+}
+
+
+def requestBranchType(request):
+    """
+    :param request: A ``BuildRequest``.
+    :return: The most important ``BranchType`` of the branches the request
+        is for, or ``BranchType.development`` if it has none.
+    """
+    branch_types = [
+        getBranchType(sourcestamp.branch)
+        for sourcestamp in request.sources.values()
+        if sourcestamp.branch
+    ]
+    if not branch_types:
+        return BranchType.development
+    return min(branch_types, key=PRIORITIES.get)
+
+
+class RequestPriority(object):
+    """
+    Run requests for master first, then release, maintenance and development
+    branches, and otherwise in the order they were submitted.
+
+    So that a flood of requests for more important branches can't starve the
+    others, a request is promoted by one level for every ``age_step`` seconds
+    it has been waiting.
+
+    Builders are also started in the order of their most important pending
+    request (see ``prioritizeBuilders``), so that when builders share a lock,
+    the most important request gets it first.
+
+    :ivar age_step: How long (in seconds) a request waits before being
+        promoted.
+    """
+
+    queue_wait = Histogram(
+        'build_request_wait_seconds',
+        'Time from a build request being submitted until a slave is chosen '
+        'for it.',
+        labelnames=['branch_type'],
+        namespace='buildbot',
+        buckets=(10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400),
+    )
+
+    def __init__(self, age_step=30 * 60, _reactor=reactor,
+                 _fromBrdict=BuildRequest.fromBrdict):
+        self.age_step = age_step
+        self._reactor = _reactor
+        self._fromBrdict = _fromBrdict
+
+    def _priority(self, request, now):
+        waited = max(0, now - (request.submittedAt or now))
+        return (
+            PRIORITIES[requestBranchType(request)]
+            - int(waited // self.age_step)
+        )
+
+    def choose(self, requests):
+        """
+        :param list requests: Unclaimed ``BuildRequest``s for a builder.
+        :return: The request to run next, or ``None`` if there are none.
+        """
+        if not requests:
+            return None
+        now = self._reactor.seconds()
+        return min(requests, key=lambda request: self._key(request, now))
+
+    def _key(self, request, now):
+        return (self._priority(request, now), request.submittedAt)
+
+    @inlineCallbacks
+    def prioritizeBuilders(self, master, builders):
+        """
+        Order builders by their most important pending request, for the
+        ``prioritizeBuilders`` configuration option.  Builders without pending
+        requests come last.
+
+        :param master: The ``BuildMaster``.
+        :param list builders: The ``Builder``s to start builds on.
+        :return: A ``Deferred`` firing with the sorted ``list`` of builders.
+        """
+        now = self._reactor.seconds()
+        keys = {}
+        for builder in builders:
+            brdicts = yield master.db.buildrequests.getBuildRequests(
+                buildername=builder.name, claimed=False)
+            requests = yield gatherResults([
+                self._fromBrdict(master, brdict) for brdict in brdicts])
+            if requests:
+                keys[builder] = min(
+                    self._key(request, now) for request in requests)
+        returnValue(sorted(
+            builders,
+            key=lambda builder: (builder not in keys, keys.get(builder))))
+
+    def chosen(self, requests):
+        """
+        Record how long ``requests`` waited before a slave was chosen for
+        them.
+        """
+        now = self._reactor.seconds()
+        for request in requests:
+            if request.submittedAt is None:
+                continue
+            self.queue_wait.labels(requestBranchType(request).name).observe(
+                max(0, now - request.submittedAt))
+
+
+request_priority = RequestPriority()
@@ -0,0 +1,202 @@
+"""
+Client-side rate limiting of cloud API calls.
+
+Cloud providers limit how quickly an account can make API calls, and EC2
+responds to an account exceeding its limits with ``RequestLimitExceeded``
+errors.  Rather than waiting for those errors, every call made through a
+``flocker_bb.drivers.PooledDriver`` first takes a token from a
+``RateLimiter``, which spaces the calls out to stay within a budget.
+"""
+
+from __future__ import absolute_import, division
+
+import time
+from bisect import insort
+from itertools import count
+from threading import Condition
+
+from prometheus_client import Gauge, Histogram
+
+# The libcloud methods which have their own budgets, and the call types they
+# are counted as.  Other methods are counted against the default budget.
+CALL_TYPES = {
+    'create_node': 'create',
+    'destroy_node': 'destroy',
+    'list_images': 'list_images',
+    'list_sizes': 'list_sizes',
+}
+
+# (rate per second, burst) for each call type.
+DEFAULT_BUDGETS = {
+    'create': (1, 10),
+    'destroy': (5, 20),
+    'list_images': (0.2, 2),
+    'list_sizes': (0.2, 2),
+    None: (2, 10),
+}
+
+# A budget shared by all the calls.
+DEFAULT_TOTAL = (5, 20)
+
+# Lower numbers go first, when calls are queued.  Destroying nodes is
+# preferred over creating them, since it frees up capacity.
+PRIORITIES = {
+    'destroy': 0,
+    'create': 2,
+}
+DEFAULT_PRIORITY = 1
+
+
+def call_type(method_name):
+    """
+    :param bytes method_name: The name of a libcloud driver method.
+    :return: The call type the method is counted as, or ``None``.
+    """
+    return CALL_TYPES.get(method_name)
+
+
+class TokenBucket(object):
+    """
+    A token bucket, which holds up to ``burst`` tokens and gains ``rate``
+    tokens a second.
+
+    This isn't thread-safe; ``RateLimiter`` only uses it while holding a lock.
+    """
+
+    def __init__(self, rate, burst, clock=time.time):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = burst
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self):
+        """
+        :return: How long (in seconds) until a token is available.
+        """
+        self._refill()
+        if self._tokens >= 1:
+            return 0
+        return (1 - self._tokens) / self.rate
+
+    def take(self):
+        """
+        Take a token, which must be available.
+        """
+        self._tokens -= 1
+
+
+class RateLimiter(object):
+    """
+    Space out API calls to stay within per-call-type budgets, and a budget
+    shared by every call.
+
+    Calls waiting for a token are queued by priority, so that, for instance,
+    destroying a node doesn't wait behind a burst of creations.  A queued
+    call whose own budget is exhausted doesn't hold up calls of other types.
+
+    :ivar provider: The libcloud provider name, used to label metrics.
+    """
+
+    queue_depth = Gauge(
+        'cloud_api_queue_depth',
+        'Number of cloud API calls waiting for the rate limiter.',
+        labelnames=['provider', 'call_type'],
+        namespace='buildbot',
+    )
+
+    wait_time = Histogram(
+        'cloud_api_rate_limit_wait_seconds',
+        'Time cloud API calls waited for the rate limiter.',
+        labelnames=['provider', 'call_type'],
+        namespace='buildbot',
+    )
+
+    def __init__(self, provider, budgets=DEFAULT_BUDGETS,
+                 total=DEFAULT_TOTAL, priorities=PRIORITIES,
+                 clock=time.time):
+        """
+        :param dict budgets: Map call types to ``(rate, burst)`` tuples.  The
+            budget for ``None`` is used for call types without their own.
+        :param tuple total: The ``(rate, burst)`` shared by every call.
+        :param dict priorities: Map call types to priorities.
+        """
+        self.provider = provider
+        self._clock = clock
+        self._buckets = {
+            name: TokenBucket(rate, burst, clock)
+            for (name, (rate, burst)) in budgets.items()
+        }
+        self._total = TokenBucket(total[0], total[1], clock)
+        self._priorities = priorities
+        self._waiting = []
+        self._counter = count()
+        self._condition = Condition()
+
+    def _bucket(self, call_type):
+        return self._buckets.get(call_type, self._buckets[None])
+
+    def _try(self, entry):
+        """
+        Try to take tokens for a queued call.
+
+        Must be called with the lock held.
+
+        :param entry: The ``(priority, sequence, call_type)`` of the call.
+        :return: ``0`` if the tokens were taken, otherwise the number of
+            seconds to wait before trying again, or ``None`` to wait until
+            another call has taken its tokens.
+        """
+        bucket = self._bucket(entry[2])
+        delay = max(bucket.delay(), self._total.delay())
+        if delay > 0:
+            return delay
+        for other in self._waiting:
+            if other == entry:
+                break
+            if self._bucket(other[2]).delay() == 0:
+                return None
+        bucket.take()
+        self._total.take()
+        self._waiting.remove(entry)
+        return 0
+
+    def acquire(self, call_type):
+        """
+        Wait until a call of the given type may be made.
+
+        This blocks, so should be called in a thread.
+
+        :param call_type: See ``call_type``.
+        """
+        entry = (
+            self._priorities.get(call_type, DEFAULT_PRIORITY),
+            next(self._counter),
+            call_type,
+        )
+        label = call_type or 'other'
+        queue_depth = self.queue_depth.labels(self.provider, label)
+        start = self._clock()
+        with self._condition:
+            insort(self._waiting, entry)
+            queue_depth.inc()
+            try:
+                while True:
+                    delay = self._try(entry)
+                    if delay == 0:
+                        break
+                    self._condition.wait(delay)
+            except BaseException:
+                self._waiting.remove(entry)
+                raise
+            finally:
+                queue_depth.dec()
+                self._condition.notify_all()
+        self.wait_time.labels(self.provider, label).observe(
+            self._clock() - start)
@@ -0,0 +1,158 @@
+"""
+Destroy on-demand buildslave nodes which no buildslave knows about.
+
+``InstanceBooter`` assumes a node is gone if destroying it fails, and nodes
+can be left behind in other ways (such as a crash while starting one).
+Leaked nodes cost money and count against the instance quota, which can stop
+new nodes from being booted.
+"""
+
+from __future__ import absolute_import
+
+from datetime import datetime
+
+from twisted.application.internet import TimerService
+from twisted.internet import reactor
+from twisted.internet.defer import gatherResults, succeed
+from twisted.python import log
+
+from buildbot.status.base import StatusReceiverMultiService
+
+from prometheus_client import Counter, Gauge
+
+from flocker_bb.threadpool import deferToCloudThread
+
+
+class OrphanReaper(StatusReceiverMultiService):
+    """
+    Periodically destroy nodes tagged with this buildmaster which don't
+    belong to any on-demand buildslave.  This includes stopped nodes, which
+    were retained by a buildslave which no longer exists or has since
+    retained a different node.
+
+    Each account and region is listed once, with a single call, using one of
+    the buildslaves' ``ICloudDriver``s, and the orphans found are destroyed
+    together.  Nodes younger than ``grace`` are left alone, since a node which
+    is being created isn't known to its buildslave until the creation call
+    returns.
+    """
+
+    orphans_gauge = Gauge(
+        'orphaned_instances',
+        'Number of nodes tagged with this buildmaster which no buildslave '
+        'knows about.',
+        labelnames=['provider', 'region'],
+        namespace='buildbot',
+    )
+
+    oldest_gauge = Gauge(
+        'orphaned_instance_oldest_age_seconds',
+        'Age of the oldest orphaned node.',
+        labelnames=['provider', 'region'],
+        namespace='buildbot',
+    )
+
+    reaped = Counter(
+        'orphaned_instances_reaped_total',
+        'Number of orphaned nodes destroyed.',
+        labelnames=['provider', 'region'],
+        namespace='buildbot',
+    )
+
+    def __init__(self, interval=10 * 60, grace=30 * 60, _reactor=reactor,
+                 _deferToThread=deferToCloudThread):
+        """
+        :param interval: How often (in seconds) to look for orphans.
+        :param grace: How old (in seconds) a node must be before it can be
+            destroyed.
+        """
+        StatusReceiverMultiService.__init__(self)
+        self.grace = grace
+        self._reactor = _reactor
+        self._deferToThread = _deferToThread
+        self._first_seen = {}
+        timer = TimerService(interval, self.check)
+        timer.clock = _reactor
+        timer.setServiceParent(self)
+
+    def startService(self):
+        self.status = self.parent
+        self.master = self.status.master
+        StatusReceiverMultiService.startService(self)
+
+    def _slaves(self):
+        return [
+            slave for slave in self.master.botmaster.slaves.values()
+            if getattr(slave, 'instance_booter', None) is not None
+        ]
+
+    def _booters(self):
+        return [slave.instance_booter for slave in self._slaves()]
+
+    @staticmethod
+    def _age(node, first_seen, now):
+        """
+        :return: The age of ``node``, or the time since it was first seen if
+            its creation time isn't known.
+        """
+        created_at = getattr(node, 'created_at', None)
+        if created_at is None:
+            return now - first_seen
+        epoch = datetime(1970, 1, 1, tzinfo=created_at.tzinfo)
+        return now - (created_at - epoch).total_seconds()
+
+    def check(self):
+        """
+        Look for orphans in every account and region used by a buildslave,
+        and destroy them.
+
+        :return: A ``Deferred`` that fires when done.
+        """
+        if any(slave.reconciling is not None for slave in self._slaves()):
+            # Slaves are still looking for nodes to adopt.
+            return succeed(None)
+        groups = {}
+        for booter in self._booters():
+            driver = booter.driver
+            groups.setdefault(
+                (driver.driver, driver.instance_tags['Buildmaster']), driver)
+        return gatherResults(map(self._reap, groups.values()))
+
+    def _reap(self, driver):
+        labels = (driver.driver.provider, driver.region)
+        d = self._deferToThread(driver.list_buildmaster_instances)
+
+        def found(nodes):
+            now = self._reactor.seconds()
+            known = set(
+                getattr(booter, 'node', None) and booter.node.id
+                for booter in self._booters()
+            )
+            orphans = [node for node in nodes if node.id not in known]
+            first_seen = self._first_seen.get(driver.driver, {})
+            first_seen = self._first_seen[driver.driver] = {
+                node.id: first_seen.get(node.id, now) for node in orphans}
+            ages = {
+                node.id: self._age(node, first_seen[node.id], now)
+                for node in orphans
+            }
+            self.orphans_gauge.labels(*labels).set(len(orphans))
+            self.oldest_gauge.labels(*labels).set(
+                max(ages.values()) if ages else 0)
+            expired = [
+                node for node in orphans if ages[node.id] >= self.grace]
+            if not expired:
+                return
+            log.msg(
+                format="Destroying orphaned nodes %(instance_ids)s",
+                instance_ids=[node.id for node in expired],
+            )
+            d = self._deferToThread(driver.destroy_instances, expired)
+
+            d.addCallback(
+                lambda _: self.reaped.labels(*labels).inc(len(expired)))
+            return d
+
+        d.addCallback(found)
+        d.addErrback(log.err, "while reaping orphaned nodes")
+        return d
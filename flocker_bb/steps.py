@@ -1,13 +1,13 @@
 import random
-from collections import Counter
+from collections import OrderedDict
 
 from twisted.internet import defer
 from twisted.python import log
 from twisted.python.constants import NamedConstant, Names
 from twisted.python.filepath import FilePath
 
-from buildbot.process.properties import Interpolate
-from buildbot.steps.shell import ShellCommand
+from buildbot.process.properties import Interpolate, Property
+from buildbot.steps.shell import SetPropertyFromCommand, ShellCommand
 from buildbot.steps.source.git import Git
 from buildbot.steps.source.base import Source
 from buildbot.process.factory import BuildFactory
@@ -15,12 +15,15 @@ from buildbot.status.results import SUCCESS
 from buildbot.process import buildstep
 from buildbot.process.properties import renderer
 from buildbot.schedulers.forcesched import BooleanParameter
+from buildbot.status.base import StatusReceiverMultiService
 
 from os import path
 import re
 import json
 from functools import partial
 
+from prometheus_client import Counter
+
 VIRTUALENV_DIR = '%(prop:workdir)s/venv'
 
 VIRTUALENV_PY = Interpolate("%(prop:workdir)s/../dependencies/virtualenv.py")
@@ -105,8 +108,97 @@ def resultURL(kind, isAbsolute=False, **kwargs):
     return _result(kind=kind, prefix=prefix, **kwargs)
 
 
-def buildVirtualEnv(python, useSystem=False):
+# Hash the interpreter and the files which decide what is installed in the
+# virtualenv, and compare the hash with the one the virtualenv was built for.
+# This runs under the interpreter the virtualenv is built with, in the
+# checkout, so it works on every slave.
+VIRTUALENV_CACHE_SCRIPT = """\
+import glob, hashlib, os, sys
+key = hashlib.sha256()
+key.update(sys.executable.encode('utf-8'))
+key.update(sys.version.encode('utf-8'))
+names = ['setup.py'] + sorted(
+    glob.glob('*requirements*.txt') + glob.glob('requirements/*.txt'))
+for name in names:
+    if os.path.exists(name):
+        key.update(name.encode('utf-8'))
+        key.update(open(name, 'rb').read())
+key = key.hexdigest()
+try:
+    cached = open(os.path.join(sys.argv[1], '.cache-key')).read().strip()
+except IOError:
+    cached = None
+print(key)
+print(cached == key and 'hit' or 'miss')
+"""
+
+
+def virtualenvCacheProperties(rc, stdout, stderr):
+    """
+    Extract the ``virtualenv-key`` and ``virtualenv-cache`` (``hit`` or
+    ``miss``) properties from the output of ``VIRTUALENV_CACHE_SCRIPT``.
+    """
+    lines = stdout.split()
+    if rc != 0 or len(lines) != 2:
+        return {}
+    key, result = lines
+    return {'virtualenv-key': key, 'virtualenv-cache': result}
+
+
+def virtualenvCached(step):
+    """
+    ``doStepIf`` function checking whether the virtualenv left by a previous
+    build was reused.
+    """
+    return step.build.getProperty('virtualenv-cache') == 'hit'
+
+
+def virtualenvMissed(step):
+    return not virtualenvCached(step)
+
+
+def virtualenvBuilt(step):
+    """
+    ``doStepIf`` function checking whether the virtualenv was rebuilt, and
+    everything was installed into it successfully.
+    """
+    return (step.build.getProperty('virtualenv-cache') == 'miss'
+            and step.build.result == SUCCESS)
+
+
+def buildVirtualEnv(python, useSystem=False, cached=False):
+    """
+    :param cached: If true, reuse the virtualenv left by the previous build
+        of the builder, if it was built with the same interpreter,
+        ``setup.py`` and requirements files.  Whether it was is recorded in
+        the ``virtualenv-cache`` property.  The steps installing into the
+        virtualenv should only run if ``virtualenvMissed``, and be followed by
+        ``recordVirtualEnv``.
+    """
     steps = []
+    if cached:
+        steps.append(SetPropertyFromCommand(
+            name="check-virtualenv-cache",
+            description=["checking", "virtualenv", "cache"],
+            descriptionDone=["check", "virtualenv", "cache"],
+            command=[python, "-c", VIRTUALENV_CACHE_SCRIPT,
+                     Interpolate(VIRTUALENV_DIR)],
+            extract_fn=virtualenvCacheProperties,
+            haltOnFailure=False,
+            flunkOnFailure=False,
+            warnOnFailure=True,
+        ))
+        # Forget the recorded key before touching the virtualenv, so that if
+        # rebuilding it fails, the next build doesn't reuse it.
+        steps.append(ShellCommand(
+            name="forget-virtualenv",
+            description=["forgetting", "virtualenv"],
+            descriptionDone=["forget", "virtualenv"],
+            command=["rm", "-f",
+                     Interpolate(path.join(VIRTUALENV_DIR, ".cache-key"))],
+            haltOnFailure=True,
+            doStepIf=virtualenvMissed,
+        ))
     if useSystem:
         command = ['virtualenv', '-p', python]
     else:
@@ -118,6 +210,7 @@ def buildVirtualEnv(python, useSystem=False):
         descriptionDone=["built", "virtualenv"],
         command=command,
         haltOnFailure=True,
+        doStepIf=virtualenvMissed,
     ))
     steps.append(ShellCommand(
         name="clean-virtualenv-builds",
@@ -125,10 +218,29 @@ def buildVirtualEnv(python, useSystem=False):
         descriptionDone=["clean", "virtualenv"],
         command=["rm", "-rf", Interpolate(path.join(VIRTUALENV_DIR, "build"))],
         haltOnFailure=True,
+        doStepIf=virtualenvMissed,
     ))
     return steps
 
 
+def recordVirtualEnv():
+    """
+    Record which interpreter and requirements a newly built virtualenv was
+    built for, so the next build can reuse it.  Nothing is recorded if any
+    earlier step of the build failed.
+    """
+    return ShellCommand(
+        name="record-virtualenv",
+        description=["recording", "virtualenv"],
+        descriptionDone=["record", "virtualenv"],
+        command=[virtualenvBinary('python'), "-c",
+                 "import sys; open(sys.argv[1], 'w').write(sys.argv[2])",
+                 Interpolate(path.join(VIRTUALENV_DIR, ".cache-key")),
+                 Property('virtualenv-key')],
+        doStepIf=virtualenvBuilt,
+        haltOnFailure=True)
+
+
 def getFactory(codebase, useSubmodules=True, mergeForward=False):
     factory = BuildFactory()
 
@@ -367,12 +479,13 @@ class MergeForward(Source):
         return d
 
 
-def pip(what, packages):
+def pip(what, packages, **kwargs):
     """
     Installs a list of packages with pip, in the current virtualenv.
 
     @param what: Description of the packages being installed.
     @param packages: L{list} of packages to install
+    @param kwargs: Other arguments for the L{ShellCommand}.
     @returns: L{BuildStep}
     """
     return ShellCommand(
@@ -383,7 +496,8 @@ def pip(what, packages):
                  "install",
                  packages,
                  ],
-        haltOnFailure=True)
+        haltOnFailure=True,
+        **kwargs)
 
 
 def isBranch(codebase, predicate):
@@ -410,30 +524,200 @@ def isReleaseBranch(codebase):
     return isBranch(codebase, MergeForward._isRelease)
 
 
-def idleSlave(builder, slavebuilders):
+class BusyCounts(object):
+    """
+    The number of builds running on each buildslave.
+
+    This is kept up to date as builds start and finish (see
+    ``flocker_bb.monkeypatch``), rather than being counted from the state of
+    every slavebuilder each time a slave is chosen.  Counts are kept by slave
+    name, so that builds running across a reconfig are still counted.
+    """
+    def __init__(self):
+        self._counts = {}
+
+    def started(self, slavename):
+        self._counts[slavename] = self._counts.get(slavename, 0) + 1
+
+    def finished(self, slavename):
+        count = self._counts.get(slavename, 0) - 1
+        if count > 0:
+            self._counts[slavename] = count
+        else:
+            self._counts.pop(slavename, None)
+
+    def count(self, slavename):
+        return self._counts.get(slavename, 0)
+
+
+busy_counts = BusyCounts()
+
+
+def idleSlave(builder, slavebuilders, busy_counts=busy_counts):
     """
     Return a slave that has the least number of running builds on it.
     """
-    # Count the builds on each slave
-    builds = Counter([
-        slavebuilder
+    if not slavebuilders:
+        return None
+    counts = [
+        busy_counts.count(slavebuilder.slave.slavename)
         for slavebuilder in slavebuilders
-        for sb in slavebuilder.slave.slavebuilders.values()
-        if sb.isBusy()
+    ]
+    min_builds = min(counts)
+    return random.choice([
+        slavebuilder
+        for slavebuilder, count in zip(slavebuilders, counts)
+        if count == min_builds
     ])
 
-    if not builds:
-        # If there are no builds, then everything is idle.
-        idle = slavebuilders
-    else:
-        min_builds = min(builds.values())
-        idle = [
-            slavebuilder
+
+class WorkspaceLocality(object):
+    """
+    Remember which slaves recently ran builds of each branch for each
+    builder, so that later builds can be run where a checkout (and virtualenv)
+    of the branch already exists.
+
+    Builds are remembered when they start (see ``WorkspaceLocalityRecorder``)
+    rather than when a slave is chosen, since the build chooser may choose a
+    slave several times, for different requests, before a build starts.
+
+    :ivar tolerance: How many more running builds than the least busy
+        candidate a slave with a matching workspace may have, and still be
+        chosen.
+    :ivar per_branch: How many slaves to remember for each builder and
+        branch.
+    :ivar size: How many builder and branch combinations to remember.
+    """
+
+    choices = Counter(
+        'workspace_locality_choices_total',
+        'Number of slaves chosen for builds, by whether the slave recently '
+        'ran a build of the same branch for the builder.',
+        labelnames=['builder', 'result'],
+        namespace='buildbot',
+    )
+
+    def __init__(self, tolerance=1, per_branch=3, size=1000):
+        self.tolerance = tolerance
+        self.per_branch = per_branch
+        self.size = size
+        self._recent = OrderedDict()
+        self._chosen = set()
+
+    @staticmethod
+    def _branches(request):
+        """
+        :return: The branch of each codebase of a ``BuildRequest``.
+        """
+        return tuple(sorted(
+            (codebase, sourcestamp.branch)
+            for codebase, sourcestamp in request.sources.items()
+        ))
+
+    def started(self, builderName, slavename, branches):
+        """
+        Record that a build started on a slave chosen by ``choose``.
+
+        :param branches: The ``(codebase, branch)`` pairs of the build,
+            sorted.
+        """
+        if (builderName, slavename) not in self._chosen:
+            return
+        self._chosen.discard((builderName, slavename))
+        key = (builderName, branches)
+        if slavename in self._recent.get(key, []):
+            result = 'hit'
+        else:
+            result = 'miss'
+        self.choices.labels(builderName, result).inc()
+        self._record(key, slavename)
+
+    def _record(self, key, slavename):
+        slavenames = self._recent.pop(key, [])
+        if slavename in slavenames:
+            slavenames.remove(slavename)
+        slavenames.append(slavename)
+        self._recent[key] = slavenames[-self.per_branch:]
+        while len(self._recent) > self.size:
+            self._recent.popitem(last=False)
+
+    def choose(self, builder, slavebuilders, request, busy_counts):
+        """
+        Choose the slave which most recently ran a build of the requested
+        branch for ``builder``, among those no more than ``tolerance`` builds
+        busier than the least busy candidate.  If there isn't one, choose one
+        of the least busy slaves.
+        """
+        if not slavebuilders:
+            return None
+        if request is None:
+            return idleSlave(builder, slavebuilders, busy_counts=busy_counts)
+        key = (builder.name, self._branches(request))
+        counts = dict(
+            (slavebuilder, busy_counts.count(slavebuilder.slave.slavename))
             for slavebuilder in slavebuilders
-            if builds[slavebuilder] == min_builds
-        ]
-    if idle:
-        return random.choice(idle)
+        )
+        limit = min(counts.values()) + self.tolerance
+        by_name = dict(
+            (slavebuilder.slave.slavename, slavebuilder)
+            for slavebuilder in slavebuilders
+            if counts[slavebuilder] <= limit
+        )
+        for slavename in reversed(self._recent.get(key, [])):
+            if slavename in by_name:
+                chosen = by_name[slavename]
+                break
+        else:
+            chosen = idleSlave(
+                builder, slavebuilders, busy_counts=busy_counts)
+        self._chosen.add((builder.name, chosen.slave.slavename))
+        return chosen
+
+
+workspace_locality = WorkspaceLocality()
+
+
+class WorkspaceLocalityRecorder(StatusReceiverMultiService):
+    """
+    Tell a ``WorkspaceLocality`` which slave each build started on.
+    """
+
+    def __init__(self, locality=workspace_locality):
+        StatusReceiverMultiService.__init__(self)
+        self.locality = locality
+
+    def startService(self):
+        self.status = self.parent
+        StatusReceiverMultiService.startService(self)
+        self.status.subscribe(self)
+
+    def stopService(self):
+        self.status.unsubscribe(self)
+        return StatusReceiverMultiService.stopService(self)
+
+    def builderAdded(self, builderName, builder):
+        return self
+
+    def buildStarted(self, builderName, build):
+        branches = tuple(sorted(
+            (sourcestamp.codebase, sourcestamp.branch)
+            for sourcestamp in build.getSourceStamps()
+        ))
+        self.locality.started(builderName, build.getSlavename(), branches)
+
+
+def localSlave(builder, slavebuilders, request=None,
+               locality=workspace_locality, busy_counts=busy_counts):
+    """
+    Return a slave that recently ran a build of the same branch, if it isn't
+    much busier than the others, or else one that has the least number of
+    running builds on it.
+    """
+    return locality.choose(builder, slavebuilders, request, busy_counts)
+
+# ``flocker_bb.monkeypatch.NoFallBackBuildChooser`` passes the build request
+# the slave is being chosen for to ``nextSlave`` functions with this set.
+localSlave.takes_request = True
 
 
 def slave_environ(var):
@@ -0,0 +1,167 @@
+"""
+Fakes of the parts of the buildmaster, and of on-demand buildslaves, used by
+the status receivers in ``flocker_bb``.
+"""
+from twisted.internet.defer import Deferred, maybeDeferred, succeed
+
+from flocker_bb.ec2 import State
+
+
+class FakeBooter(object):
+    """
+    Enough of an ``InstanceBooter`` for the status receivers.
+    """
+    def __init__(self, state=State.IDLE, driver=None, node=None):
+        self.state = state
+        self.driver = driver
+        self.node = node
+
+
+class FakeSlave(object):
+    """
+    Enough of an ``OnDemandBuildSlave`` for the status receivers.
+
+    :ivar list started: The reasons ``startInstance`` was called with.
+    """
+    keep_warm = None
+    idle_timeout = None
+    reconciling = None
+
+    def __init__(self, slavename, slave_class=None, builders=(),
+                 max_builds=None, state=State.IDLE, building=(),
+                 boot_started=None, instance_booter=None, on_demand=True):
+        """
+        :param builders: The names of the builders the slave is allocated to,
+            for ``builders_for``.
+        :param on_demand: If false, the slave has no ``instance_booter``.
+        """
+        self.slavename = slavename
+        if slave_class is None:
+            slave_class = slavename.rsplit('/', 1)[0]
+        self.slave_class = slave_class
+        self.builders = builders
+        self.max_builds = max_builds
+        if instance_booter is None and on_demand:
+            instance_booter = FakeBooter(state)
+        self.instance_booter = instance_booter
+        self.building = set(building)
+        self.boot_started = boot_started
+        self.started = []
+
+    def startInstance(self, reason="demand"):
+        self.started.append(reason)
+        self.instance_booter.state = State.STARTING
+
+
+class FakeBuilderConfig(object):
+    def __init__(self, slavenames=(), locks=()):
+        self.slavenames = slavenames
+        self.locks = locks
+
+
+class FakeBuilder(object):
+    def __init__(self, name, slavenames=(), locks=(), building=None):
+        self.name = name
+        self.config = FakeBuilderConfig(slavenames, locks)
+        if building is None:
+            building = []
+        self.building = building
+
+
+def builders_for(slaves):
+    """
+    :return: A ``FakeBuilder`` for each builder the ``FakeSlave``s are
+        allocated to.
+    """
+    slavenames = {}
+    for slave in slaves:
+        for name in slave.builders:
+            slavenames.setdefault(name, []).append(slave.slavename)
+    return [FakeBuilder(name, names) for name, names in slavenames.items()]
+
+
+class FakeBotMaster(object):
+    """
+    :ivar list started: The names of the builders which were told to start
+        builds.
+    """
+    def __init__(self, slaves=(), builders=()):
+        self.slaves = {slave.slavename: slave for slave in slaves}
+        self.builders = {builder.name: builder for builder in builders}
+        self.locks = {}
+        self.started = []
+
+    def getBuilders(self):
+        return self.builders.values()
+
+    def getBuildersForSlave(self, slavename):
+        return [builder for builder in self.builders.values()
+                if slavename in builder.config.slavenames]
+
+    def getLockByID(self, lockid):
+        return self.locks.setdefault(lockid, lockid.lockClass(lockid))
+
+    def maybeStartBuildsForBuilder(self, buildername):
+        self.started.append(buildername)
+
+
+class FakeSubscription(object):
+    def unsubscribe(self):
+        pass
+
+
+class FakeMaster(object):
+    """
+    :ivar list completed_buildsets: The ids of the buildsets checked for
+        completion.
+    """
+    def __init__(self, botmaster=None, db=None):
+        if botmaster is None:
+            botmaster = FakeBotMaster()
+        self.botmaster = botmaster
+        self.db = db
+        self.subscribers = []
+        self.completed_buildsets = []
+
+    def subscribeToBuildRequests(self, callback):
+        self.subscribers.append(callback)
+        return FakeSubscription()
+
+    def submit(self, buildername):
+        for callback in self.subscribers:
+            callback({'buildername': buildername})
+
+    def maybeBuildsetComplete(self, bsid):
+        self.completed_buildsets.append(bsid)
+        return succeed(None)
+
+
+class FakeStatus(object):
+    def __init__(self, master):
+        self.master = master
+        self.subscribers = []
+
+    def subscribe(self, receiver):
+        self.subscribers.append(receiver)
+
+    def unsubscribe(self, receiver):
+        self.subscribers.remove(receiver)
+
+
+class FakeThreads(object):
+    """
+    A ``deferToThread`` which only runs functions when told to, so that the
+    number of occupied threads can be checked.
+    """
+    def __init__(self):
+        self.queued = []
+
+    def __call__(self, f, *args):
+        d = Deferred()
+        self.queued.append((d, f, args))
+        return d
+
+    def run(self):
+        queued, self.queued = self.queued, []
+        for d, f, args in queued:
+            maybeDeferred(f, *args).chainDeferred(d)
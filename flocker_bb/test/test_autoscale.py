@@ -0,0 +1,135 @@
+"""
+Tests for ``flocker_bb.autoscale``.
+"""
+from twisted.internet.defer import succeed
+from twisted.internet.task import Clock
+from twisted.trial.unittest import SynchronousTestCase
+
+from flocker_bb.autoscale import Autoscaler, _Slots, plan
+from flocker_bb.ec2 import State
+from flocker_bb.pending import PendingRequestPoller
+from flocker_bb.test.fakes import (
+    FakeBotMaster, FakeMaster, FakeSlave, FakeStatus, builders_for)
+
+
+class FakeBuildRequests(object):
+    def __init__(self):
+        self.pending = []
+        self.queries = 0
+
+    def getBuildRequests(self, claimed):
+        self.queries += 1
+        return succeed([{'buildername': name} for name in self.pending])
+
+
+class FakeDB(object):
+    def __init__(self):
+        self.buildrequests = FakeBuildRequests()
+
+
+OMNIBUS = ['flocker-omnibus-ubuntu-14.04', 'flocker-omnibus-centos-7']
+
+
+class PlanTests(SynchronousTestCase):
+    """
+    Tests for ``plan``.
+    """
+    def slots(self, count, builders=OMNIBUS, max_builds=2):
+        return [
+            _Slots(FakeSlave('aws/ubuntu-14.04/%d' % (i,), builders=builders,
+                             max_builds=max_builds), builders)
+            for i in range(count)
+        ]
+
+    def test_running_capacity(self):
+        """
+        Requests which running slaves can take don't start more slaves.
+        """
+        running = self.slots(1)
+        self.assertEqual(
+            ([], {}), plan({OMNIBUS[0]: 1}, running, self.slots(3)))
+
+    def test_start_needed(self):
+        """
+        Only enough slaves are started to take the pending requests, with
+        each slave taking one build per builder, up to ``max_builds``.
+        """
+        stopped = self.slots(3)
+        to_start, unserved = plan(
+            {OMNIBUS[0]: 2, OMNIBUS[1]: 1}, [], stopped)
+        self.assertEqual(
+            ([stopped[0].slave, stopped[1].slave], {}),
+            (to_start, unserved))
+
+    def test_unserved(self):
+        """
+        Requests that no slave can take are reported.
+        """
+        self.assertEqual(
+            ([], {'osx': 2}), plan({'osx': 2}, [], self.slots(1)))
+
+
+class AutoscalerSimulationTests(SynchronousTestCase):
+    """
+    Simulations of an ``Autoscaler`` responding to build requests.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.slaves = [
+            FakeSlave('aws/ubuntu-14.04/%d' % (i,), builders=OMNIBUS,
+                      max_builds=2)
+            for i in range(3)
+        ]
+        self.master = FakeMaster(
+            FakeBotMaster(self.slaves, builders_for(self.slaves)), FakeDB())
+        self.poller = PendingRequestPoller(
+            interval=30, delay=1, _reactor=self.clock)
+        self.poller.parent = FakeStatus(self.master)
+        self.autoscaler = Autoscaler(self.poller)
+        self.autoscaler.startService()
+        self.addCleanup(self.autoscaler.stopService)
+        self.poller.startService()
+        self.addCleanup(self.poller.stopService)
+
+    def submit(self, buildername):
+        self.master.db.buildrequests.pending.append(buildername)
+        self.master.submit(buildername)
+
+    def states(self):
+        return [slave.instance_booter.state for slave in self.slaves]
+
+    def test_one_request(self):
+        """
+        A single pending request starts a single slave.
+        """
+        self.submit(OMNIBUS[0])
+        self.clock.advance(1)
+        self.assertEqual(
+            [State.STARTING, State.IDLE, State.IDLE], self.states())
+
+    def test_burst(self):
+        """
+        Requests submitted together are planned together, and further
+        requests only start more slaves once the running ones are full.
+        """
+        for builder in OMNIBUS:
+            self.submit(builder)
+        self.clock.advance(1)
+        started = self.states()
+        self.slaves[0].building.update(OMNIBUS)
+        self.master.db.buildrequests.pending = []
+        self.submit(OMNIBUS[1])
+        self.clock.advance(1)
+        self.assertEqual(
+            ([State.STARTING, State.IDLE, State.IDLE],
+             [State.STARTING, State.STARTING, State.IDLE]),
+            (started, self.states()))
+
+    def test_periodic(self):
+        """
+        Requests left pending are checked again periodically.
+        """
+        self.master.db.buildrequests.pending = [OMNIBUS[0]] * 2
+        self.clock.advance(30)
+        self.assertEqual(
+            [State.STARTING, State.STARTING, State.IDLE], self.states())
@@ -0,0 +1,263 @@
+"""
+Tests for ``flocker_bb.coalesce``.
+"""
+import json
+
+from twisted.internet.defer import fail, succeed
+from twisted.trial.unittest import SynchronousTestCase
+
+from buildbot.db.buildrequests import AlreadyClaimedError
+from buildbot.status.results import SKIPPED
+
+from flocker_bb.coalesce import (
+    SupersededRequests, sourceStampRevisions, supersededDescription)
+from flocker_bb.test.fakes import (
+    FakeBotMaster, FakeBuilder, FakeMaster, FakeStatus)
+
+REPOSITORY = 'https://github.com/ClusterHQ/flocker'
+
+
+def sourceStamp(branch, revision, codebase='flocker', patch_body=None):
+    return {
+        'codebase': codebase,
+        'repository': REPOSITORY,
+        'branch': branch,
+        'revision': revision,
+        'patch_body': patch_body,
+    }
+
+
+class FakeBuildsets(object):
+    def __init__(self, buildsets):
+        self.buildsets = buildsets
+
+    def getBuildset(self, bsid):
+        return succeed({'sourcestampsetid': bsid})
+
+    def getBuildsetProperties(self, bsid):
+        return succeed(self.buildsets[bsid][1])
+
+
+class FakeSourceStamps(object):
+    def __init__(self, buildsets):
+        self.buildsets = buildsets
+
+    def getSourceStamps(self, sourcestampsetid):
+        return succeed(self.buildsets[sourcestampsetid][0])
+
+
+class FakeBuildRequests(object):
+    def __init__(self, requests):
+        self.requests = requests
+        self.claimed = set()
+        self.taken = set()
+        self.completed = {}
+
+    def getBuildRequests(self, buildername, claimed):
+        return succeed([
+            br for br in self.requests
+            if br['buildername'] == buildername
+            and br['brid'] not in self.claimed
+        ])
+
+    def claimBuildRequests(self, brids):
+        if set(brids) & self.taken:
+            return fail(AlreadyClaimedError())
+        self.claimed.update(brids)
+        return succeed(None)
+
+    def completeBuildRequests(self, brids, results):
+        for brid in brids:
+            self.completed[brid] = results
+        return succeed(None)
+
+
+class FakeDB(object):
+    def __init__(self, buildsets, requests):
+        self.buildsets = FakeBuildsets(buildsets)
+        self.sourcestamps = FakeSourceStamps(buildsets)
+        self.buildrequests = FakeBuildRequests(requests)
+
+
+class FakeBuildRequest(object):
+    def __init__(self, brid, bsid):
+        self.id = brid
+        self.bsid = bsid
+
+
+class FakeBuild(object):
+    def __init__(self, brid, bsid):
+        self.requests = [FakeBuildRequest(brid, bsid)]
+        self.finished = False
+        self.properties = {}
+        self.stopped = None
+
+    def setProperty(self, name, value, source):
+        self.properties[name] = value
+
+    def stopBuild(self, reason):
+        self.stopped = reason
+
+
+class SupersededDescriptionTests(SynchronousTestCase):
+    """
+    Tests for ``supersededDescription``.
+    """
+    def test_revision(self):
+        """
+        The description names the abbreviated revision of the codebase.
+        """
+        self.assertEqual(
+            'Superseded by 0123456.',
+            supersededDescription(
+                [['other', 'abcdef0'], ['flocker', '0123456789']],
+                'flocker'))
+
+    def test_no_revision(self):
+        """
+        If the newer request has no revision, the description says so.
+        """
+        self.assertEqual(
+            'Superseded by a newer build.',
+            supersededDescription([['flocker', None]], 'flocker'))
+
+
+class SourceStampRevisionsTests(SynchronousTestCase):
+    """
+    Tests for ``sourceStampRevisions``.
+    """
+    def test_json(self):
+        """
+        The codebases and revisions of the source stamps are given as
+        ``[codebase, revision]`` pairs, which can be serialized as JSON.
+        """
+        revisions = sourceStampRevisions([
+            sourceStamp('master', '0123456789'),
+            sourceStamp('master', 'abcdef0', codebase='other'),
+        ])
+        self.assertEqual(
+            [['flocker', '0123456789'], ['other', 'abcdef0']],
+            json.loads(json.dumps(revisions)))
+
+
+class SupersededRequestsTests(SynchronousTestCase):
+    """
+    Tests for ``SupersededRequests``.
+    """
+    def setUp(self):
+        self.buildsets = {
+            1: ([sourceStamp('feature', 'aaa')], {}),
+            2: ([sourceStamp('feature', 'bbb')], {}),
+            3: ([sourceStamp('other', 'ccc')], {}),
+            4: ([sourceStamp('feature', 'ddd')], {}),
+        }
+        self.requests = [
+            {'brid': 1, 'buildsetid': 1, 'buildername': 'omnibus'},
+            {'brid': 2, 'buildsetid': 2, 'buildername': 'omnibus'},
+            {'brid': 3, 'buildsetid': 2, 'buildername': 'docs'},
+            {'brid': 4, 'buildsetid': 3, 'buildername': 'omnibus'},
+            {'brid': 5, 'buildsetid': 4, 'buildername': 'omnibus'},
+        ]
+        self.db = FakeDB(self.buildsets, self.requests)
+        self.building = []
+        self.master = FakeMaster(
+            FakeBotMaster(
+                builders=[FakeBuilder('omnibus', building=self.building)]),
+            self.db)
+        self.seen = []
+
+    def supersede(self, brid, bsid, cancel_running=False):
+        receiver = SupersededRequests(cancel_running=cancel_running)
+        receiver.parent = FakeStatus(self.master)
+        receiver.subscribe(
+            lambda *args: self.seen.append(args))
+        receiver.startService()
+        self.addCleanup(receiver.stopService)
+        self.successResultOf(receiver.supersede('omnibus', brid, bsid))
+
+    def test_same_branch(self):
+        """
+        Older unclaimed requests for the same builder and branch are
+        completed as skipped, and subscribers are told about them.
+        """
+        self.supersede(5, 4)
+        self.assertEqual(
+            ({1: SKIPPED, 2: SKIPPED}, [1, 2],
+             [('omnibus', self.buildsets[1][0], self.buildsets[4][0]),
+              ('omnibus', self.buildsets[2][0], self.buildsets[4][0])]),
+            (self.db.buildrequests.completed, self.master.completed_buildsets,
+             self.seen))
+
+    def test_newer(self):
+        """
+        Requests submitted after the new request aren't dropped.
+        """
+        self.supersede(1, 1)
+        self.assertEqual({}, self.db.buildrequests.completed)
+
+    def test_same_revision(self):
+        """
+        Requests for the same revision, such as a forced rebuild, aren't
+        dropped, whether pending or running.
+        """
+        self.buildsets[1] = ([sourceStamp('feature', 'ddd')], {})
+        build = FakeBuild(1, 1)
+        self.building.append(build)
+        self.supersede(5, 4, cancel_running=True)
+        self.assertEqual(
+            ({2: SKIPPED}, None),
+            (self.db.buildrequests.completed, build.stopped))
+
+    def test_properties(self):
+        """
+        Requests with different properties, such as a force build which
+        reports expected failures, aren't dropped.
+        """
+        self.buildsets[1] = (
+            self.buildsets[1][0],
+            {'report-expected-failures': (True, 'Force Build Form')})
+        self.buildsets[4] = (
+            self.buildsets[4][0], {'owner': ('someone', 'Force Build Form')})
+        self.supersede(5, 4)
+        self.assertEqual({2: SKIPPED}, self.db.buildrequests.completed)
+
+    def test_patch(self):
+        """
+        Requests with patches neither supersede nor are superseded.
+        """
+        self.buildsets[2] = (
+            [sourceStamp('feature', 'bbb', patch_body='diff')], {})
+        self.supersede(5, 4)
+        self.supersede(2, 2)
+        self.assertEqual({1: SKIPPED}, self.db.buildrequests.completed)
+
+    def test_already_claimed(self):
+        """
+        Requests claimed by a slave while being dropped are left alone.
+        """
+        self.db.buildrequests.taken.add(1)
+        self.supersede(5, 4)
+        self.assertEqual({2: SKIPPED}, self.db.buildrequests.completed)
+
+    def test_running_kept(self):
+        """
+        Running builds are left alone by default.
+        """
+        build = FakeBuild(1, 1)
+        self.building.append(build)
+        self.supersede(5, 4)
+        self.assertIs(None, build.stopped)
+
+    def test_cancel_running(self):
+        """
+        With ``cancel_running``, older running builds of the same branch are
+        stopped, and marked as superseded.
+        """
+        builds = [FakeBuild(1, 1), FakeBuild(4, 3)]
+        self.building.extend(builds)
+        self.supersede(5, 4, cancel_running=True)
+        self.assertEqual(
+            ([{'superseded-by': [['flocker', 'ddd']]}, {}],
+             ['Superseded by a newer build request.', None]),
+            ([build.properties for build in builds],
+             [build.stopped for build in builds]))
@@ -0,0 +1,103 @@
+"""
+Tests for ``flocker_bb.distribute``.
+"""
+from twisted.internet.task import Clock
+from twisted.trial.unittest import SynchronousTestCase
+
+from flocker_bb.distribute import AttachTimes, BuildDistributor
+from flocker_bb.test.fakes import FakeBotMaster, FakeBuilder, FakeSlave
+
+
+class AttachTimesTests(SynchronousTestCase):
+    """
+    Tests for ``AttachTimes``.
+    """
+    def test_default(self):
+        """
+        Slave classes with no observations are predicted to take the default
+        time.
+        """
+        self.assertEqual(
+            300, AttachTimes(default=300).expected('aws/ubuntu-14.04'))
+
+    def test_average(self):
+        """
+        The prediction is a moving average of the observations for the slave
+        class.
+        """
+        times = AttachTimes(weight=0.5)
+        times.observe('aws/ubuntu-14.04', 100)
+        times.observe('aws/ubuntu-14.04', 200)
+        times.observe('aws/centos-7', 400)
+        self.assertEqual(
+            [150, 400],
+            [times.expected('aws/ubuntu-14.04'),
+             times.expected('aws/centos-7')])
+
+
+class BuildDistributorTests(SynchronousTestCase):
+    """
+    Tests for ``BuildDistributor``.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.clock.advance(1000)
+        times = AttachTimes(default=300)
+        self.distributor = BuildDistributor(
+            attach_times=times, max_wait=60, _reactor=self.clock)
+
+    def delay(self, slaves):
+        names = [slave.slavename for slave in slaves]
+        botmaster = FakeBotMaster(
+            slaves, [FakeBuilder('omnibus', names)])
+        return self.distributor.delay(botmaster, names[0])
+
+    def test_no_peers_booting(self):
+        """
+        If no other slave is booting, builds start immediately.
+        """
+        self.assertEqual(0, self.delay([
+            FakeSlave('aws/ubuntu-14.04/0'), FakeSlave('aws/ubuntu-14.04/1'),
+        ]))
+
+    def test_peer_soon(self):
+        """
+        If other slaves are predicted to attach within ``max_wait``, builds
+        start once the last of them is predicted to have attached.
+        """
+        self.assertEqual(50, self.delay([
+            FakeSlave('aws/ubuntu-14.04/0'),
+            FakeSlave('aws/ubuntu-14.04/1', boot_started=1000 - 280),
+            FakeSlave('aws/ubuntu-14.04/2', boot_started=1000 - 250),
+        ]))
+
+    def test_peer_later(self):
+        """
+        Slaves predicted to attach later than ``max_wait`` aren't waited for.
+        """
+        self.assertEqual(0, self.delay([
+            FakeSlave('aws/ubuntu-14.04/0'),
+            FakeSlave('aws/ubuntu-14.04/1', boot_started=1000 - 100),
+        ]))
+
+    def test_peer_overdue(self):
+        """
+        Slaves which have taken longer than predicted aren't waited for.
+        """
+        self.assertEqual(0, self.delay([
+            FakeSlave('aws/ubuntu-14.04/0'),
+            FakeSlave('aws/ubuntu-14.04/1', boot_started=1000 - 400),
+        ]))
+
+    def test_other_builders(self):
+        """
+        Slaves which aren't allocated to the same builders aren't waited for.
+        """
+        slave = FakeSlave('aws/ubuntu-14.04/0')
+        other = FakeSlave('aws/centos-7/0', boot_started=1000 - 280)
+        botmaster = FakeBotMaster([slave, other], [
+            FakeBuilder('omnibus', [slave.slavename]),
+            FakeBuilder('centos', [other.slavename]),
+        ])
+        self.assertEqual(
+            0, self.distributor.delay(botmaster, slave.slavename))
@@ -0,0 +1,119 @@
+"""
+Tests for ``flocker_bb.drivers``.
+"""
+from twisted.trial.unittest import SynchronousTestCase
+
+from flocker_bb.drivers import PooledDriver, get_shared_driver
+
+
+class FakeNode(object):
+    def __init__(self, driver):
+        self.driver = driver
+
+    def destroy(self):
+        return self.driver.destroy_node(self)
+
+
+class FakeNodeDriver(object):
+    """
+    A libcloud driver which records the calls made on it.
+    """
+    def __init__(self, calls):
+        self.calls = calls
+
+    def list_nodes(self):
+        self.calls.append((self, 'list_nodes'))
+        return [FakeNode(self), FakeNode(self)]
+
+    def destroy_node(self, node):
+        self.calls.append((self, 'destroy_node'))
+        return True
+
+
+class FakeLimiter(object):
+    def __init__(self):
+        self.acquired = []
+
+    def acquire(self, call_type):
+        self.acquired.append(call_type)
+
+
+class PooledDriverTests(SynchronousTestCase):
+    """
+    Tests for ``PooledDriver``.
+    """
+    def setUp(self):
+        self.calls = []
+        self.created = []
+        self.limiter = FakeLimiter()
+        self.driver = PooledDriver(
+            provider='fake', factory=self.factory, limiter=self.limiter)
+
+    def factory(self):
+        driver = FakeNodeDriver(self.calls)
+        self.created.append(driver)
+        return driver
+
+    def test_reused(self):
+        """
+        Sequential calls share a single real driver.
+        """
+        self.driver.list_nodes()
+        self.driver.list_nodes()
+        self.assertEqual(
+            [(self.created[0], 'list_nodes')] * 2, self.calls)
+
+    def test_concurrent(self):
+        """
+        A call made while the only real driver is in use creates another.
+        """
+        with self.driver._checkout() as busy:
+            self.driver.list_nodes()
+        self.assertEqual(
+            (2, [(self.created[1], 'list_nodes')]),
+            (len(self.created), self.calls))
+        self.assertIs(busy, self.created[0])
+
+    def test_rebind(self):
+        """
+        Nodes returned by the pooled driver make their calls through the
+        pool.
+        """
+        [node, _] = self.driver.list_nodes()
+        self.assertEqual(
+            (True, self.driver), (node.destroy(), node.driver))
+
+    def test_rate_limited(self):
+        """
+        Each call takes a token from the rate limiter for its call type.
+        """
+        [node, _] = self.driver.list_nodes()
+        node.destroy()
+        self.assertEqual([None, 'destroy'], self.limiter.acquired)
+
+
+class GetSharedDriverTests(SynchronousTestCase):
+    """
+    Tests for ``get_shared_driver``.
+    """
+    def test_shared(self):
+        """
+        The same driver is returned for the same provider, region and
+        credentials.
+        """
+        drivers = [
+            get_shared_driver(
+                'fake', 'region', ('key', 'secret'), factory=object)
+            for _ in range(2)
+        ]
+        self.assertIs(drivers[0], drivers[1])
+
+    def test_different_credentials(self):
+        """
+        Different credentials get different drivers.
+        """
+        self.assertIsNot(
+            get_shared_driver(
+                'fake', 'region', ('key', 'secret'), factory=object),
+            get_shared_driver(
+                'fake', 'region', ('other', 'secret'), factory=object))
@@ -0,0 +1,730 @@
+"""
+Tests for ``flocker_bb.ec2``.
+"""
+from libcloud.compute.types import NodeState
+from prometheus_client import REGISTRY
+
+from twisted.internet.defer import maybeDeferred
+from twisted.internet.task import Clock
+from twisted.trial.unittest import SynchronousTestCase
+from zope.interface import implementer
+
+from flocker_bb.ec2 import (
+    LAUNCH_INDEX_URL, BootScheduler, EC2CloudDriver, IBatchingCloudDriver,
+    InstanceBooter, RequestLimitExceeded, SizeCache, State,
+    buildslave_user_data, get_size_cache,
+)
+from flocker_bb.test.fakes import FakeThreads
+
+
+class FakeSize(object):
+    def __init__(self, id):
+        self.id = id
+
+
+class FakeSizeDriver(object):
+    """
+    A libcloud driver which only knows how to list sizes.
+    """
+    def __init__(self, size_ids):
+        self.size_ids = size_ids
+        self.listings = 0
+
+    def list_sizes(self):
+        self.listings += 1
+        return [FakeSize(size_id) for size_id in self.size_ids]
+
+
+def size_lookups(result):
+    """
+    :return: The number of size lookups with the given result recorded so far.
+    """
+    return REGISTRY.get_sample_value(
+        'buildbot_size_cache_lookups_total', {'result': result}) or 0
+
+
+class SizeCacheTests(SynchronousTestCase):
+    """
+    Tests for ``SizeCache``.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.driver = FakeSizeDriver(['c3.large', 'm3.large'])
+        self.cache = SizeCache(
+            self.driver, relist_interval=300, _time=self.clock.seconds)
+
+    def test_cached(self):
+        """
+        Sizes are listed on the first lookup, and reused after that.
+        """
+        hits, misses = size_lookups('hit'), size_lookups('miss')
+        self.cache.get('c3.large')
+        size = self.cache.get('m3.large')
+        self.assertEqual(
+            ('m3.large', 1, 1, 1),
+            (size.id, self.driver.listings,
+             size_lookups('hit') - hits, size_lookups('miss') - misses))
+
+    def test_invalidate(self):
+        """
+        After ``SizeCache.invalidate``, sizes are listed again.
+        """
+        self.cache.get('c3.large')
+        self.cache.invalidate()
+        self.cache.get('c3.large')
+        self.assertEqual(2, self.driver.listings)
+
+    def test_new_size(self):
+        """
+        Looking up a size which wasn't listed lists sizes again, once
+        ``relist_interval`` has passed since they were last listed.
+        """
+        self.cache.get('c3.large')
+        self.clock.advance(300)
+        self.driver.size_ids.append('c4.large')
+        self.assertEqual('c4.large', self.cache.get('c4.large').id)
+
+    def test_unknown(self):
+        """
+        Looking up an unknown size raises ``ValueError``.
+        """
+        self.assertRaises(ValueError, self.cache.get, 't2.micro')
+
+    def test_unknown_cached(self):
+        """
+        An unknown size doesn't list sizes again until ``relist_interval``
+        has passed since they were last listed.
+        """
+        self.cache.get('c3.large')
+        self.clock.advance(299)
+        unknown = size_lookups('unknown')
+        self.assertRaises(ValueError, self.cache.get, 't2.micro')
+        self.assertRaises(ValueError, self.cache.get, 't2.micro')
+        self.assertEqual(
+            (1, 2), (self.driver.listings, size_lookups('unknown') - unknown))
+
+
+class RejectingDriver(FakeSizeDriver):
+    """
+    A libcloud driver which lists sizes, but fails to create nodes.
+    """
+    def __init__(self, size_ids, error):
+        FakeSizeDriver.__init__(self, size_ids)
+        self.error = error
+
+    def create_node(self, **kwargs):
+        raise self.error
+
+
+class FakeNodeDriver(object):
+    """
+    A libcloud driver which lists nodes, ignoring filters, and records the
+    nodes it creates and tags.
+    """
+    def __init__(self, nodes=()):
+        self.nodes = list(nodes)
+        self.created = []
+        self.tagged = []
+
+    def list_nodes(self, ex_filters=None):
+        return list(self.nodes)
+
+    def list_sizes(self):
+        return [FakeSize('c3.large')]
+
+    def create_node(self, name, ex_mincount=1, ex_maxcount=1, **kwargs):
+        self.created.append(dict(kwargs, name=name, count=ex_maxcount))
+        # EC2 doesn't return instances in launch order.
+        nodes = [FakeNode('i-%d' % (index,), launch_index=index)
+                 for index in reversed(range(ex_maxcount))]
+        for node in nodes:
+            node.name = name
+        if ex_maxcount == 1:
+            return nodes[0]
+        return nodes
+
+    def ex_create_tags(self, node, tags):
+        self.tagged.append((node.id, tags))
+
+
+def ec2_driver(name, driver, **kwargs):
+    """
+    :return: An ``EC2CloudDriver`` for the buildslave ``name`` using the
+        libcloud ``driver``.
+    """
+    return EC2CloudDriver(**dict(dict(
+        driver=driver, name=name, password='secret-' + name,
+        region='us-west-2', instance_type='c3.large',
+        keypair_name='hybrid-master', security_name='ssh',
+        image_id='buildslave-centos-7', image_tags={},
+        user_data='#!/bin/bash\nstart-buildslave\n',
+        instance_tags={
+            'Buildmaster': 'build.example.com', 'Class': name,
+            'Image': 'buildslave-centos-7'},
+        image_catalog=None,
+    ), **kwargs))
+
+
+class BuildslaveUserDataTests(SynchronousTestCase):
+    """
+    Tests for ``buildslave_user_data``.
+    """
+    def test_single(self):
+        """
+        A single node is given its buildslave's name and password, after the
+        interpreter line.
+        """
+        self.assertEqual(
+            "#!/bin/bash\n"
+            "BUILDSLAVE_NAME=aws/centos-7/0\n"
+            "BUILDSLAVE_PASSWORD='a b'\n"
+            "start-buildslave\n",
+            buildslave_user_data(
+                '#!/bin/bash\nstart-buildslave\n',
+                [('aws/centos-7/0', 'a b')]))
+
+    def test_several(self):
+        """
+        Nodes launched together choose their buildslave by launch index.
+        """
+        self.assertEqual(
+            "#!/bin/bash\n"
+            'case "$(curl -s ' + LAUNCH_INDEX_URL + ')" in\n'
+            "    0) BUILDSLAVE_NAME=aws/centos-7/0 BUILDSLAVE_PASSWORD=a ;;\n"
+            "    1) BUILDSLAVE_NAME=aws/centos-7/1 BUILDSLAVE_PASSWORD=b ;;\n"
+            "esac\n"
+            "start-buildslave\n",
+            buildslave_user_data(
+                '#!/bin/bash\nstart-buildslave\n',
+                [('aws/centos-7/0', 'a'), ('aws/centos-7/1', 'b')]))
+
+
+class EC2CloudDriverTests(SynchronousTestCase):
+    """
+    Tests for ``EC2CloudDriver``.
+    """
+    def test_list_buildmaster_instances(self):
+        """
+        Running and stopped nodes are listed, but terminated ones aren't.
+        """
+        nodes = [
+            FakeNode('i-running'),
+            FakeNode('i-stopped', NodeState.STOPPED),
+            FakeNode('i-terminated', NodeState.TERMINATED),
+        ]
+        driver = ec2_driver('aws/centos-7/0', FakeNodeDriver(nodes))
+        self.assertEqual(
+            ['i-running', 'i-stopped'],
+            [node.id for node in driver.list_buildmaster_instances()])
+
+    def test_create(self):
+        """
+        A single instance is launched with its buildslave's user data and
+        tags, and isn't tagged again.
+        """
+        libcloud = FakeNodeDriver()
+        node = ec2_driver('aws/centos-7/0', libcloud).create('ami-1234')
+        self.assertEqual(
+            ('i-0', 1,
+             buildslave_user_data(
+                 '#!/bin/bash\nstart-buildslave\n',
+                 [('aws/centos-7/0', 'secret-aws/centos-7/0')]),
+             []),
+            (node.id, libcloud.created[0]['count'],
+             libcloud.created[0]['ex_userdata'], libcloud.tagged))
+
+    def test_create_group(self):
+        """
+        The instances of several buildslaves are launched with one call, and
+        returned in launch order, each tagged with its buildslave's name.
+        """
+        libcloud = FakeNodeDriver()
+        drivers = [
+            ec2_driver('aws/centos-7/%d' % (i,), libcloud) for i in range(3)]
+        nodes = drivers[0].create_group(drivers, 'ami-1234')
+        self.assertEqual(
+            ([(node.id, node.name) for node in nodes],
+             [(1, 'aws/centos-7/0', 3)],
+             buildslave_user_data(
+                 '#!/bin/bash\nstart-buildslave\n',
+                 [(driver.name, driver.password) for driver in drivers]),
+             [('i-1', {'Name': 'aws/centos-7/1',
+                       'Class': 'aws/centos-7/1'}),
+              ('i-2', {'Name': 'aws/centos-7/2',
+                       'Class': 'aws/centos-7/2'})]),
+            ([('i-0', 'aws/centos-7/0'), ('i-1', 'aws/centos-7/1'),
+              ('i-2', 'aws/centos-7/2')],
+             [(len(libcloud.created), created['name'], created['count'])
+              for created in libcloud.created],
+             libcloud.created[0]['ex_userdata'],
+             libcloud.tagged))
+
+    def test_size_rejected(self):
+        """
+        If the provider rejects the size of the instance, the sizes are
+        listed again on the next launch.
+        """
+        libcloud = RejectingDriver(['c3.large'], Exception(
+            "Unsupported: The requested instance type (c3.large) is not "
+            "supported in your requested Availability Zone."))
+        driver = ec2_driver('aws/centos-7/0', libcloud)
+        self.assertRaises(Exception, driver.create, 'ami-1234')
+        get_size_cache(libcloud).get('c3.large')
+        self.assertEqual(2, libcloud.listings)
+
+    def test_other_failure(self):
+        """
+        If launching the instance fails for some other reason, the sizes
+        stay cached.
+        """
+        libcloud = RejectingDriver(
+            ['c3.large'], Exception("InsufficientInstanceCapacity"))
+        driver = ec2_driver('aws/centos-7/0', libcloud)
+        self.assertRaises(Exception, driver.create, 'ami-1234')
+        get_size_cache(libcloud).get('c3.large')
+        self.assertEqual(1, libcloud.listings)
+
+    def test_launch_group(self):
+        """
+        Buildslaves of the same slave class share a launch group, but not
+        ones with a different instance type.
+        """
+        libcloud = FakeNodeDriver()
+        self.assertEqual(
+            (True, False),
+            (ec2_driver('aws/centos-7/0', libcloud).launch_group()
+             == ec2_driver('aws/centos-7/1', libcloud).launch_group(),
+             ec2_driver('aws/centos-7/0', libcloud).launch_group()
+             == ec2_driver('aws/centos-7/1', libcloud,
+                           instance_type='c4.large').launch_group()))
+
+
+class FakeCloudDriver(object):
+    """
+    An ``ICloudDriver`` which records the calls made on it.
+    """
+    def __init__(self, name, calls, image_id='ubuntu-14.04', fail=False,
+                 fail_resume=False, throttled=0, instances=()):
+        self.name = name
+        self.instances = list(instances)
+        self.calls = calls
+        self.image_id = image_id
+        self.fail = fail
+        self.fail_resume = fail_resume
+        self.throttled = throttled
+
+    def get_image(self):
+        self.calls.append(('get_image', self.name))
+        return self.image_id
+
+    def get_image_metadata(self, image=None):
+        return {'image_name': image}
+
+    def find_instances(self):
+        return [({'image_name': self.image_id}, node)
+                for node in self.instances]
+
+    def stop_retained(self, node):
+        self.calls.append(('stop_retained', node.id))
+        node.state = NodeState.STOPPED
+
+    def is_stopped(self, node):
+        self.calls.append(('is_stopped', node.id))
+        return len(self.calls) > 2
+
+    def resume(self, node):
+        self.calls.append(('resume', node.id))
+        if self.fail_resume:
+            raise ValueError("Boom")
+        node.state = NodeState.RUNNING
+        return ({'image_name': self.image_id}, node)
+
+    def create(self, image=None):
+        self.calls.append(('create', self.name, image))
+        if self.fail:
+            raise ValueError("Boom")
+        if self.throttled:
+            self.throttled -= 1
+            raise RequestLimitExceeded()
+        return FakeNode(self.name)
+
+
+class InstanceBooterStartTests(SynchronousTestCase):
+    """
+    Tests for ``InstanceBooter`` creating nodes.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.threads = FakeThreads()
+        self.calls = []
+
+    def booter(self, name, **kwargs):
+        booter = InstanceBooter(
+            driver=FakeCloudDriver(name, self.calls, **kwargs),
+            deferToThread=self.threads,
+            reactor=self.clock,
+        )
+        booter.start()
+        return booter
+
+    def test_image(self):
+        """
+        The image is looked up once, and the node is created from it and
+        reports its metadata.
+        """
+        booter = self.booter('slave-0')
+        self.threads.run()
+        self.assertEqual(
+            (State.ACTIVE, {'image_name': 'ubuntu-14.04'},
+             [('get_image', 'slave-0'),
+              ('create', 'slave-0', 'ubuntu-14.04')]),
+            (booter.state, booter.image_metadata, self.calls))
+
+    def test_no_thread_while_backing_off(self):
+        """
+        While backing off after a throttled creation, no thread is occupied,
+        and the creation is tried again afterwards.
+        """
+        booters = [self.booter('slave-%d' % (i,), throttled=2)
+                   for i in range(10)]
+        self.threads.run()
+        # The first retry is at least 10 seconds later.
+        backing_off = []
+        for _ in range(9):
+            self.clock.advance(1)
+            backing_off.append(
+                (len(self.threads.queued), len(self.clock.getDelayedCalls())))
+        for _ in range(2 * 250):
+            self.clock.advance(1)
+            self.threads.run()
+        self.assertEqual(
+            ([(0, 10)] * 9, [State.ACTIVE] * 10, 30),
+            (backing_off, [booter.state for booter in booters],
+             len([call for call in self.calls if call[0] == 'create'])))
+
+    def test_other_failures(self):
+        """
+        Failures other than ``RequestLimitExceeded`` aren't retried on the
+        reactor; the booter logs them and starts again.
+        """
+        booter = self.booter('slave-0', fail=True)
+        self.threads.run()
+        self.assertEqual(
+            (State.STARTING, [], 1, True),
+            (booter.state, self.clock.getDelayedCalls(),
+             len(self.threads.queued),
+             bool(self.flushLoggedErrors(ValueError))))
+
+
+@implementer(IBatchingCloudDriver)
+class FakeBatchingDriver(FakeCloudDriver):
+    """
+    An ``IBatchingCloudDriver`` which records the calls made on it.
+    """
+    def __init__(self, name, calls, group='centos-7', **kwargs):
+        FakeCloudDriver.__init__(self, name, calls, **kwargs)
+        self.group = group
+
+    def launch_group(self):
+        return self.group
+
+    def create_group(self, drivers, image=None):
+        self.calls.append(
+            ('create_group', [driver.name for driver in drivers], image))
+        if self.fail:
+            raise ValueError("Boom")
+        if self.throttled:
+            self.throttled -= 1
+            raise RequestLimitExceeded()
+        return [FakeNode(driver.name) for driver in drivers]
+
+
+class BootSchedulerTests(SynchronousTestCase):
+    """
+    Tests for ``BootScheduler``, and ``InstanceBooter`` using it.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.threads = FakeThreads()
+        self.scheduler = BootScheduler(
+            window=1, _reactor=self.clock, _deferToThread=self.threads)
+        self.calls = []
+
+    def booter(self, name, **kwargs):
+        booter = InstanceBooter(
+            driver=FakeBatchingDriver(name, self.calls, **kwargs),
+            boot_scheduler=self.scheduler,
+            deferToThread=self.threads,
+            reactor=self.clock,
+        )
+        booter.start()
+        return booter
+
+    def test_window(self):
+        """
+        Nodes requested within the window are launched together, by launch
+        group, once the window has passed.
+        """
+        booters = [
+            self.booter('centos-7/0'),
+            self.booter('ubuntu-14.04/0', group='ubuntu-14.04'),
+            self.booter('centos-7/1'),
+        ]
+        waiting = len(self.threads.queued)
+        self.clock.advance(1)
+        self.threads.run()
+        self.assertEqual(
+            (0, [State.ACTIVE] * 3,
+             [('get_image', 'centos-7/0'),
+              ('create_group', ['centos-7/0', 'centos-7/1'], 'ubuntu-14.04'),
+              ('get_image', 'ubuntu-14.04/0'),
+              ('create', 'ubuntu-14.04/0', 'ubuntu-14.04')],
+             ['centos-7/0', 'ubuntu-14.04/0', 'centos-7/1']),
+            (waiting, [booter.state for booter in booters], self.calls,
+             [booter.node.id for booter in booters]))
+
+    def test_throttled(self):
+        """
+        If a launch is throttled, every node in it backs off, and is
+        requested again.
+        """
+        booters = [self.booter('centos-7/%d' % (i,), throttled=1)
+                   for i in range(2)]
+        self.clock.advance(1)
+        self.threads.run()
+        for _ in range(250):
+            self.clock.advance(1)
+            self.threads.run()
+        self.assertEqual(
+            [State.ACTIVE] * 2, [booter.state for booter in booters])
+
+    def test_failed(self):
+        """
+        If a launch fails, every node in it fails to start, and is requested
+        again.
+        """
+        booters = [self.booter('centos-7/%d' % (i,), fail=True)
+                   for i in range(2)]
+        self.clock.advance(1)
+        self.threads.run()
+        self.clock.advance(1)
+        self.flushLoggedErrors(ValueError)
+        self.assertEqual(
+            ([State.STARTING] * 2, 1, 1),
+            ([booter.state for booter in booters],
+             len([call for call in self.calls
+                  if call[0] == 'create_group']),
+             len(self.threads.queued)))
+
+
+class FakeNode(object):
+    def __init__(self, id, state=NodeState.RUNNING, launch_index=0):
+        self.id = self.name = id
+        self.state = state
+        self.destroyed = False
+        self.extra = {'launch_index': launch_index}
+
+    def destroy(self):
+        self.destroyed = True
+
+
+def state_durations(from_state, to_state):
+    """
+    :return: The count and sum of the recorded times spent in ``from_state``
+        before moving to ``to_state``.
+    """
+    labels = {
+        'slave_class': 'test/booter',
+        'from_state': from_state.name, 'to_state': to_state.name,
+    }
+    return tuple(
+        REGISTRY.get_sample_value(
+            'buildbot_instance_booter_state_seconds_' + sample, labels) or 0
+        for sample in ['count', 'sum'])
+
+
+class InstanceBooterTimingTests(SynchronousTestCase):
+    """
+    Tests for the state durations recorded by ``InstanceBooter``.
+    """
+    def setUp(self):
+        self.now = 1000
+        self.threads = FakeThreads()
+        self.booter = InstanceBooter(
+            driver=FakeCloudDriver('test/booter/0', []),
+            deferToThread=self.threads,
+            slave_class='test/booter',
+            clock=lambda: self.now,
+        )
+
+    def test_started(self):
+        """
+        The time spent starting an instance is recorded once it is active,
+        and ``time_in_state`` is the time since then.
+        """
+        before = state_durations(State.STARTING, State.ACTIVE)
+        self.booter.start()
+        self.now += 90
+        self.threads.run()
+        self.now += 15
+        after = state_durations(State.STARTING, State.ACTIVE)
+        self.assertEqual(
+            (State.ACTIVE, (1, 90), 15),
+            (self.booter.state, (after[0] - before[0], after[1] - before[1]),
+             self.booter.time_in_state()))
+
+    def test_cancelled(self):
+        """
+        The cancel paths are recorded, and inputs which don't change the
+        state aren't.
+        """
+        before = state_durations(State.STARTING, State.START_CANCELLED)
+        self.booter.start()
+        self.now += 20
+        self.booter.start()
+        self.now += 10
+        self.booter.stop()
+        after = state_durations(State.STARTING, State.START_CANCELLED)
+        self.assertEqual(
+            (1, 30), (after[0] - before[0], after[1] - before[1]))
+
+
+class InstanceBooterReconcileTests(SynchronousTestCase):
+    """
+    Tests for ``InstanceBooter.reconcile``.
+    """
+    def booter(self, instances, deferToThread=maybeDeferred):
+        return InstanceBooter(
+            driver=FakeCloudDriver(
+                'test/booter/0', [], instances=instances),
+            deferToThread=deferToThread,
+        )
+
+    def test_adopt(self):
+        """
+        A running node for the buildslave is adopted into the ``ACTIVE``
+        state.
+        """
+        booter = self.booter([FakeNode('i-1234')])
+        adopted = self.successResultOf(booter.reconcile())
+        self.assertEqual(
+            (True, State.ACTIVE, 'i-1234',
+             {'instance_id': 'i-1234', 'instance_name': 'i-1234'}),
+            (adopted, booter.state, booter.node.id,
+             booter.instance_metadata))
+
+    def test_nothing_to_adopt(self):
+        """
+        Without a running node, the booter stays ``IDLE``.
+        """
+        booter = self.booter([])
+        self.assertEqual(
+            (False, State.IDLE),
+            (self.successResultOf(booter.reconcile()), booter.state))
+
+    def test_already_started(self):
+        """
+        A node isn't adopted once a new node is being started.
+        """
+        booter = self.booter([FakeNode('i-1234')], FakeThreads())
+        booter.start()
+        self.assertEqual(
+            (False, State.STARTING),
+            (self.successResultOf(booter.reconcile()), booter.state))
+
+
+class InstanceBooterRetainTests(SynchronousTestCase):
+    """
+    Tests for ``InstanceBooter`` in retain mode.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.calls = []
+        self.driver = FakeCloudDriver('i-1234', self.calls)
+        self.booter = InstanceBooter(
+            driver=self.driver,
+            deferToThread=maybeDeferred,
+            retain=True,
+            reactor=self.clock,
+        )
+        self.booter.start()
+        self.node = self.booter.node
+        del self.calls[:]
+
+    def creations(self):
+        return len([call for call in self.calls if call[0] == 'create'])
+
+    def test_retain(self):
+        """
+        Stopping a node stops it, keeping it, and waits for it to finish
+        stopping.
+        """
+        self.booter.stop()
+        self.assertEqual(State.STOPPING, self.booter.state)
+        self.clock.advance(5)
+        self.assertEqual(
+            (State.STOPPED_RETAINED, [
+                ('stop_retained', 'i-1234'), ('is_stopped', 'i-1234'),
+                ('is_stopped', 'i-1234')]),
+            (self.booter.state, self.calls))
+
+    def test_resume(self):
+        """
+        Starting a retained node resumes it, rather than creating a new one.
+        """
+        self.booter.stop()
+        self.clock.advance(5)
+        self.booter.start()
+        self.assertEqual(
+            (State.ACTIVE, ('resume', 'i-1234'), 0, NodeState.RUNNING),
+            (self.booter.state, self.calls[-1], self.creations(),
+             self.node.state))
+
+    def test_resume_started(self):
+        """
+        Resuming a retained node counts as starting it.
+        """
+        self.booter.stop()
+        self.clock.advance(5)
+        self.assertEqual((True, False), (self.booter.start(),
+                                         self.booter.start()))
+
+    def test_not_retained(self):
+        """
+        A node stopped with ``retain=False`` is destroyed, even by a booter
+        which retains nodes.
+        """
+        self.booter.stop(retain=False)
+        self.assertEqual(
+            (State.IDLE, True, []),
+            (self.booter.state, self.node.destroyed, self.calls))
+
+    def test_resume_failed(self):
+        """
+        If resuming a retained node fails, it is destroyed and a new node is
+        created.
+        """
+        self.booter.stop()
+        self.clock.advance(5)
+        self.driver.fail_resume = True
+        self.booter.start()
+        self.flushLoggedErrors(ValueError)
+        self.assertEqual(
+            (State.ACTIVE, True, 1),
+            (self.booter.state, self.node.destroyed, self.creations()))
+
+    def test_adopt_retained(self):
+        """
+        A stopped node left by a previous buildmaster is adopted as retained.
+        """
+        booter = InstanceBooter(
+            driver=FakeCloudDriver(
+                'test/booter/0', [],
+                instances=[FakeNode('i-5678', NodeState.STOPPED)]),
+            deferToThread=maybeDeferred,
+            retain=True,
+        )
+        self.assertEqual(
+            (False, State.STOPPED_RETAINED, 'i-5678'),
+            (self.successResultOf(booter.reconcile()), booter.state,
+             booter.node.id))
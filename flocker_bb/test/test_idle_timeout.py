@@ -0,0 +1,140 @@
+"""
+Tests for ``flocker_bb.idle_timeout``.
+"""
+from prometheus_client import REGISTRY
+
+from twisted.internet.task import Clock
+from twisted.trial.unittest import SynchronousTestCase
+
+from flocker_bb.idle_timeout import (
+    AdaptiveIdleTimeout, IdleTimeoutConfiguration)
+from flocker_bb.test.fakes import (
+    FakeBotMaster, FakeMaster, FakeSlave, FakeStatus)
+
+
+class IdleTimeoutConfigurationTests(SynchronousTestCase):
+    """
+    Tests for ``IdleTimeoutConfiguration``.
+    """
+    def setUp(self):
+        self.config = IdleTimeoutConfiguration(
+            minimum=300, maximum=3000, window=3600, multiplier=3)
+
+    def test_from_config(self):
+        """
+        Missing keys take their default values.
+        """
+        self.assertEqual(
+            IdleTimeoutConfiguration(minimum=60, maximum=50 * 60),
+            IdleTimeoutConfiguration.from_config({'minimum': 60}))
+
+    def test_busy(self):
+        """
+        When the next request is expected within the minimum, slaves wait the
+        maximum.
+        """
+        self.assertEqual(
+            [3000, 3000], [self.config.timeout(60), self.config.timeout(36)])
+
+    def test_moderate(self):
+        """
+        Between the bounds, the timeout grows with the arrival rate.
+        """
+        self.assertEqual(
+            [1500, 750], [self.config.timeout(18), self.config.timeout(9)])
+
+    def test_quiet(self):
+        """
+        When the next request isn't expected within the maximum, slaves wait
+        the minimum.
+        """
+        self.assertEqual(
+            [300, 300], [self.config.timeout(3), self.config.timeout(1)])
+
+    def test_no_arrivals(self):
+        """
+        When no requests arrived, slaves wait the minimum.
+        """
+        self.assertEqual(300, self.config.timeout(0))
+
+    def test_monotonic(self):
+        """
+        More arrivals never give a shorter timeout, and the timeout stays
+        within the bounds.
+        """
+        timeouts = [self.config.timeout(n) for n in range(100)]
+        self.assertEqual(
+            (sorted(timeouts), 300, 3000),
+            (timeouts, min(timeouts), max(timeouts)))
+
+
+class FakePoller(object):
+    def __init__(self, slaves):
+        self.slaves = slaves
+
+
+class AdaptiveIdleTimeoutTests(SynchronousTestCase):
+    """
+    Tests for ``AdaptiveIdleTimeout``.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.slave = FakeSlave('aws/ubuntu-14.04/0', 'aws/ubuntu-14.04')
+        self.other = FakeSlave('aws/centos-7/0', 'aws/centos-7')
+        self.master = FakeMaster(
+            FakeBotMaster([self.slave, self.other]))
+        self.idle_timeout = AdaptiveIdleTimeout(
+            FakePoller({
+                'omnibus': [self.slave],
+                'centos': [self.other],
+            }),
+            {'aws/ubuntu-14.04': IdleTimeoutConfiguration(
+                minimum=300, maximum=3000, window=3600, multiplier=3)},
+            _reactor=self.clock,
+        )
+        self.idle_timeout.parent = FakeStatus(self.master)
+        self.idle_timeout.startService()
+
+    def test_configured_slaves(self):
+        """
+        Only slaves in a configured slave class use the adaptive timeout, and
+        only while it is running.
+        """
+        before = [self.slave.idle_timeout, self.other.idle_timeout]
+        self.idle_timeout.stopService()
+        self.assertEqual(
+            ([self.idle_timeout, None], [None, None]),
+            (before, [self.slave.idle_timeout, self.other.idle_timeout]))
+
+    def test_arrivals(self):
+        """
+        The timeout is chosen from the requests for builders the slave class
+        is allocated to, within the window.
+        """
+        for _ in range(18):
+            self.master.submit('omnibus')
+            self.master.submit('centos')
+            self.clock.advance(60)
+        busy = self.idle_timeout.timeout(self.slave)
+        self.clock.advance(3600)
+        self.assertEqual(
+            (1500, 300, 300),
+            (busy, self.idle_timeout.timeout(self.slave),
+             REGISTRY.get_sample_value(
+                 'buildbot_idle_timeout_seconds',
+                 {'slave_class': 'aws/ubuntu-14.04'})))
+
+    def test_reused(self):
+        """
+        Builds started on slaves which have been idle for longer than the
+        minimum timeout are counted as boots avoided.
+        """
+        labels = {'slave_class': 'aws/ubuntu-14.04'}
+        before = REGISTRY.get_sample_value(
+            'buildbot_idle_timeout_boots_avoided_total', labels) or 0
+        self.idle_timeout.reused(self.slave, 200)
+        self.idle_timeout.reused(self.slave, 400)
+        self.assertEqual(
+            before + 1,
+            REGISTRY.get_sample_value(
+                'buildbot_idle_timeout_boots_avoided_total', labels))
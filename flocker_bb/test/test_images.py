@@ -0,0 +1,185 @@
+"""
+Tests for ``flocker_bb.images``.
+"""
+from threading import Condition, Event, Thread
+
+from twisted.internet.task import Clock
+from twisted.trial.unittest import SynchronousTestCase
+
+from flocker_bb.images import ImageCatalog, ImageIndex
+
+
+class FakeImage(object):
+    def __init__(self, id, tags):
+        self.id = id
+        self.tags = tags
+
+
+class FakeThreadReactor(object):
+    """
+    Record the calls made with ``callFromThread``.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def callFromThread(self, f, *args, **kwargs):
+        self.calls.append((f, args, kwargs))
+
+
+class WaitingCondition(object):
+    """
+    A ``Condition`` which sets ``waiting`` once a thread waits on it.
+    """
+    def __init__(self, lock):
+        self._condition = Condition(lock)
+        self.waiting = Event()
+
+    def wait(self):
+        self.waiting.set()
+        self._condition.wait()
+
+    def notify_all(self):
+        self._condition.notify_all()
+
+
+class ImageIndexTests(SynchronousTestCase):
+    """
+    Tests for ``ImageIndex``.
+    """
+    def setUp(self):
+        self.index = ImageIndex([
+            FakeImage('ami-1', {'base_name': 'centos-7', 'timestamp': '1',
+                                'production': 'true'}),
+            FakeImage('ami-2', {'base_name': 'centos-7', 'timestamp': '3'}),
+            FakeImage('ami-3', {'base_name': 'centos-7', 'timestamp': '2',
+                                'production': 'true'}),
+            FakeImage('ami-4', {'base_name': 'ubuntu-14.04',
+                                'timestamp': '4', 'production': 'true'}),
+        ], get_tags=lambda image: image.tags)
+
+    def test_newest(self):
+        """
+        ``ImageIndex.newest`` returns the image with the latest timestamp
+        with the given name.
+        """
+        self.assertEqual('ami-2', self.index.newest('centos-7', {}).id)
+
+    def test_newest_tagged(self):
+        """
+        ``ImageIndex.newest`` only considers images which have all the
+        required tags.
+        """
+        self.assertEqual(
+            'ami-3',
+            self.index.newest('centos-7', {'production': 'true'}).id)
+
+    def test_unknown(self):
+        """
+        ``ImageIndex.newest`` raises ``ValueError`` if no image matches.
+        """
+        self.assertRaises(
+            ValueError, self.index.newest, 'ubuntu-14.04',
+            {'production': 'false'})
+
+    def test_get(self):
+        """
+        ``ImageIndex.get`` looks up images by id.
+        """
+        self.assertEqual(
+            ('ami-3', None),
+            (self.index.get('ami-3').id, self.index.get('ami-5')))
+
+
+class ImageCatalogTests(SynchronousTestCase):
+    """
+    Tests for ``ImageCatalog``.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.reactor = FakeThreadReactor()
+        self.listings = 0
+        self.available = [
+            FakeImage('ami-1', {'base_name': 'ubuntu-14.04'}),
+            FakeImage('ami-2', {'base_name': 'centos-7'}),
+            FakeImage('ami-3', {'base_name': 'ubuntu-14.04'}),
+        ]
+        self.catalog = ImageCatalog(
+            list_images=self.list_images,
+            get_tags=lambda image: image.tags,
+            ttl=600, refresh_after=300,
+            clock=self.clock.seconds, _reactor=self.reactor,
+        )
+
+    def list_images(self):
+        self.listings += 1
+        return list(self.available)
+
+    def test_indexed_by_base_name(self):
+        """
+        ``ImageCatalog.index`` indexes the images by their ``base_name`` tag.
+        """
+        images = self.catalog.index().images('ubuntu-14.04')
+        self.assertEqual(['ami-1', 'ami-3'], [image.id for image in images])
+
+    def test_cached(self):
+        """
+        Images are only listed once while the listing is fresh, no matter how
+        many lookups are done.
+        """
+        for _ in range(10):
+            self.catalog.index().images('ubuntu-14.04')
+            self.catalog.index().images('centos-7')
+        self.assertEqual((1, []), (self.listings, self.reactor.calls))
+
+    def test_expired(self):
+        """
+        Once the listing is older than ``ttl``, the next lookup reloads it.
+        """
+        self.catalog.index().images('centos-7')
+        self.available.append(FakeImage('ami-4', {'base_name': 'centos-7'}))
+        self.clock.advance(600)
+        self.assertEqual(
+            (['ami-2', 'ami-4'], 2),
+            ([image.id for image in self.catalog.index().images('centos-7')],
+             self.listings))
+
+    def test_stale_refreshes_in_background(self):
+        """
+        Once the listing is older than ``refresh_after``, lookups return the
+        cached listing and a single background refresh is scheduled.
+        """
+        self.catalog.index().images('centos-7')
+        self.clock.advance(300)
+        self.catalog.index().images('centos-7')
+        self.catalog.index().images('centos-7')
+        self.assertEqual(
+            (1, [self.catalog._refreshInBackground]),
+            (self.listings, [f for (f, _, _) in self.reactor.calls]))
+
+    def test_single_listing(self):
+        """
+        While one thread lists the images, others needing a listing wait for
+        it rather than listing them again.
+        """
+        listing, release = Event(), Event()
+
+        def list_images():
+            listing.set()
+            release.wait(10)
+            return self.list_images()
+        self.catalog.list_images = list_images
+        self.catalog._refreshed = WaitingCondition(self.catalog._lock)
+        indexes = []
+        threads = [
+            Thread(target=lambda: indexes.append(self.catalog.index()))
+            for _ in range(2)]
+        threads[0].start()
+        listing.wait(10)
+        threads[1].start()
+        self.catalog._refreshed.waiting.wait(10)
+        release.set()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(
+            (1, 2, True),
+            (self.listings, len(indexes), indexes[0] is indexes[1]))
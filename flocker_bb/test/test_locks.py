@@ -0,0 +1,430 @@
+"""
+Tests for ``flocker_bb.locks``.
+"""
+from gzip import GzipFile
+from StringIO import StringIO
+
+from prometheus_client import REGISTRY
+
+import json
+
+from twisted.internet.task import Clock
+from twisted.trial.unittest import SynchronousTestCase
+from twisted.web.test.requesthelper import DummyRequest
+
+from buildbot.locks import BaseLock, MasterLock, SlaveLock
+from buildbot.status.results import FAILURE, SUCCESS
+from buildbot.util import eventual
+
+from flocker_bb.locks import (
+    THROTTLE_SCAN_BYTES, AdaptiveMasterLock, LockFeedback, LockMetrics,
+    LocksResource, logTail, throttled)
+from flocker_bb.test.fakes import (
+    FakeBotMaster, FakeBuilder, FakeMaster, FakeSlave, FakeStatus,
+    FakeThreads)
+
+
+class FakeLog(object):
+    openfile = None
+
+    def __init__(self, text):
+        self.text = text
+
+    def getFile(self):
+        return StringIO(self.text)
+
+
+class FakeStepStatus(object):
+    def __init__(self, results, text):
+        self.results = results
+        self.logs = [FakeLog(text)]
+
+    def getResults(self):
+        return (self.results, [])
+
+    def getLogs(self):
+        return self.logs
+
+
+class FakeBuildStatus(object):
+    def __init__(self, steps):
+        self.steps = steps
+
+    def getSteps(self):
+        return self.steps
+
+
+THROTTLED_BUILD = FakeBuildStatus([
+    FakeStepStatus(SUCCESS, 'RequestLimitExceeded while listing'),
+    FakeStepStatus(
+        FAILURE, 'EC2ResponseError: 503 RequestLimitExceeded'),
+])
+
+
+class ThrottledTests(SynchronousTestCase):
+    """
+    Tests for ``throttled``.
+    """
+    def test_throttled(self):
+        """
+        Builds with a failed step logging a throttling error were throttled.
+        """
+        self.assertTrue(throttled(THROTTLED_BUILD))
+
+    def test_passed_steps(self):
+        """
+        Throttling errors logged by steps which passed don't count.
+        """
+        self.assertFalse(throttled(FakeBuildStatus([
+            FakeStepStatus(SUCCESS, 'RequestLimitExceeded; retrying'),
+            FakeStepStatus(FAILURE, 'AssertionError'),
+        ])))
+
+    def test_tail(self):
+        """
+        Only the end of each log is searched.
+        """
+        padding = 'x' * THROTTLE_SCAN_BYTES
+        self.assertEqual(
+            (False, True),
+            (throttled(FakeBuildStatus([FakeStepStatus(
+                FAILURE, 'RequestLimitExceeded\n' + padding)])),
+             throttled(FakeBuildStatus([FakeStepStatus(
+                 FAILURE, padding + 'RequestLimitExceeded\n')]))))
+
+
+class LogTailTests(SynchronousTestCase):
+    """
+    Tests for ``logTail``.
+    """
+    def test_gzip(self):
+        """
+        The end of gzipped logs, which can't seek from the end, is read.
+        """
+        path = self.mktemp()
+        f = GzipFile(path, 'wb')
+        f.write('a' * 100 + 'b' * 10)
+        f.close()
+
+        class GzipLog(object):
+            openfile = None
+
+            def getFile(self):
+                return GzipFile(path, 'rb')
+        self.assertEqual('a' * 5 + 'b' * 10, logTail(GzipLog(), size=15))
+
+
+class Owner(object):
+    pass
+
+
+class RealAdaptiveMasterLockTests(SynchronousTestCase):
+    """
+    Tests for ``RealAdaptiveMasterLock``.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        eventual._setReactor(self.clock)
+        self.addCleanup(eventual._setReactor)
+        self.lockid = AdaptiveMasterLock(
+            'test-lock', minimum=1, maximum=4, initial=2)
+        self.access = self.lockid.access('counting')
+        self.lock = self.lockid.lockClass(self.lockid)
+
+    def claim(self):
+        owner = Owner()
+        self.assertTrue(self.lock.isAvailable(owner, self.access))
+        self.lock.claim(owner, self.access)
+        return owner
+
+    def test_initial(self):
+        """
+        The lock starts with ``initial`` capacity, which is exported.
+        """
+        self.assertEqual(
+            (2, 2),
+            (self.lock.maxCount,
+             REGISTRY.get_sample_value(
+                 'buildbot_lock_capacity', {'lock': 'test-lock'})))
+
+    def test_additive_increase(self):
+        """
+        The capacity grows by one for every ``capacity`` successful builds,
+        up to ``maximum``.
+        """
+        counts = []
+        for i in range(10):
+            self.lock.succeeded()
+            counts.append(self.lock.maxCount)
+        self.assertEqual([2, 2, 3, 3, 3, 4, 4, 4, 4, 4], counts)
+
+    def test_multiplicative_decrease(self):
+        """
+        Throttling halves the capacity, down to ``minimum``.
+        """
+        self.lockid.initial = 4
+        lock = self.lockid.lockClass(self.lockid)
+        counts = []
+        for i in range(3):
+            lock.throttled()
+            counts.append(lock.maxCount)
+        self.assertEqual([2, 1, 1], counts)
+
+    def test_below_owners(self):
+        """
+        If the capacity drops below the number of owners, they keep the lock
+        and nobody else gets it until enough have released it.
+        """
+        owners = [self.claim(), self.claim()]
+        self.lock.throttled()
+        self.assertFalse(self.lock.isAvailable(Owner(), self.access))
+        self.lock.release(owners[0], self.access)
+        self.assertFalse(self.lock.isAvailable(Owner(), self.access))
+        self.lock.release(owners[1], self.access)
+        self.claim()
+
+    def test_wake_waiters(self):
+        """
+        Builds waiting for the lock are woken when its capacity grows.
+        """
+        self.claim()
+        self.claim()
+        waiter = Owner()
+        d = self.lock.waitUntilMaybeAvailable(waiter, self.access)
+        self.lock.succeeded()
+        self.lock.succeeded()
+        self.assertNoResult(d)
+        self.lock.succeeded()
+        self.clock.advance(0)
+        self.successResultOf(d)
+        self.lock.claim(waiter, self.access)
+
+
+class LockFeedbackTests(SynchronousTestCase):
+    """
+    Tests for ``LockFeedback``.
+    """
+    def setUp(self):
+        self.lockid = AdaptiveMasterLock(
+            'feedback-lock', minimum=1, maximum=4, initial=2.9)
+        self.botmaster = FakeBotMaster(builders=[
+            FakeBuilder('acceptance', locks=[self.lockid.access('counting')]),
+            FakeBuilder('storage', locks=[self.lockid.access('counting')]),
+            FakeBuilder(
+                'docs', locks=[MasterLock('other').access('counting')]),
+        ])
+        self.threads = FakeThreads()
+        self.feedback = LockFeedback(_deferToThread=self.threads)
+        self.feedback.parent = FakeStatus(FakeMaster(self.botmaster))
+        self.feedback.startService()
+        self.addCleanup(self.feedback.stopService)
+
+    def capacity(self):
+        return self.botmaster.getLockByID(self.lockid).maxCount
+
+    def test_success(self):
+        """
+        Successful builds increase the capacity of the adaptive locks of
+        their builder, and builds are started on every builder using them.
+        """
+        self.feedback.buildFinished(
+            'acceptance', FakeBuildStatus([]), SUCCESS)
+        self.assertEqual(
+            (3, ['acceptance', 'storage']),
+            (self.capacity(), sorted(self.botmaster.started)))
+
+    def test_success_not_grown(self):
+        """
+        If the capacity of the locks doesn't grow enough to allow another
+        build, no builds are started.
+        """
+        self.feedback.buildFinished(
+            'acceptance', FakeBuildStatus([]), SUCCESS)
+        self.feedback.buildFinished(
+            'acceptance', FakeBuildStatus([]), SUCCESS)
+        self.assertEqual(
+            (3, 2), (self.capacity(), len(self.botmaster.started)))
+
+    def test_throttled(self):
+        """
+        Builds which failed because they were throttled decrease the capacity
+        of the adaptive locks of their builder.
+        """
+        self.feedback.buildFinished('acceptance', THROTTLED_BUILD, FAILURE)
+        self.threads.run()
+        self.assertEqual(1, self.capacity())
+
+    def test_logs_in_thread(self):
+        """
+        The logs of failed builds are searched in a thread.
+        """
+        self.feedback.buildFinished('acceptance', THROTTLED_BUILD, FAILURE)
+        self.assertEqual(
+            (2, [(throttled, (THROTTLED_BUILD,))]),
+            (self.capacity(),
+             [(f, args) for (d, f, args) in self.threads.queued]))
+
+    def test_search_failed(self):
+        """
+        If searching the logs fails, the error is logged and the capacity is
+        left alone.
+        """
+        self.feedback.buildFinished(
+            'acceptance', FakeBuildStatus(None), FAILURE)
+        self.threads.run()
+        self.assertEqual(
+            (2, 1), (self.capacity(), len(self.flushLoggedErrors())))
+
+    def test_other_failure(self):
+        """
+        Builds which failed for other reasons leave the capacity alone.
+        """
+        self.feedback.buildFinished(
+            'acceptance',
+            FakeBuildStatus([FakeStepStatus(FAILURE, 'AssertionError')]),
+            FAILURE)
+        self.threads.run()
+        self.assertEqual(2, self.capacity())
+
+    def test_other_locks(self):
+        """
+        Builders without adaptive locks are ignored.
+        """
+        self.feedback.buildFinished('docs', THROTTLED_BUILD, FAILURE)
+        self.assertEqual({}, self.botmaster.locks)
+
+
+class FakeOwnerBuilder(object):
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeBuild(object):
+    def __init__(self, builderName):
+        self.builder = FakeOwnerBuilder(builderName)
+
+    def __repr__(self):
+        return '<Build %s>' % (self.builder.name,)
+
+
+def sample(name, lock):
+    return REGISTRY.get_sample_value(
+        'buildbot_lock_' + name, {'lock': lock}) or 0
+
+
+class LockMetricsTests(SynchronousTestCase):
+    """
+    Tests for ``LockMetrics``.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.metrics = LockMetrics(_reactor=self.clock)
+        self.lock = BaseLock('metrics-lock', maxCount=1)
+        self.access = MasterLock('metrics-lock').access('counting')
+        self.before = {
+            name: sample(name, 'metrics-lock')
+            for name in ['wait_seconds_sum', 'wait_seconds_count',
+                         'holders', 'waiters']}
+
+    def change(self, name):
+        return sample(name, 'metrics-lock') - self.before[name]
+
+    def test_claimed_immediately(self):
+        """
+        Claiming a lock without waiting is recorded as a wait of zero, and
+        the claimer counts as a holder until it releases it.
+        """
+        build = FakeBuild('omnibus')
+        self.metrics.claimed(self.lock, build)
+        holders = self.change('holders')
+        self.metrics.released(self.lock, build)
+        self.assertEqual(
+            (1, 0, 1, 0),
+            (self.change('wait_seconds_count'),
+             self.change('wait_seconds_sum'),
+             holders, self.change('holders')))
+
+    def test_queued(self):
+        """
+        Owners which queue for a lock are waiters until they claim it, and
+        their wait is recorded.
+        """
+        build = FakeBuild('omnibus')
+        self.metrics.waiting(self.lock, build)
+        self.clock.advance(10)
+        self.metrics.waiting(self.lock, build)
+        waiters = self.change('waiters')
+        self.clock.advance(20)
+        self.metrics.claimed(self.lock, build)
+        self.assertEqual(
+            (1, 0, 30),
+            (waiters, self.change('waiters'),
+             self.change('wait_seconds_sum')))
+
+    def test_stopped_waiting(self):
+        """
+        Owners which stop waiting aren't waiters any more.
+        """
+        build = FakeBuild('omnibus')
+        self.metrics.waiting(self.lock, build)
+        self.metrics.stoppedWaiting(self.lock, build)
+        self.clock.advance(20)
+        self.metrics.claimed(self.lock, build)
+        self.assertEqual(
+            (0, 0), (self.change('waiters'), self.change('wait_seconds_sum')))
+
+    def test_blocked_builder(self):
+        """
+        A builder is a waiter from when it is blocked until the lock is
+        available, and its build's wait is counted from when it was blocked.
+        """
+        self.metrics.blocked(self.lock, 'omnibus')
+        self.clock.advance(60)
+        self.metrics.blocked(self.lock, 'omnibus')
+        waiters = self.change('waiters')
+        self.metrics.unblocked(self.lock, 'omnibus')
+        unblocked = self.change('waiters')
+        self.clock.advance(5)
+        self.metrics.claimed(self.lock, FakeBuild('omnibus'))
+        self.assertEqual(
+            (1, 0, 0, 65),
+            (waiters, unblocked, self.change('waiters'),
+             self.change('wait_seconds_sum')))
+
+    def test_describe(self):
+        """
+        ``describe`` lists every master lock and every per-slave lock, with
+        their holders and waiters.
+        """
+        slave_lock = SlaveLock('functional-tests')
+        real_slave_lock = slave_lock.lockClass(slave_lock)
+        real_slave_lock.getLock(FakeSlave('osx/0'))
+        botmaster = FakeBotMaster()
+        botmaster.locks = {
+            MasterLock('metrics-lock'): self.lock,
+            slave_lock: real_slave_lock,
+        }
+        self.lock.claim(FakeBuild('omnibus'), self.access)
+        self.metrics.blocked(self.lock, 'docs')
+        self.clock.advance(15)
+        self.assertEqual([
+            {'name': 'functional-tests', 'slave': 'osx/0', 'maxCount': 1,
+             'holders': [], 'waiters': []},
+            {'name': 'metrics-lock', 'slave': None, 'maxCount': 1,
+             'holders': ['<Build omnibus>'],
+             'waiters': [{'waiter': 'docs', 'seconds': 15}]},
+        ], self.metrics.describe(botmaster))
+
+    def test_resource(self):
+        """
+        ``LocksResource`` renders the description of the locks as JSON.
+        """
+        botmaster = FakeBotMaster()
+        botmaster.locks = {MasterLock('metrics-lock'): self.lock}
+        request = DummyRequest([])
+        body = LocksResource(
+            FakeMaster(botmaster), self.metrics).render_GET(request)
+        self.assertEqual(
+            ([b'application/json'], self.metrics.describe(botmaster)),
+            (request.responseHeaders.getRawHeaders(b'content-type'),
+             json.loads(body)))
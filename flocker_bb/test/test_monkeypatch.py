@@ -0,0 +1,100 @@
+"""
+Tests for ``flocker_bb.monkeypatch``.
+"""
+from twisted.internet.defer import succeed
+from twisted.trial.unittest import SynchronousTestCase
+
+from flocker_bb.monkeypatch import NoFallBackBuildChooser
+
+
+class FakeSourceStamp(object):
+    def __init__(self, branch):
+        self.branch = branch
+
+
+class FakeBuildRequest(object):
+    def __init__(self, brid, branch):
+        self.id = brid
+        self.sources = {'flocker': FakeSourceStamp(branch)}
+        self.submittedAt = None
+
+    def __repr__(self):
+        return '<BuildRequest %d>' % (self.id,)
+
+
+class FakeBuildRequests(object):
+    def __init__(self, requests):
+        self.requests = requests
+
+    def getBuildRequests(self, buildername, claimed):
+        return succeed([
+            {'brid': request.id, 'submitted_at': None}
+            for request in self.requests])
+
+
+class FakeDB(object):
+    def __init__(self, requests):
+        self.buildrequests = FakeBuildRequests(requests)
+
+
+class FakeMaster(object):
+    def __init__(self, requests):
+        self.db = FakeDB(requests)
+
+
+class FakeBuilderConfig(object):
+    nextBuild = None
+
+    def __init__(self, nextSlave):
+        self.nextSlave = nextSlave
+
+
+class FakeBuilder(object):
+    name = 'omnibus'
+
+    def __init__(self, slaves, nextSlave, canStartBuild):
+        self.slaves = slaves
+        self.config = FakeBuilderConfig(nextSlave)
+        self.canStartBuild = canStartBuild
+
+    def getAvailableSlaves(self):
+        return list(self.slaves)
+
+    def getMergeRequestsFn(self):
+        return None
+
+    def canStartWithSlavebuilder(self, slave):
+        return True
+
+
+class NoFallBackBuildChooserTests(SynchronousTestCase):
+    """
+    Tests for ``NoFallBackBuildChooser``.
+    """
+    def test_rejected_request(self):
+        """
+        If no slave can start the chosen request, ``nextSlave`` is asked to
+        choose again from all the slaves, for the next request.
+        """
+        requests = [
+            FakeBuildRequest(1, 'master'),
+            FakeBuildRequest(2, 'some-feature-FLOC-1234'),
+        ]
+        seen = []
+
+        def nextSlave(builder, slaves, request):
+            seen.append(request)
+            if request is requests[1] and 'slave-1' in slaves:
+                return 'slave-1'
+            return slaves[0]
+        nextSlave.takes_request = True
+
+        builder = FakeBuilder(
+            ['slave-0', 'slave-1'], nextSlave,
+            lambda slave, request: request is not requests[0])
+        chooser = NoFallBackBuildChooser(builder, FakeMaster(requests))
+        chooser.breqCache = {request.id: request for request in requests}
+        self.assertEqual(
+            (('slave-1', [requests[1]]),
+             [requests[0], requests[0], requests[1]]),
+            (self.successResultOf(chooser.chooseNextBuild()), seen))
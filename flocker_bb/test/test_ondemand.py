@@ -10,6 +10,8 @@ import yaml
 from twisted.python.filepath import FilePath
 from twisted.trial.unittest import SynchronousTestCase
 
+from buildbot.config import ConfigErrors
+
 from zope.interface.verify import verifyObject
 
 from flocker_bb import __file__ as flocker_bb_dir
@@ -109,9 +111,13 @@ class RackspaceSlaveTests(OnDemandBuildSlaveTestsMixin, SynchronousTestCase):
     ``OnDemandBuildSlave`` that it returns.
     """
     def setUp(self):
+        self.buildslave = self.rackspace_slave()
+
+    def rackspace_slave(self, **config):
         slave_name, slave_config = rackspace_slave_config()
+        slave_config = dict(slave_config, **config)
         credentials = sample_credentials('rackspace')
-        self.buildslave = rackspace_slave(
+        return rackspace_slave(
             name=slave_name,
             password=generate_password(32),
             config=slave_config,
@@ -122,3 +128,9 @@ class RackspaceSlaveTests(OnDemandBuildSlaveTestsMixin, SynchronousTestCase):
             buildmaster=sample_build_master(),
             max_builds=None,
         )
+
+    def test_retain_rejected(self):
+        """
+        Rackspace slaves can't be configured to retain their nodes.
+        """
+        self.assertRaises(ConfigErrors, self.rackspace_slave, retain=True)
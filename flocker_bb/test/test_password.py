@@ -0,0 +1,80 @@
+"""
+Tests for ``flocker_bb.password``.
+"""
+import os
+import stat
+
+from twisted.python.filepath import FilePath
+from twisted.trial.unittest import SynchronousTestCase
+
+from flocker_bb.password import chars, derive_password, load_secret
+
+
+class DerivePasswordTests(SynchronousTestCase):
+    """
+    Tests for ``derive_password``.
+    """
+    def test_stable(self):
+        """
+        The same secret and name give the same password.
+        """
+        self.assertEqual(
+            derive_password('secret', 'aws/centos-7/0'),
+            derive_password('secret', u'aws/centos-7/0'))
+
+    def test_different(self):
+        """
+        Different names or secrets give different passwords.
+        """
+        self.assertEqual(
+            3, len({
+                derive_password('secret', 'aws/centos-7/0'),
+                derive_password('secret', 'aws/centos-7/1'),
+                derive_password('other', 'aws/centos-7/0'),
+            }))
+
+    def test_characters(self):
+        """
+        The password has the requested length, and only contains characters
+        from ``chars``.
+        """
+        password = derive_password('secret', 'aws/centos-7/0', length=100)
+        self.assertEqual(
+            (100, set()), (len(password), set(password) - set(chars)))
+
+
+class LoadSecretTests(SynchronousTestCase):
+    """
+    Tests for ``load_secret``.
+    """
+    def test_persistent(self):
+        """
+        A secret is created the first time, and loaded after that.
+        """
+        path = FilePath(self.mktemp())
+        self.assertEqual(load_secret(path), load_secret(path))
+
+    def test_private(self):
+        """
+        The secret is only readable by its owner.
+        """
+        path = FilePath(self.mktemp())
+        load_secret(path)
+        self.assertEqual(0600, stat.S_IMODE(os.stat(path.path).st_mode))
+
+    def test_no_temporary_files(self):
+        """
+        Only the secret is left in its directory after creating it.
+        """
+        directory = FilePath(self.mktemp())
+        directory.makedirs()
+        load_secret(directory.child('secret'))
+        self.assertEqual(['secret'], directory.listdir())
+
+    def test_empty(self):
+        """
+        An empty secret is rejected rather than used.
+        """
+        path = FilePath(self.mktemp())
+        path.setContent('')
+        self.assertRaises(ValueError, load_secret, path)
@@ -0,0 +1,152 @@
+"""
+Tests for ``flocker_bb.pending``.
+"""
+from twisted.internet.defer import Deferred
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
+from twisted.trial.unittest import SynchronousTestCase
+
+from flocker_bb.pending import PendingRequestPoller, index_slaves
+from flocker_bb.test.fakes import (
+    FakeBotMaster, FakeBuilder, FakeMaster, FakeSlave, FakeStatus)
+
+
+class FakeBuildRequests(object):
+    def __init__(self):
+        self.queries = []
+
+    def getBuildRequests(self, claimed):
+        d = Deferred()
+        self.queries.append(d)
+        return d
+
+
+class FakeDB(object):
+    def __init__(self):
+        self.buildrequests = FakeBuildRequests()
+
+
+def make_botmaster():
+    slaves = [
+        FakeSlave('aws/ubuntu-14.04/0'),
+        FakeSlave('aws/ubuntu-14.04/1'),
+        FakeSlave('osx/0', on_demand=False),
+    ]
+    builders = [
+        FakeBuilder('omnibus', ['aws/ubuntu-14.04/0', 'aws/ubuntu-14.04/1']),
+        FakeBuilder('docs', ['aws/ubuntu-14.04/1']),
+        FakeBuilder('osx', ['osx/0']),
+    ]
+    return slaves, FakeBotMaster(slaves, builders)
+
+
+class IndexSlavesTests(SynchronousTestCase):
+    """
+    Tests for ``index_slaves``.
+    """
+    def test_index(self):
+        """
+        On-demand slaves are indexed by builder name, and their builders by
+        slave name.  Other slaves are left out.
+        """
+        slaves, botmaster = make_botmaster()
+        self.assertEqual(
+            ({'omnibus': slaves[:2], 'docs': [slaves[1]]},
+             {'aws/ubuntu-14.04/0': frozenset(['omnibus']),
+              'aws/ubuntu-14.04/1': frozenset(['omnibus', 'docs'])}),
+            index_slaves(botmaster))
+
+
+class PendingRequestPollerTests(SynchronousTestCase):
+    """
+    Tests for ``PendingRequestPoller``.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.slaves, botmaster = make_botmaster()
+        self.master = FakeMaster(botmaster, FakeDB())
+        self.queries = self.master.db.buildrequests.queries
+        self.poller = PendingRequestPoller(
+            interval=30, delay=1, _reactor=self.clock)
+        self.poller.parent = FakeStatus(self.master)
+        self.seen = [[], []]
+        for seen in self.seen:
+            self.poller.subscribe(seen.append)
+        self.poller.startService()
+        self.addCleanup(self.poller.stopService)
+        # The first poll happens when the poller starts.
+        self.queries.pop().callback([])
+
+    def test_shared_query(self):
+        """
+        Each poll makes one query, whose result is passed to every
+        subscriber.
+        """
+        self.clock.advance(30)
+        self.queries.pop().callback([
+            {'buildername': 'omnibus'}, {'buildername': 'omnibus'},
+            {'buildername': 'osx'},
+        ])
+        self.assertEqual(
+            ([], [{'omnibus': 2, 'osx': 1}] * 2, [self.slaves[:2]] * 2),
+            (self.queries,
+             [seen[-1].counts for seen in self.seen],
+             [seen[-1].slaves['omnibus'] for seen in self.seen]))
+
+    def test_submitted_together(self):
+        """
+        Requests submitted together are seen by a single poll, shortly after
+        they are submitted.
+        """
+        self.master.submit('omnibus')
+        self.master.submit('docs')
+        self.clock.advance(1)
+        self.assertEqual(1, len(self.queries))
+
+    def test_submitted_elsewhere(self):
+        """
+        Requests submitted for builders which no on-demand slave is allocated
+        to don't trigger a poll.
+        """
+        self.master.submit('osx')
+        self.clock.advance(1)
+        self.assertEqual([], self.queries)
+
+    def test_submitted_while_polling(self):
+        """
+        If a poll is requested while a query is in progress, another query is
+        made once it finishes.
+        """
+        self.clock.advance(30)
+        self.master.submit('omnibus')
+        self.clock.advance(1)
+        self.queries.pop().callback([])
+        self.clock.advance(0)
+        self.assertEqual(1, len(self.queries))
+
+    def test_unsubscribe(self):
+        """
+        Unsubscribed callbacks are no longer called.
+        """
+        self.poller.unsubscribe(self.seen[0].append)
+        self.clock.advance(30)
+        self.queries.pop().callback([])
+        self.assertEqual([1, 2], [len(seen) for seen in self.seen])
+
+    def test_query_failed(self):
+        """
+        If a query fails, the failure is logged and later polls still
+        happen, including one requested while the query was in progress.
+        """
+        self.clock.advance(30)
+        self.master.submit('omnibus')
+        self.clock.advance(1)
+        self.queries.pop().errback(Failure(RuntimeError("database gone")))
+        self.clock.advance(0)
+        self.queries.pop().callback([{'buildername': 'omnibus'}])
+        self.clock.advance(30)
+        self.queries.pop().callback([{'buildername': 'docs'}])
+        self.assertEqual(
+            (1, [{'omnibus': 1}, {'docs': 1}]),
+            (len(self.flushLoggedErrors(RuntimeError)),
+             [pending.counts for pending in self.seen[0][-2:]]))
@@ -0,0 +1,158 @@
+"""
+Tests for ``flocker_bb.priority``.
+"""
+from prometheus_client import REGISTRY
+
+from twisted.internet.defer import succeed
+from twisted.internet.task import Clock
+from twisted.trial.unittest import SynchronousTestCase
+
+from flocker_bb.priority import RequestPriority, requestBranchType
+from flocker_bb.steps import BranchType
+
+
+class FakeSourceStamp(object):
+    def __init__(self, branch):
+        self.branch = branch
+
+
+class FakeBuildRequest(object):
+    def __init__(self, branch, submittedAt, **sources):
+        self.sources = dict(
+            {'flocker': FakeSourceStamp(branch)},
+            **{codebase: FakeSourceStamp(other)
+               for codebase, other in sources.items()})
+        self.submittedAt = submittedAt
+
+
+class FakeBuildRequests(object):
+    def __init__(self, requests):
+        self.requests = requests
+
+    def getBuildRequests(self, buildername, claimed):
+        return succeed([
+            {'buildername': buildername, 'request': request}
+            for request in self.requests.get(buildername, [])])
+
+
+class FakeDB(object):
+    def __init__(self, requests):
+        self.buildrequests = FakeBuildRequests(requests)
+
+
+class FakeMaster(object):
+    def __init__(self, requests):
+        self.db = FakeDB(requests)
+
+
+class FakeBuilder(object):
+    def __init__(self, name):
+        self.name = name
+
+
+class RequestBranchTypeTests(SynchronousTestCase):
+    """
+    Tests for ``requestBranchType``.
+    """
+    def test_most_important(self):
+        """
+        The most important branch type of the request's branches is used.
+        """
+        self.assertEqual(
+            BranchType.release,
+            requestBranchType(FakeBuildRequest(
+                'some-feature-FLOC-1234', 0, other='release/flocker-1.0')))
+
+    def test_no_branch(self):
+        """
+        Requests with no branch are treated as development requests.
+        """
+        self.assertEqual(
+            BranchType.development,
+            requestBranchType(FakeBuildRequest(None, 0)))
+
+
+class RequestPriorityTests(SynchronousTestCase):
+    """
+    Tests for ``RequestPriority``.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.clock.advance(10000)
+        self.priority = RequestPriority(
+            age_step=600, _reactor=self.clock,
+            _fromBrdict=lambda master, brdict: succeed(brdict['request']))
+
+    def test_none(self):
+        """
+        If there are no requests, ``None`` is chosen.
+        """
+        self.assertIs(None, self.priority.choose([]))
+
+    def test_branch_type(self):
+        """
+        Requests for more important branches are chosen first, even if they
+        were submitted later.
+        """
+        requests = [
+            FakeBuildRequest('some-feature-FLOC-1234', 9900),
+            FakeBuildRequest('release/flocker-1.0', 9950),
+            FakeBuildRequest('master', 9990),
+        ]
+        self.assertIs(requests[2], self.priority.choose(requests))
+
+    def test_submitted_order(self):
+        """
+        Requests for the same kind of branch are chosen in the order they
+        were submitted.
+        """
+        requests = [
+            FakeBuildRequest('other-FLOC-1', 9950),
+            FakeBuildRequest('some-feature-FLOC-1234', 9900),
+        ]
+        self.assertIs(requests[1], self.priority.choose(requests))
+
+    def test_starvation(self):
+        """
+        Requests are promoted for every ``age_step`` they wait, so old
+        requests are eventually chosen before newer, more important ones.
+        """
+        requests = [
+            FakeBuildRequest('master', 9990),
+            FakeBuildRequest('some-feature-FLOC-1234', 10000 - 3 * 600),
+        ]
+        self.assertIs(requests[1], self.priority.choose(requests))
+
+    def test_chosen(self):
+        """
+        The time requests waited is recorded by branch type.
+        """
+        labels = {'branch_type': 'master'}
+        before = REGISTRY.get_sample_value(
+            'buildbot_build_request_wait_seconds_sum', labels) or 0
+        self.priority.chosen([FakeBuildRequest('master', 9900)])
+        self.assertEqual(
+            before + 100,
+            REGISTRY.get_sample_value(
+                'buildbot_build_request_wait_seconds_sum', labels))
+
+    def test_prioritize_builders(self):
+        """
+        Builders are ordered by their most important pending request, and
+        builders without pending requests come last.
+        """
+        master = FakeMaster({
+            'docs': [FakeBuildRequest('some-feature-FLOC-1234', 9900)],
+            'acceptance': [
+                FakeBuildRequest('some-feature-FLOC-1234', 9000),
+                FakeBuildRequest('master', 9990),
+            ],
+            'storage': [FakeBuildRequest('release/flocker-1.0', 9900)],
+        })
+        builders = [
+            FakeBuilder(name)
+            for name in ['idle', 'docs', 'storage', 'acceptance']]
+        self.assertEqual(
+            ['acceptance', 'storage', 'docs', 'idle'],
+            [builder.name for builder in self.successResultOf(
+                self.priority.prioritizeBuilders(master, builders))])
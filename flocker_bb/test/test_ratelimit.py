@@ -0,0 +1,118 @@
+"""
+Tests for ``flocker_bb.ratelimit``.
+"""
+from twisted.trial.unittest import SynchronousTestCase
+
+from flocker_bb.ratelimit import RateLimiter, TokenBucket, call_type
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenBucketTests(SynchronousTestCase):
+    """
+    Tests for ``TokenBucket``.
+    """
+    def setUp(self):
+        self.clock = FakeClock()
+        self.bucket = TokenBucket(rate=2, burst=2, clock=self.clock)
+
+    def test_burst(self):
+        """
+        Up to ``burst`` tokens are available at once.
+        """
+        delays = []
+        for _ in range(3):
+            delays.append(self.bucket.delay())
+            if delays[-1] == 0:
+                self.bucket.take()
+        self.assertEqual([0, 0, 0.5], delays)
+
+    def test_refill(self):
+        """
+        Tokens are replaced at ``rate`` per second, up to ``burst``.
+        """
+        self.bucket.take()
+        self.bucket.take()
+        self.clock.now = 10
+        self.assertEqual(0, self.bucket.delay())
+        self.bucket.take()
+        self.bucket.take()
+        self.assertEqual(0.5, self.bucket.delay())
+
+
+class RateLimiterTests(SynchronousTestCase):
+    """
+    Tests for ``RateLimiter``.
+    """
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = RateLimiter(
+            'fake',
+            budgets={'create': (1, 1), 'destroy': (1, 1), None: (1, 1)},
+            total=(2, 2),
+            clock=self.clock,
+        )
+
+    def queue(self, call_type, priority):
+        entry = (priority, len(self.limiter._waiting), call_type)
+        self.limiter._waiting.append(entry)
+        return entry
+
+    def test_acquire(self):
+        """
+        ``RateLimiter.acquire`` returns immediately while tokens are
+        available.
+        """
+        self.limiter.acquire('create')
+        self.limiter.acquire('destroy')
+        self.assertEqual([], self.limiter._waiting)
+
+    def test_call_type_budget(self):
+        """
+        A call waits for its own call type's budget.
+        """
+        self.limiter.acquire('create')
+        self.assertEqual(1, self.limiter._try(self.queue('create', 2)))
+
+    def test_total_budget(self):
+        """
+        A call waits for the budget shared by every call type.
+        """
+        self.limiter.acquire('create')
+        self.limiter.acquire('destroy')
+        self.assertEqual(0.5, self.limiter._try(self.queue(None, 1)))
+
+    def test_priority(self):
+        """
+        A queued call waits for higher priority calls which can go.
+        """
+        destroy = self.queue('destroy', 0)
+        create = self.queue('create', 2)
+        self.assertEqual(
+            (None, 0, 0),
+            (self.limiter._try(create), self.limiter._try(destroy),
+             self.limiter._try(create)))
+
+    def test_blocked_priority(self):
+        """
+        A higher priority call waiting for its own call type's budget doesn't
+        hold up calls of other types.
+        """
+        self.limiter.acquire('destroy')
+        self.queue('destroy', 0)
+        self.assertEqual(0, self.limiter._try(self.queue('create', 2)))
+
+    def test_call_types(self):
+        """
+        libcloud methods are mapped to call types.
+        """
+        self.assertEqual(
+            ['create', 'destroy', 'list_images', None],
+            map(call_type,
+                ['create_node', 'destroy_node', 'list_images', 'list_nodes']))
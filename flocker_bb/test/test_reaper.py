@@ -0,0 +1,104 @@
+"""
+Tests for ``flocker_bb.reaper``.
+"""
+from datetime import datetime
+
+from twisted.internet.defer import maybeDeferred
+from twisted.internet.task import Clock
+from twisted.trial.unittest import SynchronousTestCase
+
+from flocker_bb.reaper import OrphanReaper
+from flocker_bb.test.fakes import (
+    FakeBooter, FakeBotMaster, FakeMaster, FakeSlave)
+
+
+class FakeNode(object):
+    def __init__(self, id, created_at=None):
+        self.id = id
+        self.created_at = created_at
+
+
+class FakePooledDriver(object):
+    provider = 'fake'
+
+
+class FakeCloudDriver(object):
+    """
+    An ``ICloudDriver`` for an account with the given nodes.
+    """
+    region = 'region'
+
+    def __init__(self, driver, nodes, calls):
+        self.driver = driver
+        self.nodes = nodes
+        self.calls = calls
+        self.instance_tags = {'Buildmaster': 'build.example.com'}
+
+    def list_buildmaster_instances(self):
+        self.calls.append('list')
+        return list(self.nodes)
+
+    def destroy_instances(self, nodes):
+        self.calls.append(('destroy', [node.id for node in nodes]))
+
+
+class OrphanReaperTests(SynchronousTestCase):
+    """
+    Tests for ``OrphanReaper``.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.clock.advance(3600)
+        self.calls = []
+        self.nodes = [
+            FakeNode('i-live', datetime(1970, 1, 1)),
+            FakeNode('i-old', datetime(1970, 1, 1)),
+            FakeNode('i-new', datetime(1970, 1, 1, 0, 45)),
+            FakeNode('i-unknown-age'),
+        ]
+        pooled = FakePooledDriver()
+        drivers = [
+            FakeCloudDriver(pooled, self.nodes, self.calls) for _ in range(3)]
+        self.reaper = OrphanReaper(
+            grace=30 * 60, _reactor=self.clock,
+            _deferToThread=maybeDeferred)
+        self.reaper.master = FakeMaster(FakeBotMaster([
+            FakeSlave('aws/centos-7/0', instance_booter=FakeBooter(
+                driver=drivers[0], node=self.nodes[0])),
+            FakeSlave('aws/centos-7/1', instance_booter=FakeBooter(
+                driver=drivers[1])),
+            FakeSlave('aws/centos-7/2', instance_booter=FakeBooter(
+                driver=drivers[2])),
+            FakeSlave('osx/0', on_demand=False),
+        ]))
+
+    def test_reap(self):
+        """
+        One listing is made for slaves sharing an account, and orphans older
+        than the grace period are destroyed in one call.
+        """
+        self.successResultOf(self.reaper.check())
+        self.assertEqual(['list', ('destroy', ['i-old'])], self.calls)
+
+    def test_unknown_age(self):
+        """
+        Nodes without a creation time are destroyed once they've been seen
+        for the grace period.
+        """
+        self.reaper.check()
+        self.clock.advance(30 * 60)
+        self.nodes.remove(self.nodes[1])
+        del self.calls[:]
+        self.successResultOf(self.reaper.check())
+        self.assertEqual(
+            ['list', ('destroy', ['i-new', 'i-unknown-age'])], self.calls)
+
+    def test_reconciling(self):
+        """
+        Nothing is destroyed while slaves are still looking for nodes to
+        adopt.
+        """
+        slaves = self.reaper.master.botmaster.slaves
+        slaves['aws/centos-7/1'].reconciling = object()
+        self.successResultOf(self.reaper.check())
+        self.assertEqual([], self.calls)
@@ -1,13 +1,29 @@
-from twisted.trial.unittest import TestCase
+import subprocess
+import sys
+
+from prometheus_client import REGISTRY
+
+from twisted.python.filepath import FilePath
+from twisted.trial.unittest import SynchronousTestCase, TestCase
 from buildbot.test.util import sourcesteps
-from buildbot.status.results import SUCCESS
+from buildbot.status.results import FAILURE, SUCCESS
 from buildbot.test.fake.remotecommand import ExpectShell
 
 from ..steps import (
     BranchType,
+    BusyCounts,
     MergeForward,
+    VIRTUALENV_CACHE_SCRIPT,
     getBranchType,
+    WorkspaceLocality,
+    WorkspaceLocalityRecorder,
+    buildVirtualEnv,
+    idleSlave,
+    localSlave,
+    recordVirtualEnv,
+    virtualenvCacheProperties,
 )
+from .fakes import FakeBuilder, FakeSlave
 
 
 COMMIT_HASH = "deadbeef00000000000000000000000000000000"
@@ -207,3 +223,284 @@ class VersionTests(TestCase):
             self.assertTrue(MergeForward._isRelease(version))
         for version in non_releases:
             self.assertFalse(MergeForward._isRelease(version))
+
+
+class VirtualEnvCacheTests(SynchronousTestCase):
+    """
+    Tests for ``VIRTUALENV_CACHE_SCRIPT`` and ``virtualenvCacheProperties``.
+    """
+    def setUp(self):
+        self.checkout = FilePath(self.mktemp())
+        self.checkout.makedirs()
+        self.checkout.child('setup.py').setContent('setup()\n')
+        self.checkout.child('requirements.txt').setContent('Twisted\n')
+        self.venv = FilePath(self.mktemp())
+        self.venv.makedirs()
+
+    def check(self):
+        output = subprocess.check_output(
+            [sys.executable, '-c', VIRTUALENV_CACHE_SCRIPT, self.venv.path],
+            cwd=self.checkout.path)
+        return virtualenvCacheProperties(0, output, '')
+
+    def test_miss(self):
+        """
+        A virtualenv which wasn't recorded is a miss.
+        """
+        self.assertEqual('miss', self.check()['virtualenv-cache'])
+
+    def test_hit(self):
+        """
+        A virtualenv recorded with the same key is a hit.
+        """
+        key = self.check()['virtualenv-key']
+        self.venv.child('.cache-key').setContent(key)
+        self.assertEqual(
+            {'virtualenv-key': key, 'virtualenv-cache': 'hit'}, self.check())
+
+    def test_requirements_changed(self):
+        """
+        Changing a requirements file changes the key, so the recorded
+        virtualenv is a miss.
+        """
+        key = self.check()['virtualenv-key']
+        self.venv.child('.cache-key').setContent(key)
+        self.checkout.child('dev-requirements.txt').setContent('flake8\n')
+        properties = self.check()
+        self.assertEqual(
+            ('miss', True),
+            (properties['virtualenv-cache'],
+             properties['virtualenv-key'] != key))
+
+    def test_failed(self):
+        """
+        If the check fails, no properties are set, so the virtualenv is
+        rebuilt.
+        """
+        self.assertEqual({}, virtualenvCacheProperties(1, '', 'Traceback'))
+
+    def build(self, result):
+        """
+        Run the cache steps of a build whose install steps end with
+        ``result``, returning whether the virtualenv cache was hit.
+        """
+        build = FakeBuild(self.check())
+        [forget] = [step for step in buildVirtualEnv(sys.executable,
+                                                     cached=True)
+                    if step.name == 'forget-virtualenv']
+        forget.build = build
+        if forget.doStepIf(forget) and self.venv.child('.cache-key').exists():
+            self.venv.child('.cache-key').remove()
+        build.result = result
+        record = recordVirtualEnv()
+        record.build = build
+        if record.doStepIf(record):
+            self.venv.child('.cache-key').setContent(
+                build.getProperty('virtualenv-key'))
+        return build.getProperty('virtualenv-cache')
+
+    def test_failed_install(self):
+        """
+        If installing into a rebuilt virtualenv fails, the next build
+        doesn't reuse it, even with the requirements it was last recorded
+        for.
+        """
+        requirements = self.checkout.child('requirements.txt')
+        original = requirements.getContent()
+        self.build(SUCCESS)
+        requirements.setContent('Twisted==99\n')
+        self.build(FAILURE)
+        requirements.setContent(original)
+        self.assertEqual(
+            ['miss', 'hit'], [self.build(SUCCESS), self.build(SUCCESS)])
+
+
+class FakeBuild(object):
+    def __init__(self, properties):
+        self.properties = properties
+        self.result = SUCCESS
+
+    def getProperty(self, name):
+        return self.properties.get(name)
+
+
+class FakeSlaveBuilder(object):
+    def __init__(self, slavename):
+        self.slave = FakeSlave(slavename)
+
+
+class IdleSlaveTests(SynchronousTestCase):
+    """
+    Tests for ``idleSlave``.
+    """
+    def setUp(self):
+        self.counts = BusyCounts()
+        self.slavebuilders = [
+            FakeSlaveBuilder('slave-%d' % (i,)) for i in range(3)]
+
+    def test_no_slaves(self):
+        """
+        If there are no slaves to choose from, ``None`` is returned.
+        """
+        self.assertIs(None, idleSlave(None, [], busy_counts=self.counts))
+
+    def test_least_busy(self):
+        """
+        A slave with the fewest running builds is chosen, including slaves
+        with no running builds.
+        """
+        self.counts.started('slave-0')
+        self.counts.started('slave-0')
+        self.counts.started('slave-1')
+        self.counts.started('slave-2')
+        self.counts.finished('slave-2')
+        self.assertIs(
+            self.slavebuilders[2],
+            idleSlave(None, self.slavebuilders, busy_counts=self.counts))
+
+    def test_finished(self):
+        """
+        Finished builds are no longer counted, and extra finishes don't make
+        counts negative.
+        """
+        self.counts.started('slave-0')
+        self.counts.finished('slave-0')
+        self.counts.finished('slave-0')
+        self.assertEqual(0, self.counts.count('slave-0'))
+
+
+class FakeSourceStamp(object):
+    def __init__(self, branch):
+        self.branch = branch
+
+
+class FakeBuildRequest(object):
+    def __init__(self, branch):
+        self.sources = {'flocker': FakeSourceStamp(branch)}
+
+
+class LocalSlaveTests(SynchronousTestCase):
+    """
+    Tests for ``localSlave``.
+    """
+    def setUp(self):
+        self.counts = BusyCounts()
+        self.locality = WorkspaceLocality(tolerance=1)
+        self.builder = FakeBuilder('flocker-omnibus-centos-7')
+        self.slavebuilders = [
+            FakeSlaveBuilder('slave-%d' % (i,)) for i in range(3)]
+
+    def choose(self, branch, builder=None):
+        return localSlave(
+            builder or self.builder, self.slavebuilders,
+            request=FakeBuildRequest(branch),
+            locality=self.locality, busy_counts=self.counts)
+
+    def start(self, branch, builder=None):
+        """
+        Choose a slave for a build of ``branch``, and start the build on it.
+        """
+        builder = builder or self.builder
+        chosen = self.choose(branch, builder)
+        self.locality.started(
+            builder.name, chosen.slave.slavename, (('flocker', branch),))
+        self.counts.started(chosen.slave.slavename)
+        return chosen
+
+    def test_same_branch(self):
+        """
+        A slave which recently ran a build of the same branch for the builder
+        is chosen, if it isn't busier than the tolerance allows.
+        """
+        first = self.start('master')
+        self.assertIs(first, self.choose('master'))
+
+    def test_too_busy(self):
+        """
+        A slave which recently ran a build of the same branch isn't chosen if
+        it is busier than the tolerance allows.
+        """
+        first = self.start('master')
+        self.counts.started(first.slave.slavename)
+        self.assertIsNot(first, self.choose('master'))
+
+    def test_other_branch(self):
+        """
+        Builds of other branches, or for other builders, go to one of the
+        least busy slaves.
+        """
+        first = self.start('master')
+        self.assertNotIn(
+            first,
+            [self.choose('other'),
+             self.choose('master', FakeBuilder('flocker-omnibus-ubuntu'))])
+
+    def test_not_started(self):
+        """
+        Slaves chosen for builds which don't start aren't remembered.
+        """
+        chosen = self.choose('master')
+        self.counts.started(chosen.slave.slavename)
+        self.assertIsNot(chosen, self.choose('master'))
+
+    def test_counted_on_start(self):
+        """
+        Whether the slave had a workspace for the branch is counted when the
+        build starts, once per build.
+        """
+        labels = {'builder': self.builder.name, 'result': 'hit'}
+        before = REGISTRY.get_sample_value(
+            'buildbot_workspace_locality_choices_total', labels) or 0
+        first = self.start('master')
+        self.counts.finished(first.slave.slavename)
+        for _ in range(3):
+            self.choose('master')
+        self.start('master')
+        self.assertEqual(
+            before + 1,
+            REGISTRY.get_sample_value(
+                'buildbot_workspace_locality_choices_total', labels))
+
+
+class FakeStepSourceStamp(object):
+    def __init__(self, codebase, branch):
+        self.codebase = codebase
+        self.branch = branch
+
+
+class FakeBuildStatus(object):
+    def __init__(self, slavename, branch):
+        self.slavename = slavename
+        self.branch = branch
+
+    def getSlavename(self):
+        return self.slavename
+
+    def getSourceStamps(self):
+        return [FakeStepSourceStamp('flocker', self.branch)]
+
+
+class FakeLocality(object):
+    def __init__(self):
+        self.started_builds = []
+
+    def started(self, builderName, slavename, branches):
+        self.started_builds.append((builderName, slavename, branches))
+
+
+class WorkspaceLocalityRecorderTests(SynchronousTestCase):
+    """
+    Tests for ``WorkspaceLocalityRecorder``.
+    """
+    def test_build_started(self):
+        """
+        Started builds are passed to the ``WorkspaceLocality`` with their
+        slave and branches.
+        """
+        locality = FakeLocality()
+        recorder = WorkspaceLocalityRecorder(locality)
+        recorder.buildStarted(
+            'flocker-omnibus', FakeBuildStatus('slave-0', 'master'))
+        self.assertEqual(
+            [('flocker-omnibus', 'slave-0', (('flocker', 'master'),))],
+            locality.started_builds)
@@ -0,0 +1,82 @@
+"""
+Tests for ``flocker_bb.threadpool``.
+"""
+from prometheus_client import REGISTRY
+
+from twisted.internet import reactor
+from twisted.trial.unittest import SynchronousTestCase, TestCase
+
+from flocker_bb.threadpool import CloudThreadPool
+
+
+def sample(name, pool, **labels):
+    labels['pool'] = pool
+    return REGISTRY.get_sample_value('buildbot_' + name, labels) or 0
+
+
+class FakeReactor(object):
+    def __init__(self):
+        self.triggers = []
+
+    def addSystemEventTrigger(self, phase, event, f):
+        self.triggers.append((phase, event, f))
+
+
+class TimedTests(SynchronousTestCase):
+    """
+    Tests for the metrics recorded by ``CloudThreadPool``.
+    """
+    def setUp(self):
+        self.now = 0
+        self.pool = CloudThreadPool(
+            name='test-timed', _reactor=FakeReactor(),
+            _clock=lambda: self.now)
+
+    def test_timed(self):
+        """
+        The duration of each call is recorded, and the call is counted as
+        active while it runs and not queued.
+        """
+        def create_node():
+            active.append(sample('cloud_threadpool_active_threads',
+                                 'test-timed'))
+            self.now += 5
+            return "node"
+
+        active = []
+        self.pool.queue_length.labels('test-timed').inc()
+        result = self.pool._timed(create_node)
+        self.assertEqual(
+            ("node", [1], 0, 0, 5),
+            (result, active,
+             sample('cloud_threadpool_active_threads', 'test-timed'),
+             sample('cloud_threadpool_queue_length', 'test-timed'),
+             sample('cloud_threadpool_call_duration_seconds_sum',
+                    'test-timed', call='create_node')))
+
+    def test_lazy(self):
+        """
+        The pool isn't started until it is used, and is stopped when the
+        reactor shuts down.
+        """
+        self.assertIdentical(None, self.pool._pool)
+        pool = self.pool._start()
+        self.addCleanup(pool.stop)
+        self.assertEqual(
+            [('during', 'shutdown', pool.stop)],
+            self.pool._reactor.triggers)
+
+
+class DeferToThreadTests(TestCase):
+    """
+    Tests for ``CloudThreadPool.deferToThread``.
+    """
+    def test_result(self):
+        """
+        ``CloudThreadPool.deferToThread`` fires with the result of the call.
+        """
+        pool = CloudThreadPool(name='test-defer', _reactor=reactor)
+        self.addCleanup(lambda: pool._pool.stop())
+        d = pool.deferToThread(lambda x: x * 2, 21)
+        d.addCallback(self.assertEqual, 42)
+        return d
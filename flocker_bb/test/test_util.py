@@ -1,9 +1,10 @@
 from buildbot.sourcestamp import SourceStamp
 from buildbot.status.build import BuildStatus
 from buildbot.status.builder import BuilderStatus
-from twisted.trial.unittest import TestCase
+from twisted.internet.task import Clock
+from twisted.trial.unittest import SynchronousTestCase, TestCase
 
-from flocker_bb.util import getBranch
+from flocker_bb.util import getBranch, retryDeferred
 
 
 class TestGetBranch(TestCase):
@@ -43,3 +44,53 @@ class TestGetBranch(TestCase):
         """
         status = self.makeBuildStatus([])
         self.assertRaises(ValueError, getBranch, status)
+
+
+class Flaky(object):
+    """
+    A function which fails with the given exceptions, then succeeds.
+    """
+    def __init__(self, exceptions):
+        self.exceptions = list(exceptions)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.exceptions:
+            raise self.exceptions.pop(0)
+        return "result"
+
+
+class RetryDeferredTests(SynchronousTestCase):
+    """
+    Tests for ``retryDeferred``.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.logged = []
+
+    def retry(self, call):
+        return retryDeferred(
+            self.clock, call, KeyError, delay=1, backoff=2, maxDelay=3,
+            log=lambda failure, delay: self.logged.append(delay))
+
+    def test_backoff(self):
+        """
+        The delay between attempts grows by ``backoff``, up to ``maxDelay``.
+        """
+        d = self.retry(Flaky([KeyError()] * 4))
+        self.clock.pump([1, 2, 3])
+        self.assertNoResult(d)
+        self.clock.advance(3)
+        self.assertEqual(
+            ("result", [1, 2, 3, 3]), (self.successResultOf(d), self.logged))
+
+    def test_other_exception(self):
+        """
+        Other exceptions aren't retried.
+        """
+        flaky = Flaky([KeyError(), ValueError()])
+        d = self.retry(flaky)
+        self.clock.advance(1)
+        self.failureResultOf(d, ValueError)
+        self.assertEqual(2, flaky.calls)
@@ -0,0 +1,121 @@
+"""
+Tests for ``flocker_bb.warm_pool``.
+"""
+from datetime import datetime
+
+from twisted.internet.task import Clock
+from twisted.trial.unittest import SynchronousTestCase
+
+from flocker_bb.ec2 import State
+from flocker_bb.warm_pool import (
+    WarmPool, WarmPoolConfiguration, WarmPoolPeriod)
+from flocker_bb.test.fakes import FakeBotMaster, FakeMaster, FakeSlave
+
+
+def make_pool(slaves, configuration, clock):
+    pool = WarmPool({'aws/ubuntu-14.04': configuration}, _reactor=clock)
+    pool.master = FakeMaster(FakeBotMaster(slaves))
+    return pool
+
+
+class WarmPoolConfigurationTests(SynchronousTestCase):
+    """
+    Tests for ``WarmPoolConfiguration``.
+    """
+    def setUp(self):
+        self.configuration = WarmPoolConfiguration.from_config({
+            'minimum': 1,
+            'schedule': [
+                {'hours': [8, 20], 'weekdays': [0, 1, 2, 3, 4], 'minimum': 3},
+                {'hours': [22, 2], 'minimum': 0},
+            ],
+        })
+
+    def test_scheduled(self):
+        """
+        During a scheduled period, its minimum is used.
+        """
+        # A Wednesday.
+        self.assertEqual(
+            3, self.configuration.minimum_at(datetime(2016, 3, 2, 9)))
+
+    def test_weekend(self):
+        """
+        A period restricted to weekdays doesn't apply at the weekend.
+        """
+        # A Sunday.
+        self.assertEqual(
+            1, self.configuration.minimum_at(datetime(2016, 3, 6, 9)))
+
+    def test_midnight(self):
+        """
+        A period can span midnight.
+        """
+        self.assertEqual(
+            [0, 0, 1],
+            [self.configuration.minimum_at(datetime(2016, 3, 2, hour))
+             for hour in [23, 1, 3]])
+
+    def test_period_includes(self):
+        """
+        ``WarmPoolPeriod.includes`` excludes the end hour.
+        """
+        period = WarmPoolPeriod(start_hour=8, end_hour=20, minimum=1)
+        self.assertEqual(
+            [False, True, False],
+            [period.includes(datetime(2016, 3, 2, hour))
+             for hour in [7, 8, 20]])
+
+
+class WarmPoolTests(SynchronousTestCase):
+    """
+    Tests for ``WarmPool``.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.slaves = [
+            FakeSlave('aws/ubuntu-14.04/%d' % (i,), 'aws/ubuntu-14.04')
+            for i in range(4)
+        ]
+        self.other = FakeSlave('aws/centos-7/0', 'aws/centos-7')
+        self.pool = make_pool(
+            self.slaves + [self.other], WarmPoolConfiguration(minimum=2),
+            self.clock)
+
+    def test_starts_missing(self):
+        """
+        ``WarmPool.check`` starts enough stopped slaves to reach the minimum.
+        """
+        self.slaves[0].instance_booter.state = State.ACTIVE
+        self.pool.check()
+        self.assertEqual(
+            [[], ['warm'], [], [], []],
+            [slave.started for slave in self.slaves + [self.other]])
+
+    def test_busy_not_counted(self):
+        """
+        Slaves which are running builds don't count towards the minimum.
+        """
+        self.slaves[0].instance_booter.state = State.ACTIVE
+        self.slaves[0].building.add('flocker-omnibus-centos-7')
+        self.pool.check()
+        self.assertEqual(
+            [[], ['warm'], ['warm'], []],
+            [slave.started for slave in self.slaves])
+
+    def test_keep_warm(self):
+        """
+        An idle slave is kept running if stopping it would leave the pool
+        below its minimum, and stopped otherwise.
+        """
+        for slave in self.slaves[:3]:
+            slave.instance_booter.state = State.ACTIVE
+        self.assertFalse(self.pool.keep_warm(self.slaves[0]))
+        self.slaves[2].instance_booter.state = State.STOPPING
+        self.assertTrue(self.pool.keep_warm(self.slaves[0]))
+
+    def test_other_class(self):
+        """
+        Slaves of classes without a pool are never kept running.
+        """
+        self.assertFalse(self.pool.keep_warm(self.other))
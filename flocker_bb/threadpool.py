@@ -0,0 +1,97 @@
+"""
+A dedicated thread pool for calls to cloud providers.
+
+libcloud is synchronous, so calls to cloud providers are made in threads.
+Using the reactor's thread pool for them means a burst of node creations
+competes with buildbot's own use of that pool (such as database access), so
+they get a pool of their own.
+"""
+
+from __future__ import absolute_import
+
+import time
+
+from twisted.internet import reactor
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+
+from prometheus_client import Gauge, Histogram
+
+
+class CloudThreadPool(object):
+    """
+    A bounded thread pool, started on first use and stopped when the reactor
+    shuts down.
+
+    :ivar size: The maximum number of threads.
+    :ivar name: The name of the pool, used to label metrics.
+    """
+
+    queue_length = Gauge(
+        'cloud_threadpool_queue_length',
+        'Number of calls waiting for a thread in a cloud thread pool.',
+        labelnames=['pool'],
+        namespace='buildbot',
+    )
+
+    active_threads = Gauge(
+        'cloud_threadpool_active_threads',
+        'Number of threads making calls in a cloud thread pool.',
+        labelnames=['pool'],
+        namespace='buildbot',
+    )
+
+    call_duration = Histogram(
+        'cloud_threadpool_call_duration_seconds',
+        'Time taken by calls made in a cloud thread pool.',
+        labelnames=['pool', 'call'],
+        namespace='buildbot',
+    )
+
+    def __init__(self, size=10, name='cloud', _reactor=reactor,
+                 _clock=time.time):
+        self.size = size
+        self.name = name
+        self._reactor = _reactor
+        self._clock = _clock
+        self._pool = None
+
+    def _start(self):
+        if self._pool is None:
+            self._pool = ThreadPool(
+                minthreads=0, maxthreads=self.size, name=self.name)
+            self._pool.start()
+            self._reactor.addSystemEventTrigger(
+                'during', 'shutdown', self._pool.stop)
+        return self._pool
+
+    def _timed(self, f, *args, **kwargs):
+        """
+        Call ``f``, recording metrics about the call.
+        """
+        self.queue_length.labels(self.name).dec()
+        active = self.active_threads.labels(self.name)
+        active.inc()
+        start = self._clock()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            self.call_duration.labels(
+                self.name, getattr(f, '__name__', 'unknown'),
+            ).observe(self._clock() - start)
+            active.dec()
+
+    def deferToThread(self, f, *args, **kwargs):
+        """
+        Call ``f`` in a thread from this pool.
+
+        :return: A ``Deferred`` that fires with the result of ``f``.
+        """
+        pool = self._start()
+        self.queue_length.labels(self.name).inc()
+        return deferToThreadPool(
+            self._reactor, pool, self._timed, f, *args, **kwargs)
+
+
+cloud_threads = CloudThreadPool()
+deferToCloudThread = cloud_threads.deferToThread
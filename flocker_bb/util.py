@@ -1,3 +1,9 @@
+import random
+
+from twisted.internet.defer import maybeDeferred
+from twisted.internet.task import deferLater
+
+
 # From https://twistedmatrix.com/trac/ticket/5786
 def timeoutDeferred(reactor, deferred, seconds):
     """
@@ -32,6 +38,46 @@ def timeoutDeferred(reactor, deferred, seconds):
     return delayedTimeOutCall
 
 
+def retryDeferred(reactor, call, exceptionType, delay, backoff=1,
+                  maxDelay=None, jitter=0, log=None):
+    """
+    Call a function returning a L{Deferred} until it doesn't fail with the
+    given exception, waiting on the reactor (rather than in a thread) between
+    attempts.
+    @type reactor: L{IReactorTime}
+    @param reactor: A provider of L{twisted.internet.interfaces.IReactorTime}.
+    @param call: A no-argument callable returning a L{Deferred}.
+    @param exceptionType: The exception type which causes a retry.
+    @param delay: The number of seconds to wait before the first retry.
+    @param backoff: The factor the delay is multiplied by after each retry.
+    @param maxDelay: The largest delay, or C{None} for no limit.
+    @param jitter: The number of seconds added to each delay, or a
+        C{(min, max)} tuple to add a random number of seconds between them.
+    @param log: A two-argument callable, called with the L{Failure} and the
+        delay before each retry.
+    @return: A L{Deferred} that fires with the result of the first attempt
+        which doesn't fail with C{exceptionType}.
+    """
+    delays = [delay]
+
+    def failed(failure):
+        failure.trap(exceptionType)
+        wait = delays[-1]
+        if isinstance(jitter, tuple):
+            wait += random.uniform(*jitter)
+        else:
+            wait += jitter
+        nextDelay = delays[-1] * backoff
+        if maxDelay is not None:
+            nextDelay = min(nextDelay, maxDelay)
+        delays.append(nextDelay)
+        if log is not None:
+            log(failure, wait)
+        return deferLater(reactor, wait, call).addErrback(failed)
+
+    return maybeDeferred(call).addErrback(failed)
+
+
 def getBranch(build):
     """
     Return the branch for a given build.
@@ -0,0 +1,212 @@
+"""
+Keep a minimum number of on-demand buildslaves running, so that builds don't
+have to wait for a node to boot.
+"""
+
+from __future__ import absolute_import
+
+from datetime import datetime
+
+from characteristic import attributes, Attribute
+from twisted.application.internet import TimerService
+from twisted.internet import reactor
+from twisted.python import log
+
+from buildbot.status.base import StatusReceiverMultiService
+
+from prometheus_client import Gauge
+
+from flocker_bb.ec2 import State
+
+
+@attributes([
+    Attribute('start_hour'),
+    Attribute('end_hour'),
+    Attribute('minimum'),
+    Attribute('weekdays', default_value=None),
+])
+class WarmPoolPeriod(object):
+    """
+    A time of day during which a different number of slaves should be kept
+    running.
+
+    :ivar int start_hour: The (UTC) hour at which the period starts.
+    :ivar int end_hour: The (UTC) hour before which the period ends.  This may
+        be less than ``start_hour``, for periods spanning midnight.
+    :ivar int minimum: The number of slaves to keep running during the period.
+    :ivar weekdays: The days (0 is Monday) on which the period applies, or
+        ``None`` for every day.
+    """
+
+    def includes(self, when):
+        """
+        :param datetime when: A (UTC) time.
+        :return: Whether ``when`` is within this period.
+        """
+        if self.weekdays is not None and when.weekday() not in self.weekdays:
+            return False
+        if self.start_hour <= self.end_hour:
+            return self.start_hour <= when.hour < self.end_hour
+        return when.hour >= self.start_hour or when.hour < self.end_hour
+
+
+@attributes([
+    Attribute('minimum', default_value=0),
+    Attribute('schedule', default_factory=list),
+])
+class WarmPoolConfiguration(object):
+    """
+    How many slaves of a slave class to keep running.
+
+    :ivar int minimum: The number of slaves to keep running outside of any
+        scheduled period.
+    :ivar list schedule: ``WarmPoolPeriod``s; the first one which includes the
+        current time decides the number of slaves to keep running.
+    """
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Create a ``WarmPoolConfiguration`` from the ``warm_pool`` section of
+        a slave in ``config.yml``.
+        """
+        return cls(
+            minimum=config.get('minimum', 0),
+            schedule=[
+                WarmPoolPeriod(
+                    start_hour=period['hours'][0],
+                    end_hour=period['hours'][1],
+                    minimum=period['minimum'],
+                    weekdays=period.get('weekdays'),
+                )
+                for period in config.get('schedule', [])
+            ],
+        )
+
+    def minimum_at(self, when):
+        """
+        :param datetime when: A (UTC) time.
+        :return: The number of slaves to keep running at ``when``.
+        """
+        for period in self.schedule:
+            if period.includes(when):
+                return period.minimum
+        return self.minimum
+
+
+# The states in which an instance is running, or about to be.
+_WARM_STATES = frozenset([State.STARTING, State.ACTIVE])
+
+# The states in which an instance can be started.
+_STOPPED_STATES = frozenset([State.IDLE, State.STOPPED_RETAINED])
+
+
+class WarmPool(StatusReceiverMultiService):
+    """
+    Keep a minimum number of idle on-demand buildslaves running for each
+    configured slave class.
+
+    Idle slaves are counted as part of the pool if their instance is running
+    (or being started) and they are not running any builds.  When there are
+    fewer than the configured minimum, stopped slaves are started.  Slaves
+    which would be part of the pool are not stopped when their build wait
+    timeout expires.
+    """
+
+    target_gauge = Gauge(
+        'warm_pool_target',
+        'Number of idle slaves the warm pool tries to keep running.',
+        labelnames=['slave_class'],
+        namespace='buildbot',
+    )
+
+    idle_gauge = Gauge(
+        'warm_pool_idle',
+        'Number of idle slaves running (or starting) in the warm pool.',
+        labelnames=['slave_class'],
+        namespace='buildbot',
+    )
+
+    def __init__(self, pools, interval=60, _reactor=reactor):
+        """
+        :param dict pools: Map slave class names to
+            ``WarmPoolConfiguration``s.
+        :param interval: How often (in seconds) to check the pools.
+        """
+        StatusReceiverMultiService.__init__(self)
+        self.pools = pools
+        self._reactor = _reactor
+        timer = TimerService(interval, self.check)
+        timer.clock = _reactor
+        timer.setServiceParent(self)
+
+    def startService(self):
+        self.status = self.parent
+        self.master = self.status.master
+        StatusReceiverMultiService.startService(self)
+
+    def stopService(self):
+        for slave in self._slaves():
+            if slave.keep_warm == self.keep_warm:
+                slave.keep_warm = None
+        return StatusReceiverMultiService.stopService(self)
+
+    def _slaves(self, slave_class=None):
+        """
+        :return: The on-demand slaves belonging to a pool (or to the given
+            slave class).
+        """
+        return [
+            slave for slave in self.master.botmaster.slaves.values()
+            if getattr(slave, 'slave_class', None) in self.pools
+            and (slave_class is None or slave.slave_class == slave_class)
+        ]
+
+    def _target(self, slave_class):
+        now = datetime.utcfromtimestamp(self._reactor.seconds())
+        return self.pools[slave_class].minimum_at(now)
+
+    @staticmethod
+    def _is_warm(slave):
+        return (slave.instance_booter.state in _WARM_STATES
+                and not slave.building)
+
+    def keep_warm(self, slave):
+        """
+        Decide whether an idle slave should be kept running.
+
+        :return: ``True`` if stopping ``slave`` would leave its pool with
+            fewer idle slaves than its minimum.
+        """
+        if slave.slave_class not in self.pools:
+            return False
+        others = [
+            other for other in self._slaves(slave.slave_class)
+            if other is not slave and self._is_warm(other)
+        ]
+        return len(others) < self._target(slave.slave_class)
+
+    def check(self):
+        """
+        Start slaves in any pool with fewer idle slaves than its minimum.
+        """
+        for slave_class in self.pools:
+            slaves = self._slaves(slave_class)
+            for slave in slaves:
+                slave.keep_warm = self.keep_warm
+            target = self._target(slave_class)
+            warm = [slave for slave in slaves if self._is_warm(slave)]
+            stopped = [
+                slave for slave in slaves
+                if slave.instance_booter.state in _STOPPED_STATES
+            ]
+            to_start = stopped[:max(0, target - len(warm))]
+            for slave in to_start:
+                log.msg(
+                    format="Starting %(slave)s for the warm pool",
+                    slave=slave.slavename,
+                )
+                slave.startInstance(reason="warm")
+            self.target_gauge.labels(slave_class).set(target)
+            self.idle_gauge.labels(slave_class).set(
+                len(warm) + len(to_start))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# Copyright ClusterHQ Inc.  See LICENSE file for details.
+"""
+Measure the cost of finding the newest image for a buildslave.
+
+Compares a linear scan of every image (the way images used to be looked up)
+with ``flocker_bb.images.ImageIndex``, for an account with 5000 images.
+
+Run from the root of the repository::
+
+    python scripts/benchmarks/image_index.py
+"""
+import os
+import sys
+from timeit import repeat
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from twisted.python import log  # noqa
+
+from flocker_bb.images import ImageIndex  # noqa
+
+IMAGES = 5000
+NAMES = 25
+LOOKUPS = 100
+
+
+class FakeImage(object):
+    def __init__(self, id, tags):
+        self.id = id
+        self.tags = tags
+
+
+def get_tags(image):
+    return image.tags
+
+
+def make_images():
+    return [
+        FakeImage('ami-%d' % (i,), {
+            'base_name': 'buildslave-%d' % (i % NAMES,),
+            'timestamp': '%010d' % (i,),
+            'production': 'true' if i % 3 else 'false',
+        })
+        for i in range(IMAGES)
+    ]
+
+
+def linear_scan(images, name, tags):
+    required = dict(tags, base_name=name)
+    matching = [
+        image for image in images
+        if set(required.items()).issubset(set(get_tags(image).items()))
+    ]
+    return max(matching, key=lambda image: get_tags(image)['timestamp'])
+
+
+def main():
+    # Don't measure the cost of logging.
+    log.theLogPublisher.observers[:] = []
+    images = make_images()
+    tags = {'production': 'true'}
+    names = ['buildslave-%d' % (i % NAMES,) for i in range(LOOKUPS)]
+
+    def scan():
+        for name in names:
+            linear_scan(images, name, tags)
+
+    def build():
+        ImageIndex(images, get_tags)
+
+    index = ImageIndex(images, get_tags)
+
+    def lookup():
+        for name in names:
+            index.newest(name, tags)
+
+    def build_and_lookup():
+        fresh = ImageIndex(images, get_tags)
+        for name in names:
+            fresh.newest(name, tags)
+
+    print "%d images, %d base names, %d lookups per run" % (
+        IMAGES, NAMES, LOOKUPS)
+    for label, f in [
+        ("linear scan", scan),
+        ("build index", build),
+        ("indexed lookups (cold)", build_and_lookup),
+        ("indexed lookups (warm)", lookup),
+    ]:
+        best = min(repeat(f, number=1, repeat=5))
+        print "%-25s %9.3f ms total %9.4f ms/lookup" % (
+            label, best * 1000, best * 1000 / LOOKUPS)
+
+
+if __name__ == '__main__':
+    main()
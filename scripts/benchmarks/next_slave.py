@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# Copyright ClusterHQ Inc.  See LICENSE file for details.
+"""
+Measure the cost of choosing a slave for a build with ``idleSlave``.
+
+Compares counting the busy slavebuilders of every candidate slave (the way
+``idleSlave`` used to choose) with looking up the counts kept by
+``flocker_bb.steps.BusyCounts``, for 100 slaves with 20 builders each.
+
+Run from the root of the repository::
+
+    python scripts/benchmarks/next_slave.py
+"""
+import os
+import random
+import sys
+from collections import Counter
+from timeit import repeat
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from flocker_bb.steps import BusyCounts, idleSlave  # noqa
+
+SLAVES = 100
+BUILDERS = 20
+CHOICES = 100
+
+
+class FakeSlave(object):
+    def __init__(self, slavename):
+        self.slavename = slavename
+        self.slavebuilders = {}
+
+
+class FakeSlaveBuilder(object):
+    def __init__(self, slave, busy):
+        self.slave = slave
+        self.busy = busy
+
+    def isBusy(self):
+        return self.busy
+
+
+def make_slavebuilders(busy_counts):
+    """
+    :return: A slavebuilder for one builder on each slave, with a random
+        number of builds running on each slave.
+    """
+    candidates = []
+    for i in range(SLAVES):
+        slave = FakeSlave('slave-%d' % (i,))
+        running = random.randint(0, 3)
+        for j in range(BUILDERS):
+            slave.slavebuilders['builder-%d' % (j,)] = FakeSlaveBuilder(
+                slave, j < running)
+        for _ in range(running):
+            busy_counts.started(slave.slavename)
+        candidates.append(slave.slavebuilders['builder-%d' % (BUILDERS - 1,)])
+    return candidates
+
+
+def scanning_idle_slave(builder, slavebuilders):
+    builds = Counter([
+        slavebuilder
+        for slavebuilder in slavebuilders
+        for sb in slavebuilder.slave.slavebuilders.values()
+        if sb.isBusy()
+    ])
+    if not builds:
+        idle = slavebuilders
+    else:
+        min_builds = min(builds.values())
+        idle = [
+            slavebuilder
+            for slavebuilder in slavebuilders
+            if builds[slavebuilder] == min_builds
+        ]
+    if idle:
+        return random.choice(idle)
+
+
+def main():
+    busy_counts = BusyCounts()
+    slavebuilders = make_slavebuilders(busy_counts)
+
+    def scan():
+        for _ in range(CHOICES):
+            scanning_idle_slave(None, slavebuilders)
+
+    def counted():
+        for _ in range(CHOICES):
+            idleSlave(None, slavebuilders, busy_counts=busy_counts)
+
+    print "%d slaves, %d builders per slave, %d choices per run" % (
+        SLAVES, BUILDERS, CHOICES)
+    for label, f in [
+        ("scan slavebuilders", scan),
+        ("busy counts", counted),
+    ]:
+        best = min(repeat(f, number=1, repeat=5))
+        print "%-25s %9.3f ms total %9.4f ms/choice" % (
+            label, best * 1000, best * 1000 / CHOICES)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# Copyright ClusterHQ Inc.  See LICENSE file for details.
+"""
+Measure the cost of deciding which on-demand buildslaves care about a
+submitted build request.
+
+Compares every slave checking ``getBuildersForSlave`` (the way slaves used to
+handle ``requestSubmitted``) and indexing the slaves for every request with a
+lookup in the index ``flocker_bb.pending.PendingRequestPoller`` builds when it
+starts, for 50 slaves and 100 builders.
+
+Run from the root of the repository::
+
+    python scripts/benchmarks/request_dispatch.py
+"""
+import os
+import sys
+from timeit import repeat
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from twisted.internet.defer import Deferred  # noqa
+from twisted.internet.task import Clock  # noqa
+
+from flocker_bb.pending import PendingRequestPoller, index_slaves  # noqa
+
+SLAVES = 50
+BUILDERS = 100
+SLAVES_PER_BUILDER = 10
+REQUESTS = 100
+
+
+class FakeSlave(object):
+    def __init__(self, slavename):
+        self.slavename = slavename
+        self.instance_booter = object()
+
+
+class FakeBuilderConfig(object):
+    def __init__(self, slavenames):
+        self.slavenames = slavenames
+
+
+class FakeBuilder(object):
+    def __init__(self, name, slavenames):
+        self.name = name
+        self.config = FakeBuilderConfig(slavenames)
+
+
+class FakeBotMaster(object):
+    """
+    The parts of ``buildbot.process.botmaster.BotMaster`` used to find the
+    builders a slave is allocated to.
+    """
+    def __init__(self):
+        slavenames = ['aws/slave-%d' % (i,) for i in range(SLAVES)]
+        self.slaves = {name: FakeSlave(name) for name in slavenames}
+        self.builders = {
+            'builder-%d' % (i,): FakeBuilder('builder-%d' % (i,), [
+                slavenames[(i + j) % SLAVES]
+                for j in range(SLAVES_PER_BUILDER)
+            ])
+            for i in range(BUILDERS)
+        }
+
+    def getBuilders(self):
+        return self.builders.values()
+
+    def getBuildersForSlave(self, slavename):
+        return [b for b in self.builders.values()
+                if slavename in b.config.slavenames]
+
+
+class FakeSubscription(object):
+    def unsubscribe(self):
+        pass
+
+
+class FakeBuildRequests(object):
+    def getBuildRequests(self, claimed):
+        return Deferred()
+
+
+class FakeDB(object):
+    buildrequests = FakeBuildRequests()
+
+
+class FakeMaster(object):
+    def __init__(self, botmaster):
+        self.botmaster = botmaster
+        self.db = FakeDB()
+
+    def subscribeToBuildRequests(self, callback):
+        return FakeSubscription()
+
+
+class FakeStatus(object):
+    def __init__(self, master):
+        self.master = master
+
+
+def main():
+    botmaster = FakeBotMaster()
+    requests = [
+        {'buildername': 'builder-%d' % (i % BUILDERS,)}
+        for i in range(REQUESTS)
+    ]
+
+    def per_slave():
+        for request in requests:
+            for slave in botmaster.slaves.values():
+                builder_names = [
+                    b.name for b in
+                    botmaster.getBuildersForSlave(slave.slavename)]
+                request['buildername'] in builder_names
+
+    def index_per_request():
+        for request in requests:
+            slaves, _ = index_slaves(botmaster)
+            slaves.get(request['buildername'], [])
+
+    poller = PendingRequestPoller(_reactor=Clock())
+    poller.parent = FakeStatus(FakeMaster(botmaster))
+    poller.startService()
+
+    def indexed():
+        for request in requests:
+            poller.requestSubmitted(request)
+
+    print "%d slaves, %d builders, %d requests per run" % (
+        SLAVES, BUILDERS, REQUESTS)
+    for label, f in [
+        ("per-slave builder lists", per_slave),
+        ("index per request", index_per_request),
+        ("indexed lookup", indexed),
+    ]:
+        best = min(repeat(f, number=1, repeat=5))
+        print "%-25s %9.3f ms total %9.4f ms/request" % (
+            label, best * 1000, best * 1000 / REQUESTS)
+
+
+if __name__ == '__main__':
+    main()
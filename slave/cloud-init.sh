@@ -7,7 +7,9 @@ if [[ "%(base)s" =~ (fedora-20|centos-7)/zfs-head ]]; then
 fi
 
 # We set umask so that package builds get the right permissions. (Lintian will catch us if we get it wrong).
-buildslave create-slave --umask 022 /srv/buildslave %(buildmaster_host)s:%(buildmaster_port)d '%(name)s' '%(password)s'
+# BUILDSLAVE_NAME and BUILDSLAVE_PASSWORD are set by the buildmaster (see
+# flocker_bb.ec2.buildslave_user_data).
+buildslave create-slave --umask 022 /srv/buildslave %(buildmaster_host)s:%(buildmaster_port)d "${BUILDSLAVE_NAME}" "${BUILDSLAVE_PASSWORD}"
 
 # Set $HOME so that git has a config file to read.
 export HOME=/srv/buildslave